@@ -0,0 +1,68 @@
+""" Compares epoch time of models trained on sequences padded to MAX_SEQUENCE_LENGTH against length bucketed batches
+padded only to their longest sequence.
+
+Usage:
+    python -m benchmarks.bucketing --models LSTM Hybrid --samples 4096 --batch-size 128
+"""
+import argparse
+import os
+from argparse import Namespace
+
+import numpy as np
+import pandas as pd
+from tensorflow import keras
+from tensorflow.keras.preprocessing.text import Tokenizer
+
+from benchmarks.common import MODELS, SAMPLE_DATA_DIR, EpochTimer, model_params
+from detectors.tf_gcp.data_ops.data_generator import BucketedDataGenerator, DataGenerator
+from detectors.tf_gcp.tokenizer import FastTokenizer
+from detectors.tf_gcp.trainer import Trainer
+
+
+def epoch_time(model_type: str, generator: keras.utils.Sequence, max_sequence_length, num_features: int,
+               epochs: int) -> float:
+    """ Trains a fresh model on given generator and returns its fastest epoch time. The first epoch includes graph
+        tracing, so at least two epochs should be run
+    """
+    model = MODELS[model_type](num_features=num_features, max_sequence_length=max_sequence_length).build(
+        Namespace(**model_params(model_type)))
+    timer = EpochTimer()
+    model.fit(generator, epochs=epochs, callbacks=[timer], verbose=0)
+    return min(timer.times[1:] or timer.times)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--models', type=str, nargs='+', default=['LSTM', 'Hybrid'], help='Models to be benchmarked')
+    parser.add_argument('--samples', type=int, default=4096, help='Number of training reviews per epoch')
+    parser.add_argument('--batch-size', type=int, default=128, help='Batch size')
+    parser.add_argument('--num-buckets', type=int, default=10, help='Number of length buckets')
+    parser.add_argument('--epochs', type=int, default=2, help='Epochs per run, the fastest one is reported')
+    args = parser.parse_args()
+
+    train_df = pd.read_csv(os.path.join(SAMPLE_DATA_DIR, 'train_text.csv'))[:args.samples]
+    texts, labels = list(train_df['input']), np.array(train_df['labels'], dtype=np.uint8)
+    tokenizer = Tokenizer(num_words=Trainer.TOP_K)
+    tokenizer.fit_on_texts(texts)
+    fast_tokenizer = FastTokenizer.from_keras(tokenizer)
+    num_features = min(fast_tokenizer.word_index_size + 1, Trainer.TOP_K)
+
+    sequences = fast_tokenizer.texts_to_ragged(texts, maxlen=Trainer.MAX_SEQUENCE_LENGTH, dtype=np.uint16)
+    fixed = DataGenerator(sequences=sequences, labels=labels, batch_size=args.batch_size,
+                          max_sequence_length=Trainer.MAX_SEQUENCE_LENGTH)
+    bucketed = BucketedDataGenerator(sequences=sequences, labels=labels, batch_size=args.batch_size,
+                                     num_buckets=args.num_buckets, seed=0)
+
+    batch_lengths = [bucketed[i][0].shape[1] for i in range(len(bucketed))]
+    print(f"{len(texts)} reviews, mean batch length {np.mean(batch_lengths):.0f} with bucketing "
+          f"vs {Trainer.MAX_SEQUENCE_LENGTH} without")
+
+    for model_type in args.models:
+        fixed_time = epoch_time(model_type, fixed, Trainer.MAX_SEQUENCE_LENGTH, num_features, args.epochs)
+        bucketed_time = epoch_time(model_type, bucketed, None, num_features, args.epochs)
+        print(f"{model_type}: fixed length {fixed_time:.1f}s/epoch, bucketed {bucketed_time:.1f}s/epoch "
+              f"({fixed_time / bucketed_time:.1f}x)")
+
+
+if __name__ == '__main__':
+    main()
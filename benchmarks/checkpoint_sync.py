@@ -0,0 +1,89 @@
+""" Measures how long GCSCallback holds up training at the end of every epoch, against the callback it replaced which
+uploaded every file of the checkpoints directory on the training thread. CloudIO skips files which are already
+in the bucket, but still checks every one of them at every epoch. Epochs are simulated by writing a checkpoint
+file and sleeping for --epoch-seconds, and uploads go to a LocalBucket which adds a latency to every request and limits
+bandwidth, so results reflect round trips to Google Cloud Storage rather than local disk speed.
+
+Usage:
+    python -m benchmarks.checkpoint_sync --epochs 10 --checkpoint-size-mb 8 --keep-best 3
+"""
+import argparse
+import os
+import tempfile
+import time
+
+import numpy as np
+
+from benchmarks.common import timed
+from detectors.tf_gcp.callbacks import GCSCallback
+from detectors.tf_gcp.data_ops.io_ops import CloudIO
+from detectors.tf_gcp.data_ops.local_bucket import LocalBucket
+
+
+def upload_everything(io_operator: CloudIO, cp_path: str):
+    """ What GCSCallback used to do at the end of every epoch
+    """
+    for cp_file in os.listdir(GCSCallback.CHECKPOINT_DIR):
+        io_operator.write(os.path.join(GCSCallback.CHECKPOINT_DIR, cp_file), cp_path, use_system_cmd=False)
+
+
+def simulate(on_epoch_end, epochs: int, checkpoint_size: int, epoch_seconds: float, seed: int = 0) -> float:
+    """ Writes a checkpoint per epoch and calls on_epoch_end with a random val_loss
+    Returns:
+        Total time in seconds spent in on_epoch_end
+    """
+    rng = np.random.default_rng(seed)
+    os.makedirs(GCSCallback.CHECKPOINT_DIR, exist_ok=True)
+    stalled = 0.0
+    for epoch in range(epochs):
+        time.sleep(epoch_seconds)
+        with open(os.path.join(GCSCallback.CHECKPOINT_DIR, f"model.{epoch + 1:02d}.hdf5"), 'wb') as fstream:
+            fstream.write(rng.bytes(checkpoint_size))
+        stalled += timed(on_epoch_end, epoch, {'val_loss': rng.random()})[1]
+    return stalled
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--epochs', type=int, default=10, help='Number of simulated epochs')
+    parser.add_argument('--epoch-seconds', type=float, default=0.5, help='Duration of a simulated epoch')
+    parser.add_argument('--checkpoint-size-mb', type=float, default=8, help='Size of every checkpoint in MB')
+    parser.add_argument('--latency-ms', type=float, default=30, help='Latency added to every request')
+    parser.add_argument('--bandwidth-mbps', type=float, default=200, help='Upload bandwidth of a single stream')
+    parser.add_argument('--keep-best', type=int, default=None, help='Number of checkpoints kept in the bucket')
+    args = parser.parse_args()
+
+    checkpoint_size = int(args.checkpoint_size_mb * 2 ** 20)
+    cwd = os.getcwd()
+    with tempfile.TemporaryDirectory() as work_dir:
+        def make_io(name: str) -> CloudIO:
+            return CloudIO(bucket=LocalBucket(root=os.path.join(work_dir, name), name=name,
+                                              latency=args.latency_ms / 1000,
+                                              bandwidth=args.bandwidth_mbps * 2 ** 20 / 8))
+
+        try:
+            os.chdir(work_dir)
+            old_io = make_io('old')
+            old_stall = simulate(lambda epoch, logs: upload_everything(old_io, 'gs://old/checkpoints'), args.epochs,
+                                 checkpoint_size, args.epoch_seconds)
+            old_uploads = old_io.bucket.num_uploads
+
+            os.rename(GCSCallback.CHECKPOINT_DIR, 'old_checkpoints')
+            new_io = make_io('new')
+            callback = GCSCallback(cp_path='gs://new/checkpoints', io_operator=new_io, keep_best=args.keep_best)
+            callback.on_train_begin()
+            new_stall = simulate(callback.on_epoch_end, args.epochs, checkpoint_size, args.epoch_seconds)
+            _, flush_time = timed(callback.on_train_end)
+            assert callback.synced
+        finally:
+            os.chdir(cwd)
+
+    print(f"{args.epochs} epochs of {args.epoch_seconds}s, {args.checkpoint_size_mb:.0f}MB checkpoints, "
+          f"{args.latency_ms:.0f}ms latency, {args.bandwidth_mbps:.0f}Mbit/s per stream")
+    print(f"uploading everything every epoch: {old_stall:.2f}s of training stalled, {old_uploads} uploads")
+    print(f"GCSCallback: {new_stall:.2f}s of training stalled, {flush_time:.2f}s flushing at the end of training, "
+          f"{new_io.bucket.num_uploads} uploads including the manifest")
+
+
+if __name__ == '__main__':
+    main()
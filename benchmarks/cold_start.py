@@ -0,0 +1,79 @@
+""" Measures time from process start to first prediction, for a Predictor rebuilding the model and loading hdf5 weights
+against one loading the exported inference model. Every measurement runs in a fresh python process. Also checks that
+both give the same probabilities, and that the model type is inferred from the weights file when 'model_params' names
+the wrong one.
+
+Usage:
+    python -m benchmarks.cold_start --model Hybrid --repeats 3
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+from benchmarks.common import build_artifacts
+
+# Runs in the child process. Prints probabilities of sample test reviews once the first batch is scored
+CHILD = """
+import json, sys
+from detectors.detector import Predictor
+predictor = Predictor(config=json.load(open(sys.argv[1])))
+texts = list(predictor.test_data['input'])
+padded = predictor.tokenizer.texts_to_padded(texts, maxlen=predictor.tokenizer_details.max_sequence_length)
+print(json.dumps(predictor.model.predict_on_batch(padded)[:, 0].tolist()), flush=True)
+"""
+
+
+def start_to_first_prediction(config: dict, work_dir: str):
+    """ Starts a python process which creates a Predictor and scores one batch
+    Returns:
+        A tuple containing wall time from process start to first prediction and predicted probabilities
+    """
+    config_path = os.path.join(work_dir, 'config.json')
+    with open(config_path, 'w') as fstream:
+        json.dump(config, fstream)
+    start_time = time.perf_counter()
+    output = subprocess.run([sys.executable, '-c', CHILD, config_path], stdout=subprocess.PIPE,
+                            stderr=subprocess.DEVNULL, check=True, text=True).stdout
+    elapsed = time.perf_counter() - start_time
+    return elapsed, np.array(json.loads(output.strip().splitlines()[-1]))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--model', type=str, default='Hybrid', help="One of 'CNN', 'LSTM' and 'Hybrid'")
+    parser.add_argument('--repeats', type=int, default=3, help='Number of processes started per variant')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as work_dir:
+        config = build_artifacts(work_dir, model_type=args.model)
+        exported_config = json.loads(json.dumps(config))
+        exported_config['predict_params']['model_path'] = config['inference_model_path']
+        wrong_type_config = json.loads(json.dumps(config))
+        wrong_type_config['model_params']['model'] = 'CNN' if args.model != 'CNN' else 'LSTM'
+
+        weights_times, exported_times = [], []
+        for _ in range(args.repeats):
+            elapsed, weights_probabilities = start_to_first_prediction(config, work_dir)
+            weights_times.append(elapsed)
+            elapsed, exported_probabilities = start_to_first_prediction(exported_config, work_dir)
+            exported_times.append(elapsed)
+        assert np.allclose(weights_probabilities, exported_probabilities, atol=1e-5)
+
+        _, wrong_type_probabilities = start_to_first_prediction(wrong_type_config, work_dir)
+        assert np.allclose(weights_probabilities, wrong_type_probabilities, atol=1e-5)
+
+        print(f"{args.model}, best of {args.repeats} processes, including python and tensorflow imports")
+        print(f"rebuild + hdf5 weights: {min(weights_times):.2f}s to first prediction")
+        print(f"exported inference model: {min(exported_times):.2f}s to first prediction "
+              f"({min(weights_times) - min(exported_times):.2f}s faster)")
+        print("probabilities identical, model type inferred from weights despite wrong 'model_params'")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,94 @@
+import os
+import time
+from argparse import Namespace
+from typing import Callable, Dict
+
+import pandas as pd
+from tensorflow import keras
+from tensorflow.keras.preprocessing.text import Tokenizer
+
+from detectors.tf_gcp.models.inference_model import InferenceModel
+from detectors.tf_gcp.models.models import CNNModel, LSTMModel, HybridModel
+from detectors.tf_gcp.tokenizer import FastTokenizer
+from detectors.tf_gcp.trainer import Trainer, TokenizerDetails
+
+SAMPLE_DATA_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'sample_data')
+MODELS = {'CNN': CNNModel, 'LSTM': LSTMModel, 'Hybrid': HybridModel}
+
+
+def model_params(model_type: str) -> Dict:
+    """ Returns model parameters matching the ones in config/config.yaml for given model type
+    Args:
+        model_type (str): one of 'CNN', 'LSTM' and 'Hybrid'
+    """
+    return {'model': model_type, 'optimizer': 'adam', 'loss': 'binary_crossentropy',
+            'metrics': ['accuracy'], 'embedding_dim': 200}
+
+
+def build_artifacts(work_dir: str, model_type: str = 'CNN', epochs: int = 0) -> Dict:
+    """ Fits a tokenizer on sample train data and saves it along with model weights and the same model exported as an
+        inference model, so that Predictor can be created entirely offline. Unless 'epochs' is given the model is
+        untrained, so scores are meaningless, timings are not.
+    Args:
+        work_dir (str): directory where tokenizer and weights are to be dumped
+        model_type (str): one of 'CNN', 'LSTM' and 'Hybrid'
+        epochs (int): number of epochs the model is trained for on sample train data
+    Returns:
+        A configuration dictionary in the same format as config/config.yaml, using the weights. Path of the exported
+        inference model is added as 'inference_model_path'
+    """
+    train_df = pd.read_csv(os.path.join(SAMPLE_DATA_DIR, 'train_text.csv'))
+    tokenizer = Tokenizer(num_words=Trainer.TOP_K)
+    tokenizer.fit_on_texts(list(train_df['input']))
+
+    tokenizer_details = TokenizerDetails(tokenizer=FastTokenizer.from_keras(tokenizer), top_k=Trainer.TOP_K,
+                                         max_sequence_length=Trainer.MAX_SEQUENCE_LENGTH)
+    tokenizer_path = os.path.join(work_dir, 'tokenizer.json')
+    tokenizer_details.save(tokenizer_path)
+
+    num_features = tokenizer_details.num_features
+    model = MODELS[model_type](num_features=num_features,
+                               max_sequence_length=Trainer.MAX_SEQUENCE_LENGTH).build(
+        Namespace(**model_params(model_type)))
+    if epochs:
+        sequences = tokenizer_details.tokenizer.texts_to_padded(list(train_df['input']),
+                                                                maxlen=Trainer.MAX_SEQUENCE_LENGTH)
+        model.fit(sequences, train_df['labels'].to_numpy(), batch_size=256, epochs=epochs, verbose=0)
+    model_path = os.path.join(work_dir, f"{model_type}_{Trainer.MODEL_NAME}")
+    model.save_weights(model_path)
+    inference_model_path = os.path.join(work_dir, f"{model_type}_{Trainer.INFERENCE_MODEL_NAME}")
+    InferenceModel.export(model, inference_model_path, model_type=model_type,
+                          max_sequence_length=Trainer.MAX_SEQUENCE_LENGTH,
+                          tokenizer_fingerprint=tokenizer_details.fingerprint)
+
+    return {'model_params': model_params(model_type),
+            'predict_params': {'model_path': model_path,
+                               'tokenizer_path': tokenizer_path,
+                               'data_path': os.path.join(SAMPLE_DATA_DIR, 'test_text_100.csv'),
+                               'result_path': os.path.join(work_dir, 'results.csv')},
+            'inference_model_path': inference_model_path}
+
+
+def timed(func: Callable, *args, **kwargs):
+    """ Runs a function and measures its wall time
+    Returns:
+        A tuple containing return value of the function and time taken in seconds
+    """
+    start = time.perf_counter()
+    result = func(*args, **kwargs)
+    return result, time.perf_counter() - start
+
+
+class EpochTimer(keras.callbacks.Callback):
+    """ Records wall time of every epoch """
+
+    def __init__(self):
+        super().__init__()
+        self.times = []
+        self.start = None
+
+    def on_epoch_begin(self, epoch, logs=None):
+        self.start = time.perf_counter()
+
+    def on_epoch_end(self, epoch, logs=None):
+        self.times.append(time.perf_counter() - self.start)
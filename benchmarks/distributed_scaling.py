@@ -0,0 +1,67 @@
+""" Measures how training throughput scales with the number of local worker processes of distributed training, enabled
+by 'num_replicas' in train parameters. For every worker count, a full Trainer run trains a model on sample data
+repeated --scale times, with the tf.data input pipeline in all cases, and samples per second are taken from the fastest
+epoch the chief recorded in instrumentation.json, leaving out the first one which includes graph tracing. Every worker
+takes batches of --batch-size reviews, so a step of N workers processes N batches.
+
+Usage:
+    python -m benchmarks.distributed_scaling --model LSTM --workers 1 2 4 --steps 20
+"""
+import argparse
+import json
+import os
+import tempfile
+from typing import Dict
+
+from benchmarks.common import model_params
+from benchmarks.streaming_ingest import make_archive
+from detectors.tf_gcp.trainer import Trainer
+
+
+def samples_per_second(data_dir: str, args: argparse.Namespace, num_replicas: int) -> float:
+    """ Trains with 'num_replicas' workers in a fresh directory and returns samples per second of the fastest epoch
+    """
+    config = {'train_params': {'batch_size': args.batch_size, 'num_epochs': args.epochs, 'steps_per_epoch': args.steps,
+                               'data_dir': data_dir, 'output_dir': os.path.join(data_dir, 'output'),
+                               'input_pipeline': 'tf_data', 'num_replicas': num_replicas,
+                               'callbacks': {'CSVLogger': {'filename': 'train_logs.csv'}}},
+              'model_params': model_params(args.model)}
+    cwd = os.getcwd()
+    with tempfile.TemporaryDirectory() as run_dir:
+        os.chdir(run_dir)
+        try:
+            trainer = Trainer(config=config)
+            trainer.train()
+            with open(os.path.join(trainer.output_dir, Trainer.INSTRUMENTATION_PATH)) as fstream:
+                report = json.load(fstream)
+        finally:
+            os.chdir(cwd)
+    epochs = [stage['wall_seconds'] for stage in report['stages'] if stage['name'].startswith('epoch_')]
+    return args.steps * args.batch_size * num_replicas / min(epochs[1:] or epochs)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--model', type=str, default='LSTM', help="One of 'CNN', 'LSTM' and 'Hybrid'")
+    parser.add_argument('--workers', type=int, nargs='+', default=[1, 2, 4], help='Worker counts to be compared')
+    parser.add_argument('--scale', type=int, default=10, help='Size of train data as a multiple of sample data')
+    parser.add_argument('--batch-size', type=int, default=256, help='Batch size of every worker')
+    parser.add_argument('--steps', type=int, default=20, help='Training steps per epoch')
+    parser.add_argument('--epochs', type=int, default=3, help='Epochs per run, the fastest one is reported')
+    args = parser.parse_args()
+
+    results: Dict[int, float] = {}
+    with tempfile.TemporaryDirectory() as data_dir:
+        make_archive(os.path.join(data_dir, 'train_val.zip'), args.scale)
+        for num_replicas in args.workers:
+            results[num_replicas] = samples_per_second(data_dir, args, num_replicas)
+
+    print(f"\n{args.model} model, batch size {args.batch_size} per worker, {os.cpu_count()} cores")
+    reference = results[args.workers[0]] / args.workers[0]
+    for num_replicas, rate in results.items():
+        print(f"{num_replicas} worker(s): {rate:.1f} samples/s, {rate / (reference * num_replicas):.0%} scaling "
+              f"efficiency")
+
+
+if __name__ == '__main__':
+    main()
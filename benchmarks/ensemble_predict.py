@@ -0,0 +1,75 @@
+""" Compares scoring a test file with CNN, LSTM and Hybrid models in three separate Predictor runs, which read test data
+and tokenizer and tokenize reviews three times, against a single run scoring all of them through 'models' of
+'predict_params', with models called one after another and concurrently. Probabilities of every model are checked to
+match the ones of its separate run.
+
+Usage:
+    python -m benchmarks.ensemble_predict --rows 20000 --models CNN LSTM Hybrid
+"""
+import argparse
+import copy
+import os
+import tempfile
+
+import numpy as np
+import pandas as pd
+
+from benchmarks.common import SAMPLE_DATA_DIR, build_artifacts, timed
+from detectors.detector import Predictor
+
+
+def predict(config: dict) -> pd.DataFrame:
+    """ Creates a Predictor and runs it, like detectors.detector --predict does
+    Returns:
+        Contents of the result csv file
+    """
+    Predictor(config=config).run()
+    return pd.read_csv(config['predict_params']['result_path'])
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--rows', type=int, default=20000, help='Number of reviews in test file')
+    parser.add_argument('--models', type=str, nargs='+', default=['CNN', 'LSTM', 'Hybrid'],
+                        help="Models to be scored, among 'CNN', 'LSTM' and 'Hybrid'")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as work_dir:
+        data_path = os.path.join(work_dir, 'test.csv')
+        sample = pd.read_csv(os.path.join(SAMPLE_DATA_DIR, 'val_text.csv'))
+        pd.concat([sample] * (args.rows // len(sample) + 1)).iloc[:args.rows].to_csv(data_path, index=False)
+
+        configs = {}
+        for model_type in args.models:
+            # The tokenizer is fitted on the same data for every model, so all of them share it
+            model_dir = os.path.join(work_dir, model_type)
+            os.makedirs(model_dir)
+            config = build_artifacts(model_dir, model_type=model_type)
+            config['predict_params'].update({'model_path': config['inference_model_path'], 'data_path': data_path,
+                                             'result_path': os.path.join(work_dir, f'{model_type}_results.csv'),
+                                             'cache_size': 0})
+            configs[model_type] = config
+
+        separate, separate_time = timed(lambda: {model_type: predict(config) for model_type, config in configs.items()})
+
+        ensemble_config = copy.deepcopy(configs[args.models[0]])
+        ensemble_config['predict_params'].update({'models': [{'model_path': configs[model_type]['inference_model_path']}
+                                                             for model_type in args.models],
+                                                  'result_path': os.path.join(work_dir, 'ensemble_results.csv')})
+        timings = {}
+        for num_workers in [1, len(args.models)]:
+            ensemble_config['predict_params']['ensemble_workers'] = num_workers
+            ensemble, timings[num_workers] = timed(predict, ensemble_config)
+            for model_type, result in separate.items():
+                assert np.allclose(ensemble[f'{model_type}_probabilities'], result['probabilities'], atol=1e-6), \
+                    f"{model_type} probabilities of the ensemble differ from the ones of its separate run"
+
+    print(f"\n{args.rows} reviews, {len(args.models)} models, {os.cpu_count()} cores")
+    print(f"separate runs: {separate_time:.2f}s")
+    for num_workers, elapsed in timings.items():
+        print(f"single run, {num_workers} thread(s): {elapsed:.2f}s ({separate_time / elapsed:.2f}x faster)")
+    print("probabilities of every model match its separate run")
+
+
+if __name__ == '__main__':
+    main()
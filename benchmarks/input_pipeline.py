@@ -0,0 +1,109 @@
+""" Compares the keras Sequence generator Trainer uses by default, run on a single thread and on worker processes
+like config/config.yaml sets it up, against the tf.data pipeline selected by 'input_pipeline: tf_data', reading
+sequences from memory and from memory mapped files like the ones of the preprocessing cache. Both how fast batches are
+produced on their own and how many training steps per second a CNN model gets through with each of them are measured.
+
+Usage:
+    python -m benchmarks.input_pipeline --scale 10 --steps 50 --workers 4
+"""
+import argparse
+import os
+import tempfile
+import time
+from argparse import Namespace
+from typing import Dict, Iterable
+
+import numpy as np
+import pandas as pd
+from tensorflow.keras.preprocessing.text import Tokenizer
+
+from benchmarks.common import MODELS, SAMPLE_DATA_DIR, EpochTimer, model_params
+from detectors.tf_gcp.data_ops.data_generator import DataGenerator
+from detectors.tf_gcp.data_ops.dataset import SequenceDataset
+from detectors.tf_gcp.data_ops.sequences import RaggedSequences
+from detectors.tf_gcp.tokenizer import FastTokenizer
+from detectors.tf_gcp.trainer import Trainer
+
+
+def batches_per_second(batches: Iterable, num_batches: int) -> float:
+    """ Takes 'num_batches' batches out of an iterable and returns how many were produced per second
+    """
+    iterator = iter(batches)
+    next(iterator)
+    start = time.perf_counter()
+    for _ in range(num_batches):
+        next(iterator)
+    return num_batches / (time.perf_counter() - start)
+
+
+def steps_per_second(model_type: str, num_features: int, data, steps: int, epochs: int, fit_kwargs: Dict) -> float:
+    """ Trains a fresh model for 'epochs' epochs of 'steps' steps and returns steps per second of its fastest epoch.
+        The first epoch includes graph tracing, so at least two epochs should be run
+    """
+    model = MODELS[model_type](num_features=num_features, max_sequence_length=Trainer.MAX_SEQUENCE_LENGTH).build(
+        Namespace(**model_params(model_type)))
+    timer = EpochTimer()
+    model.fit(data, epochs=epochs, steps_per_epoch=steps, callbacks=[timer], verbose=0, **fit_kwargs)
+    return steps / min(timer.times[1:] or timer.times)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--model', type=str, default='CNN', help="One of 'CNN', 'LSTM' and 'Hybrid'")
+    parser.add_argument('--scale', type=int, default=10, help='Size of train data as a multiple of sample data')
+    parser.add_argument('--batch-size', type=int, default=256, help='Batch size')
+    parser.add_argument('--steps', type=int, default=50, help='Training steps per epoch')
+    parser.add_argument('--epochs', type=int, default=2, help='Epochs per run, the fastest one is reported')
+    parser.add_argument('--workers', type=int, default=4, help='Worker processes of the multiprocessing generator')
+    parser.add_argument('--shuffle-buffer', type=int, default=100000, help='Shuffle buffer of tf.data pipelines')
+    args = parser.parse_args()
+
+    train_df = pd.read_csv(os.path.join(SAMPLE_DATA_DIR, 'train_text.csv'))
+    texts, labels = list(train_df['input']) * args.scale, np.tile(np.array(train_df['labels'], dtype=np.uint8),
+                                                                   args.scale)
+    tokenizer = Tokenizer(num_words=Trainer.TOP_K)
+    tokenizer.fit_on_texts(texts[:len(train_df)])
+    fast_tokenizer = FastTokenizer.from_keras(tokenizer)
+    num_features = min(fast_tokenizer.word_index_size + 1, Trainer.TOP_K)
+    sequences = fast_tokenizer.texts_to_ragged(texts, maxlen=Trainer.MAX_SEQUENCE_LENGTH, dtype=np.uint16)
+
+    with tempfile.TemporaryDirectory() as work_dir:
+        # Same layout as entries of the preprocessing cache
+        for name, array in [('values', sequences.values), ('offsets', sequences.offsets), ('labels', labels)]:
+            np.save(os.path.join(work_dir, f'{name}.npy'), array)
+        mapped = {name: np.load(os.path.join(work_dir, f'{name}.npy'), mmap_mode='r')
+                  for name in ['values', 'offsets', 'labels']}
+        mapped_sequences = RaggedSequences(values=mapped['values'], offsets=mapped['offsets'])
+
+        generator = DataGenerator(sequences=sequences, labels=labels, batch_size=args.batch_size,
+                                  max_sequence_length=Trainer.MAX_SEQUENCE_LENGTH)
+
+        def dataset(source: RaggedSequences, source_labels: np.ndarray):
+            return SequenceDataset(sequences=source, labels=source_labels, batch_size=args.batch_size,
+                                   max_sequence_length=Trainer.MAX_SEQUENCE_LENGTH,
+                                   shuffle_buffer=args.shuffle_buffer, seed=0).build(repeat=True)
+
+        variants = {
+            'generator, 1 thread': (generator, {'workers': 1, 'use_multiprocessing': False}),
+            f'generator, {args.workers} processes': (generator, {'workers': args.workers,
+                                                                 'use_multiprocessing': True}),
+            'tf.data, in memory': (dataset(sequences, labels), {}),
+            'tf.data, memory mapped': (dataset(mapped_sequences, mapped['labels']), {}),
+        }
+
+        num_batches = min(len(generator) - 1, 4 * args.steps)
+        print(f"{len(texts)} reviews, batch size {args.batch_size}, {args.model} model, {os.cpu_count()} cores")
+        # Batches of the generator are numpy arrays, the ones of tf.data pipelines are already tensors
+        input_rates = {'generator': batches_per_second((generator[idx] for idx in range(len(generator))),
+                                                       num_batches)}
+        input_rates.update({name: batches_per_second(data, num_batches) for name, (data, _) in variants.items()
+                            if name.startswith('tf.data')})
+        print("batches produced on their own: " + ', '.join(f"{name} {rate:.1f}/s" for name, rate in
+                                                             input_rates.items()))
+        for name, (data, fit_kwargs) in variants.items():
+            train_rate = steps_per_second(args.model, num_features, data, args.steps, args.epochs, fit_kwargs)
+            print(f"{name}: {train_rate:.2f} training steps/s")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,52 @@
+""" Compares run times of ParallelPreprocessor against the serial path. That both give exactly the same tokenizer
+and sequences is tested in tests/test_preprocessor.py.
+
+Usage:
+    python -m benchmarks.parallel_preprocess --workers 2 4 --repeat-data 4
+"""
+import argparse
+import os
+
+import pandas as pd
+from tensorflow.keras.preprocessing.text import Tokenizer
+
+from benchmarks.common import SAMPLE_DATA_DIR, timed
+from detectors.tf_gcp.data_ops.preprocessor import ParallelPreprocessor
+from detectors.tf_gcp.tokenizer import FastTokenizer
+from detectors.tf_gcp.trainer import Trainer
+
+
+def preprocess(workers: int, texts: list):
+    """ Fits a tokenizer and converts texts to padded sequences with given number of workers
+    """
+    preprocessor = ParallelPreprocessor(workers=workers)
+    tokenizer = Tokenizer(num_words=Trainer.TOP_K)
+    _, fit_time = timed(preprocessor.fit_on_texts, tokenizer, texts)
+    padded, pad_time = timed(preprocessor.texts_to_padded, FastTokenizer.from_keras(tokenizer), texts,
+                             Trainer.MAX_SEQUENCE_LENGTH)
+    return tokenizer, padded, fit_time, pad_time
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--workers', type=int, nargs='+', default=[2, 4], help='Worker counts to be compared')
+    parser.add_argument('--repeat-data', type=int, default=1,
+                        help='Number of times sample train and val texts are repeated to enlarge the corpus')
+    args = parser.parse_args()
+
+    texts = []
+    for file_name in ['train_text.csv', 'val_text.csv']:
+        texts += list(pd.read_csv(os.path.join(SAMPLE_DATA_DIR, file_name))['input'])
+    texts = texts * args.repeat_data
+
+    _, _, fit_time, pad_time = preprocess(1, texts)
+    print(f"serial: fit {fit_time:.2f}s, texts to padded {pad_time:.2f}s on {len(texts)} texts")
+
+    for workers in args.workers:
+        _, _, parallel_fit_time, parallel_pad_time = preprocess(workers, texts)
+        print(f"{workers} workers: fit {parallel_fit_time:.2f}s ({fit_time / parallel_fit_time:.1f}x), "
+              f"texts to padded {parallel_pad_time:.2f}s ({pad_time / parallel_pad_time:.1f}x)")
+
+
+if __name__ == '__main__':
+    main()
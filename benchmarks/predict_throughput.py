@@ -0,0 +1,43 @@
+""" Compares throughput of per-row Predictor.predict against batched Predictor.predict_batch.
+
+Usage:
+    python -m benchmarks.predict_throughput --model CNN --batch-sizes 32 256 1024
+"""
+import argparse
+import tempfile
+
+import numpy as np
+
+from benchmarks.common import build_artifacts, timed
+from detectors.detector import Predictor
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--model', type=str, default='CNN', help="One of 'CNN', 'LSTM' and 'Hybrid'")
+    parser.add_argument('--batch-sizes', type=int, nargs='+', default=[32, 256, 1024],
+                        help='Batch sizes to be benchmarked')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as work_dir:
+        predictor = Predictor(config=build_artifacts(work_dir, model_type=args.model))
+        reviews = predictor.tokenizer.texts_to_padded(list(predictor.load_data()['input']),
+                                                      maxlen=predictor.tokenizer_details.max_sequence_length)
+
+        # Warm up both code paths so that graph tracing is not part of the measurement
+        predictor.predict(reviews[0])
+        predictor.predict_batch(reviews[:1])
+
+        per_row, per_row_time = timed(lambda: [predictor.predict(review) for review in reviews])
+        print(f"per-row: {len(reviews) / per_row_time:.1f} reviews/s")
+
+        for batch_size in args.batch_sizes:
+            predictor.batch_size = batch_size
+            (_, batched), batched_time = timed(predictor.predict_batch, reviews)
+            assert np.array_equal(np.array(per_row), batched), 'Batched predictions differ from per-row ones'
+            print(f"batched (batch_size={batch_size}): {len(reviews) / batched_time:.1f} reviews/s, "
+                  f"{per_row_time / batched_time:.1f}x faster")
+
+
+if __name__ == '__main__':
+    main()
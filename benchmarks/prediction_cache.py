@@ -0,0 +1,71 @@
+""" Measures Predictor.run on a test file with duplicated reviews, without a prediction cache, with an empty cache and
+with a cache persisted by the previous run, and checks that cached predictions match uncached ones.
+
+Duplicates differ in case, punctuation and spacing, like re-crawled or syndicated reviews do.
+
+Usage:
+    python -m benchmarks.prediction_cache --rows 20000 --unique 2000
+"""
+import argparse
+import os
+import tempfile
+
+import numpy as np
+import pandas as pd
+
+from benchmarks.common import SAMPLE_DATA_DIR, build_artifacts, timed
+from detectors.detector import Predictor
+
+
+def make_test_data(path: str, rows: int, unique: int, seed: int = 0):
+    """ Writes a test csv file of 'rows' reviews drawn from 'unique' distinct sample reviews
+    """
+    rng = np.random.default_rng(seed)
+    sample = pd.concat([pd.read_csv(os.path.join(SAMPLE_DATA_DIR, name))
+                        for name in ['train_text.csv', 'val_text.csv']])
+    sample = sample.iloc[:unique]
+    variants = [str.upper, str.lower, lambda text: f"  {text}!!", lambda text: text.replace(' ', '  ')]
+    picked = sample.iloc[rng.integers(0, len(sample), rows)].reset_index(drop=True)
+    picked['input'] = [variants[i % len(variants)](text) for i, text in enumerate(picked['input'])]
+    picked.to_csv(path, index=False)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--model', type=str, default='CNN', help="One of 'CNN', 'LSTM' and 'Hybrid'")
+    parser.add_argument('--rows', type=int, default=20000, help='Number of reviews in test file')
+    parser.add_argument('--unique', type=int, default=2000, help='Number of distinct reviews in test file')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as work_dir:
+        config = build_artifacts(work_dir, model_type=args.model)
+        config['predict_params']['data_path'] = os.path.join(work_dir, 'test.csv')
+        make_test_data(config['predict_params']['data_path'], args.rows, args.unique)
+
+        def run(cache_size: int, cache_path=None):
+            config['predict_params'].update({'cache_size': cache_size, 'cache_path': cache_path})
+            predictor = Predictor(config=config)
+            _, elapsed = timed(predictor.run)
+            return pd.read_csv(config['predict_params']['result_path']), elapsed, predictor.prediction_cache
+
+        cache_path = os.path.join(work_dir, 'predictions.npz')
+        uncached, uncached_time, _ = run(cache_size=0)
+        cached, cached_time, cache = run(cache_size=args.rows, cache_path=cache_path)
+        first_run = (cache.hits, cache.misses)
+        persisted, persisted_time, cache = run(cache_size=args.rows, cache_path=cache_path)
+
+        for result in [cached, persisted]:
+            assert np.allclose(result['probabilities'], uncached['probabilities'], atol=1e-5)
+            assert np.array_equal(result['predictions'], uncached['predictions'])
+
+        print(f"{args.rows} reviews, {args.unique} distinct")
+        print(f"no cache: {uncached_time:.2f}s")
+        print(f"empty cache: {cached_time:.2f}s ({uncached_time / cached_time:.1f}x), "
+              f"{first_run[0]} hits, {first_run[1]} misses")
+        print(f"persisted cache: {persisted_time:.2f}s ({uncached_time / persisted_time:.1f}x), "
+              f"{cache.hits} hits, {cache.misses} misses")
+        print("predictions identical")
+
+
+if __name__ == '__main__':
+    main()
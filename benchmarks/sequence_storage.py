@@ -0,0 +1,61 @@
+""" Compares memory taken by sequences padded to MAX_SEQUENCE_LENGTH against ragged uint16 sequences, checks that
+DataGenerator batches built from ragged sequences are identical to rows of the padded matrix, and measures time taken to
+create a batch.
+
+Usage:
+    python -m benchmarks.sequence_storage --batch-size 1024 --corpus-size 3600000
+"""
+import argparse
+import os
+
+import numpy as np
+import pandas as pd
+from tensorflow.keras.preprocessing.text import Tokenizer
+
+from benchmarks.common import SAMPLE_DATA_DIR, timed
+from detectors.tf_gcp.data_ops.data_generator import DataGenerator
+from detectors.tf_gcp.tokenizer import FastTokenizer
+from detectors.tf_gcp.trainer import Trainer
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--batch-size', type=int, default=1024, help='Batch size')
+    parser.add_argument('--corpus-size', type=int, default=3600000,
+                        help='Number of training reviews memory usage is extrapolated to')
+    args = parser.parse_args()
+
+    train_df = pd.read_csv(os.path.join(SAMPLE_DATA_DIR, 'train_text.csv'))
+    texts = list(train_df['input'])
+    labels = np.array(train_df['labels'], dtype=np.uint8)
+    tokenizer = Tokenizer(num_words=Trainer.TOP_K)
+    tokenizer.fit_on_texts(texts)
+    fast_tokenizer = FastTokenizer.from_keras(tokenizer)
+
+    padded = fast_tokenizer.texts_to_padded(texts, maxlen=Trainer.MAX_SEQUENCE_LENGTH)
+    sequences = fast_tokenizer.texts_to_ragged(texts, maxlen=Trainer.MAX_SEQUENCE_LENGTH, dtype=np.uint16)
+    generator = DataGenerator(sequences=sequences, labels=labels, batch_size=args.batch_size,
+                              max_sequence_length=Trainer.MAX_SEQUENCE_LENGTH)
+
+    for idx in range(len(generator)):
+        batch_x, batch_y = generator[idx]
+        rows = slice(idx * args.batch_size, (idx + 1) * args.batch_size)
+        assert np.array_equal(batch_x, padded[rows])
+        assert np.array_equal(batch_y[:, 0], labels[rows])
+
+    _, batch_time = min((timed(generator.__getitem__, idx % len(generator)) for idx in range(50)),
+                        key=lambda r: r[1])
+
+    padded_size = padded.nbytes + np.array(train_df['labels']).nbytes
+    ragged_size = sequences.values.nbytes + sequences.offsets.nbytes + labels.nbytes
+    scale = args.corpus_size / len(texts)
+    print(f"{len(texts)} reviews, mean sequence length {sequences.lengths.mean():.0f}")
+    print(f"padded int32: {padded_size / 1024 ** 2:.1f}MB, {padded_size * scale / 1024 ** 3:.2f}GB "
+          f"for {args.corpus_size} reviews")
+    print(f"ragged uint16: {ragged_size / 1024 ** 2:.1f}MB, {ragged_size * scale / 1024 ** 3:.2f}GB "
+          f"for {args.corpus_size} reviews ({padded_size / ragged_size:.1f}x smaller)")
+    print(f"batch of {args.batch_size} padded in {batch_time * 1000:.2f}ms, identical to padded matrix rows")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,110 @@
+""" Load generator for detectors.server. Concurrent clients keep sending review texts from the sample test data, and
+latency percentiles and throughput are reported for every batching setting. Without --url, a server is started in
+this process on untrained sample artifacts for each setting, so only timings are meaningful.
+
+Usage:
+    python -m benchmarks.serve_latency --clients 16 --requests 2000 --settings 1:0 64:2 256:5
+    python -m benchmarks.serve_latency --url http://localhost:8080/predict --clients 16
+"""
+import argparse
+import json
+import os
+import tempfile
+import threading
+import time
+import urllib.request
+from typing import List
+
+import numpy as np
+import pandas as pd
+
+from benchmarks.common import SAMPLE_DATA_DIR, build_artifacts
+from detectors.detector import Predictor
+from detectors.server import PredictionServer
+
+
+def run_load(url: str, texts: List[str], clients: int, num_requests: int, reviews_per_request: int):
+    """ Sends requests from concurrent clients and measures latency of every request
+    Returns:
+        A tuple containing latencies in seconds and total wall time
+    """
+    latencies = []
+    counter = iter(range(num_requests))
+    lock = threading.Lock()
+
+    def client():
+        while True:
+            with lock:
+                request_id = next(counter, None)
+            if request_id is None:
+                return
+            start = request_id * reviews_per_request
+            instances = [{'input': texts[(start + i) % len(texts)]} for i in range(reviews_per_request)]
+            request = urllib.request.Request(url, data=json.dumps({'instances': instances}).encode('utf-8'),
+                                             headers={'Content-Type': 'application/json'})
+            sent = time.perf_counter()
+            with urllib.request.urlopen(request) as response:
+                predictions = json.loads(response.read())['predictions']
+            latency = time.perf_counter() - sent
+            assert len(predictions) == reviews_per_request
+            with lock:
+                latencies.append(latency)
+
+    threads = [threading.Thread(target=client) for _ in range(clients)]
+    start_time = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return np.array(latencies), time.perf_counter() - start_time
+
+
+def report(name: str, latencies: np.ndarray, elapsed: float, reviews_per_request: int):
+    print(f"{name}: p50 {np.percentile(latencies, 50) * 1000:.1f}ms, p99 {np.percentile(latencies, 99) * 1000:.1f}ms, "
+          f"{len(latencies) / elapsed:.1f} requests/s, {len(latencies) * reviews_per_request / elapsed:.1f} reviews/s")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--url', type=str, default=None, help='Predict url of a running server')
+    parser.add_argument('--model', type=str, default='CNN', help="Model served when no url is given")
+    parser.add_argument('--settings', type=str, nargs='+', default=['1:0', '64:2', '256:5'],
+                        help="Batching settings as 'max_batch_size:max_wait_ms', used when no url is given")
+    parser.add_argument('--clients', type=int, default=16, help='Number of concurrent clients')
+    parser.add_argument('--requests', type=int, default=1000, help='Number of requests per run')
+    parser.add_argument('--reviews-per-request', type=int, default=1, help='Number of reviews in every request')
+    args = parser.parse_args()
+
+    texts = list(pd.read_csv(os.path.join(SAMPLE_DATA_DIR, 'test_text_100.csv'))['input'])
+
+    if args.url is not None:
+        latencies, elapsed = run_load(args.url, texts, args.clients, args.requests, args.reviews_per_request)
+        report(args.url, latencies, elapsed, args.reviews_per_request)
+        return
+
+    with tempfile.TemporaryDirectory() as work_dir:
+        predictor = Predictor(config=build_artifacts(work_dir, model_type=args.model), load_test_data=False)
+        for setting in args.settings:
+            max_batch_size, max_wait_ms = setting.split(':')
+            server = PredictionServer(predictor=predictor, host='127.0.0.1', port=0,
+                                      max_batch_size=int(max_batch_size), max_wait_ms=float(max_wait_ms))
+            thread = threading.Thread(target=server.serve_forever, daemon=True)
+            thread.start()
+            url = f"http://127.0.0.1:{server.server_address[1]}/predict"
+
+            # Warm up so that graph tracing is not part of the measurement
+            run_load(url, texts, 1, 2, args.reviews_per_request)
+            batches_before = server.batcher.num_batches
+            latencies, elapsed = run_load(url, texts, args.clients, args.requests, args.reviews_per_request)
+            num_batches = server.batcher.num_batches - batches_before
+            report(f"max_batch_size {max_batch_size}, max_wait_ms {max_wait_ms}", latencies, elapsed,
+                   args.reviews_per_request)
+            print(f"    {num_batches} model calls, {len(latencies) * args.reviews_per_request / num_batches:.1f} "
+                  f"reviews per call")
+
+            server.shutdown()
+            server.server_close()
+
+
+if __name__ == '__main__':
+    main()
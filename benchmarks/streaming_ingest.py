@@ -0,0 +1,85 @@
+""" Compares peak memory and time of Trainer preprocessing which loads train_val.zip into dataframes whole against the
+two pass streaming ingestion enabled by 'ingest_chunk_size', on a corpus made of sample data repeated --scale times.
+Every variant runs in a fresh process, and its peak resident memory is reported on top of the memory the process had
+once tensorflow was imported. Tokenizer and sequences of the variants are checked to be identical.
+
+Usage:
+    python -m benchmarks.streaming_ingest --scale 50 --chunk-sizes 10000 100000
+"""
+import argparse
+import hashlib
+import multiprocessing
+import os
+import resource
+import tempfile
+import time
+import zipfile
+from typing import Dict, Optional
+
+import pandas as pd
+
+from benchmarks.common import SAMPLE_DATA_DIR
+
+
+def make_archive(path: str, scale: int):
+    """ Creates train_val.zip from sample data repeated 'scale' times
+    """
+    with zipfile.ZipFile(path, 'w') as archive:
+        for name in ['train_text.csv.gz', 'val_text.csv.gz']:
+            data = pd.read_csv(os.path.join(SAMPLE_DATA_DIR, name.replace('.gz', '')))
+            with archive.open(name, 'w') as member:
+                pd.concat([data] * scale).to_csv(member, index=False, compression='gzip')
+
+
+def run_variant(data_dir: str, chunk_size: Optional[int], workers: int) -> Dict:
+    """ Preprocesses train data in the current process
+    Returns:
+        A dictionary containing wall time, peak resident memory on top of the one before preprocessing and a digest of
+        the outputs
+    """
+    from detectors.tf_gcp.instrumentation import current_rss
+    from detectors.tf_gcp.trainer import Trainer
+
+    trainer = Trainer({'train_params': {'data_dir': data_dir, 'output_dir': data_dir, 'ingest_chunk_size': chunk_size,
+                                        'preprocess_workers': workers},
+                       'model_params': {'model': 'CNN'}})
+    base_rss = current_rss()
+    start_time = time.perf_counter()
+    X_train, y_train, X_val, y_val = trainer.preprocess()
+    elapsed = time.perf_counter() - start_time
+
+    digest = hashlib.sha256(trainer.tokenizer_details.fingerprint.encode())
+    for array in [X_train.values, X_train.offsets, y_train, X_val.values, X_val.offsets, y_val]:
+        digest.update(array.tobytes())
+    peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+    return {'seconds': elapsed, 'peak_mb': (peak_rss - base_rss) / 2 ** 20, 'digest': digest.hexdigest(),
+            'reviews': len(y_train) + len(y_val)}
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--scale', type=int, default=50, help='Size of corpus as a multiple of sample data')
+    parser.add_argument('--chunk-sizes', type=int, nargs='+', default=[10000, 100000],
+                        help='Values of ingest_chunk_size to be compared against loading whole files')
+    parser.add_argument('--workers', type=int, default=1, help='Number of preprocessing processes')
+    args = parser.parse_args()
+
+    context = multiprocessing.get_context('spawn')
+    with tempfile.TemporaryDirectory() as work_dir:
+        make_archive(os.path.join(work_dir, 'train_val.zip'), args.scale)
+        results = {}
+        for chunk_size in [None] + args.chunk_sizes:
+            with context.Pool(processes=1) as pool:
+                results[chunk_size] = pool.apply(run_variant, (work_dir, chunk_size, args.workers))
+
+    reference = results[None]
+    print(f"\n{reference['reviews']} reviews, {args.workers} worker(s)")
+    for chunk_size, result in results.items():
+        name = 'whole files' if chunk_size is None else f"chunks of {chunk_size}"
+        assert result['digest'] == reference['digest'], f"{name} differs from loading whole files"
+        print(f"{name}: {result['seconds']:.2f}s, {result['peak_mb']:.0f}MB peak memory on top of start up")
+    print("tokenizer and sequences are identical")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,94 @@
+""" Compares reading train data from a bucket by copying train_val.zip to disk, extracting it and parsing the extracted
+files, like Trainer used to, against parsing its members while they are streamed through Storage. Objects are served by
+a LocalBucket which adds a latency to every request and limits bandwidth, so that the download takes about as long as
+parsing and the overlap of the two shows.
+
+Usage:
+    python -m benchmarks.streaming_read --scale 20 --latency-ms 30 --bandwidth-mbps 200
+"""
+import argparse
+import os
+import shutil
+import tempfile
+import zipfile
+
+import pandas as pd
+
+from benchmarks.common import SAMPLE_DATA_DIR, timed
+from detectors.tf_gcp.data_ops.local_bucket import LocalBucket
+from detectors.tf_gcp.data_ops.storage import Storage
+
+MEMBERS = ['train_text.csv.gz', 'val_text.csv.gz']
+
+
+def make_archive(path: str, scale: int):
+    """ Creates train_val.zip from sample data repeated 'scale' times
+    """
+    with zipfile.ZipFile(path, 'w') as archive:
+        for name in MEMBERS:
+            data = pd.read_csv(os.path.join(SAMPLE_DATA_DIR, name.replace('.gz', '')))
+            with archive.open(name, 'w') as member:
+                pd.concat([data] * scale).to_csv(member, index=False, compression='gzip')
+
+
+def staged_read(bucket: LocalBucket, work_dir: str) -> int:
+    """ Copies the archive with a single download, extracts it and parses the extracted files
+    Returns:
+        Number of parsed reviews
+    """
+    zip_path = os.path.join(work_dir, 'train_val.zip')
+    with open(zip_path, 'wb') as fstream:
+        fstream.write(bucket.get_blob('train_data/train_val.zip').download_as_bytes())
+    with zipfile.ZipFile(zip_path) as archive:
+        archive.extractall(work_dir)
+    num_reviews = sum(len(pd.read_csv(os.path.join(work_dir, name))) for name in MEMBERS)
+    for name in MEMBERS + ['train_val.zip']:
+        os.remove(os.path.join(work_dir, name))
+    return num_reviews
+
+
+def streamed_read(storage: Storage) -> int:
+    """ Parses members of the archive while it is streamed
+    Returns:
+        Number of parsed reviews
+    """
+    with storage.open('gs://bucket/train_data/train_val.zip') as stream, zipfile.ZipFile(stream) as archive:
+        return sum(len(pd.read_csv(archive.open(name), compression='gzip')) for name in MEMBERS)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--scale', type=int, default=20, help='Size of data as a multiple of sample data')
+    parser.add_argument('--latency-ms', type=float, default=30, help='Latency added to every request')
+    parser.add_argument('--bandwidth-mbps', type=float, default=200, help='Bandwidth of a single stream')
+    parser.add_argument('--chunk-size-mb', type=float, default=8, help='Size of ranged requests of Storage')
+    parser.add_argument('--repeats', type=int, default=3, help='Number of runs, best one is shown')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as work_dir:
+        bucket = LocalBucket(root=os.path.join(work_dir, 'bucket'), name='bucket', latency=args.latency_ms / 1000,
+                             bandwidth=args.bandwidth_mbps * 2 ** 20 / 8)
+        os.makedirs(os.path.join(bucket.root, 'train_data'))
+        make_archive(os.path.join(bucket.root, 'train_data', 'train_val.zip'), args.scale)
+        zip_size = os.path.getsize(os.path.join(bucket.root, 'train_data', 'train_val.zip'))
+        staging_dir = os.path.join(work_dir, 'staging')
+        os.makedirs(staging_dir)
+        storage = Storage(get_bucket=lambda name: bucket, chunk_size=int(args.chunk_size_mb * 2 ** 20))
+
+        num_reviews, staged_time = min((timed(staged_read, bucket, staging_dir) for _ in range(args.repeats)),
+                                       key=lambda run: run[1])
+        streamed_reviews, streamed_time = min((timed(streamed_read, storage) for _ in range(args.repeats)),
+                                              key=lambda run: run[1])
+        assert streamed_reviews == num_reviews
+        with zipfile.ZipFile(os.path.join(bucket.root, 'train_data', 'train_val.zip')) as archive:
+            staged_disk = zip_size + sum(info.file_size for info in archive.infolist())
+        shutil.rmtree(staging_dir)
+
+    print(f"{num_reviews} reviews, {zip_size / 2 ** 20:.1f}MB archive, {args.latency_ms:.0f}ms latency, "
+          f"{args.bandwidth_mbps:.0f}Mbit/s per stream")
+    print(f"copy, extract and parse: {staged_time:.2f}s, {staged_disk / 2 ** 20:.1f}MB written to disk")
+    print(f"streamed: {streamed_time:.2f}s ({staged_time / streamed_time:.2f}x faster), nothing written to disk")
+
+
+if __name__ == '__main__':
+    main()
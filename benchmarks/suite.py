@@ -0,0 +1,229 @@
+""" Benchmark suite covering preprocessing, training and inference, run entirely offline on sample_data. Every stage is
+timed on the same seeded corpus and the best of --repeats runs is kept. Results are written as JSON and, given a
+baseline written by an earlier run, compared against it. Stages which got slower than the baseline by more than
+--threshold are flagged as regressions and make the command exit with status 1.
+
+With --scale above 1, the sample reviews are expanded to a synthetic corpus of that many times their size, made of the
+sample reviews with their words shuffled, so that lengths and vocabulary stay realistic.
+
+Timings depend on the machine, so a baseline should come from the same machine and the same settings.
+
+Usage:
+    python -m benchmarks.suite --output bench.json
+    python -m benchmarks.suite --output bench.json --baseline baseline.json --threshold 0.1
+    python -m benchmarks.suite --scale 10 --models CNN --output bench.json
+"""
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+from argparse import Namespace
+from typing import Callable, Dict, List, Tuple
+
+import numpy as np
+import pandas as pd
+import tensorflow as tf
+from tensorflow.keras.preprocessing.text import Tokenizer
+
+from benchmarks.common import MODELS, SAMPLE_DATA_DIR, EpochTimer, build_artifacts, model_params, timed
+from detectors.detector import Predictor
+from detectors.tf_gcp.data_ops.data_generator import BucketedDataGenerator, DataGenerator
+from detectors.tf_gcp.data_ops.preprocessor import ParallelPreprocessor
+from detectors.tf_gcp.data_ops.sequences import RaggedSequences
+from detectors.tf_gcp.tokenizer import FastTokenizer
+from detectors.tf_gcp.trainer import Trainer
+
+# Settings which have to match between a run and its baseline for timings to be comparable
+COMPARABLE_SETTINGS = ('scale', 'seed', 'workers', 'batch_size', 'train_steps', 'predict_rows', 'repeats')
+
+
+def make_corpus(scale: int, seed: int) -> Tuple[List[str], np.ndarray]:
+    """ Loads sample train and validation reviews, expanded to 'scale' times their size with shuffled copies
+    Returns:
+        A tuple containing review texts and labels
+    """
+    sample = pd.concat([pd.read_csv(os.path.join(SAMPLE_DATA_DIR, name))
+                        for name in ['train_text.csv', 'val_text.csv']])
+    texts, labels = list(sample['input']), np.array(sample['labels'], dtype=np.uint8)
+    rng = np.random.default_rng(seed)
+    synthetic = []
+    for _ in range(scale - 1):
+        for text in texts:
+            words = text.split()
+            synthetic.append(' '.join(words[i] for i in rng.permutation(len(words))))
+    return texts + synthetic, np.tile(labels, scale)
+
+
+def best_of(repeats: int, func: Callable, *args) -> Tuple[object, float]:
+    """ Runs a function 'repeats' times after an untimed warm up run, which builds lookup tables and traces graphs
+    Returns:
+        A tuple containing return value of the last run and the fastest wall time in seconds
+    """
+    func(*args)
+    runs = [timed(func, *args) for _ in range(repeats)]
+    return runs[-1][0], min(elapsed for _, elapsed in runs)
+
+
+def record(results: Dict, name: str, seconds: float, items: int, unit: str, **extra):
+    """ Adds a stage to results and prints it
+    """
+    results[name] = {'seconds': seconds, 'items': items, 'unit': unit, 'throughput': items / seconds, **extra}
+    print(f"{name}: {seconds:.4f}s, {items / seconds:.1f} {unit}/s")
+
+
+def iterate(generator) -> int:
+    """ Builds every batch of a generator once
+    Returns:
+        Number of batches
+    """
+    for idx in range(len(generator)):
+        generator[idx]
+    generator.on_epoch_end()
+    return len(generator)
+
+
+def run_suite(args: Namespace) -> Dict:
+    """ Runs all stages of the suite
+    Returns:
+        A dictionary from stage name to its timing
+    """
+    np.random.seed(args.seed)
+    tf.keras.utils.set_random_seed(args.seed)
+    results = {}
+
+    texts, labels = make_corpus(args.scale, args.seed)
+    print(f"{len(texts)} reviews")
+
+    preprocessor = ParallelPreprocessor(workers=args.workers)
+
+    def fit_tokenizer():
+        tokenizer = Tokenizer(num_words=Trainer.TOP_K)
+        preprocessor.fit_on_texts(tokenizer, texts)
+        return tokenizer
+
+    tokenizer, elapsed = best_of(args.repeats, fit_tokenizer)
+    record(results, 'tokenizer_fit', elapsed, len(texts), 'reviews')
+    fast_tokenizer = FastTokenizer.from_keras(tokenizer)
+
+    sequences, elapsed = best_of(args.repeats, preprocessor.texts_to_ragged, fast_tokenizer, texts,
+                                 Trainer.MAX_SEQUENCE_LENGTH, np.uint16)
+    record(results, 'texts_to_sequences', elapsed, len(texts), 'reviews')
+
+    _, elapsed = best_of(args.repeats, sequences.pad, np.arange(len(sequences)), Trainer.MAX_SEQUENCE_LENGTH)
+    record(results, 'padding', elapsed, len(texts), 'reviews')
+
+    generators = {
+        'fixed': DataGenerator(sequences=sequences, labels=labels, batch_size=args.batch_size,
+                               max_sequence_length=Trainer.MAX_SEQUENCE_LENGTH),
+        'bucketed': BucketedDataGenerator(sequences=sequences, labels=labels, batch_size=args.batch_size,
+                                          seed=args.seed)}
+    for name, generator in generators.items():
+        num_batches, elapsed = best_of(args.repeats, iterate, generator)
+        record(results, f"generator_iteration/{name}", elapsed, num_batches, 'batches')
+
+    num_features = min(fast_tokenizer.word_index_size + 1, Trainer.TOP_K)
+    steps = min(args.train_steps, len(generators['fixed']))
+    num_rows = steps * args.batch_size
+    train_sequences = RaggedSequences(values=sequences.values[:sequences.offsets[num_rows]],
+                                      offsets=sequences.offsets[:num_rows + 1])
+    train_generator = DataGenerator(sequences=train_sequences, labels=labels[:num_rows],
+                                    batch_size=args.batch_size, max_sequence_length=Trainer.MAX_SEQUENCE_LENGTH)
+    for model_type in args.models:
+        model = MODELS[model_type](num_features=num_features, max_sequence_length=Trainer.MAX_SEQUENCE_LENGTH).build(
+            Namespace(**model_params(model_type)))
+        timer = EpochTimer()
+        # The first epoch includes graph tracing and is left out
+        model.fit(train_generator, epochs=args.repeats + 1, callbacks=[timer], verbose=0)
+        step_time = min(timer.times[1:]) / len(train_generator)
+        record(results, f"train_step/{model_type}", step_time * len(train_generator), len(train_generator), 'steps',
+               epoch_seconds=step_time * len(generators['fixed']))
+
+    with tempfile.TemporaryDirectory() as work_dir:
+        for model_type in args.models:
+            predictor = Predictor(config=build_artifacts(work_dir, model_type=model_type), load_test_data=False)
+            lines = sequences.pad(np.arange(min(args.predict_rows, len(sequences))), Trainer.MAX_SEQUENCE_LENGTH)
+            for batch_size in args.predict_batch_sizes:
+                predictor.batch_size = batch_size
+                _, elapsed = best_of(args.repeats, predictor.predict_batch, lines)
+                record(results, f"predict/{model_type}/batch_{batch_size}", elapsed, len(lines), 'reviews')
+
+    return results
+
+
+def environment() -> Dict:
+    """ Describes the machine and versions the suite ran with
+    """
+    try:
+        commit = subprocess.run(['git', 'rev-parse', 'HEAD'], stdout=subprocess.PIPE, stderr=subprocess.DEVNULL,
+                                text=True, cwd=os.path.dirname(SAMPLE_DATA_DIR)).stdout.strip() or None
+    except OSError:
+        commit = None
+    return {'python': platform.python_version(), 'platform': platform.platform(), 'cpu_count': os.cpu_count(),
+            'tensorflow': tf.__version__, 'numpy': np.__version__, 'commit': commit}
+
+
+def compare(results: Dict, baseline: Dict, threshold: float) -> Dict:
+    """ Compares timings against a baseline
+    Args:
+        results (Dict): timings of this run
+        baseline (Dict): report written by an earlier run
+        threshold (float): relative slowdown beyond which a stage counts as a regression
+    Returns:
+        A dictionary from stage name to its relative change in time and whether it is a regression
+    """
+    comparison = {}
+    for name, result in results.items():
+        if name not in baseline['results']:
+            continue
+        change = result['seconds'] / baseline['results'][name]['seconds'] - 1
+        comparison[name] = {'change': change, 'regression': change > threshold}
+        flag = '  REGRESSION' if change > threshold else ''
+        print(f"{name}: {change:+.1%}{flag}")
+    return comparison
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--output', type=str, default='bench.json', help='JSON file results are written to')
+    parser.add_argument('--baseline', type=str, default=None, help='JSON file written by an earlier run')
+    parser.add_argument('--threshold', type=float, default=0.2,
+                        help='Relative slowdown against baseline which is flagged as a regression')
+    parser.add_argument('--scale', type=int, default=1, help='Size of corpus as a multiple of sample data')
+    parser.add_argument('--seed', type=int, default=0, help='Seed of synthetic corpus, shuffling and weights')
+    parser.add_argument('--models', type=str, nargs='+', default=list(MODELS), help='Models to be benchmarked')
+    parser.add_argument('--workers', type=int, default=1, help='Number of preprocessing processes')
+    parser.add_argument('--batch-size', type=int, default=128, help='Batch size of generators and training')
+    parser.add_argument('--train-steps', type=int, default=10, help='Number of training steps per timed epoch')
+    parser.add_argument('--predict-rows', type=int, default=2048, help='Number of reviews scored per prediction run')
+    parser.add_argument('--predict-batch-sizes', type=int, nargs='+', default=[32, 256, 1024],
+                        help='Prediction batch sizes to be benchmarked')
+    parser.add_argument('--repeats', type=int, default=3, help='Number of timed runs per stage, best one is kept')
+    args = parser.parse_args()
+
+    report = {'environment': environment(), 'settings': vars(args), 'results': run_suite(args)}
+
+    regressions = []
+    if args.baseline is not None:
+        with open(args.baseline) as fstream:
+            baseline = json.load(fstream)
+        mismatched = [key for key in COMPARABLE_SETTINGS if baseline['settings'].get(key) != report['settings'][key]]
+        if mismatched:
+            print(f"Settings {mismatched} differ from the baseline, timings may not be comparable")
+        print(f"\nChange against {args.baseline}")
+        report['comparison'] = compare(report['results'], baseline, args.threshold)
+        regressions = [name for name, change in report['comparison'].items() if change['regression']]
+
+    with open(args.output, 'w') as fstream:
+        json.dump(report, fstream, indent=2)
+    print(f"Results written to {args.output}")
+
+    if regressions:
+        print(f"{len(regressions)} stage(s) slower than baseline by more than {args.threshold:.0%}: {regressions}")
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
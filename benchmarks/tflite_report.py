@@ -0,0 +1,95 @@
+""" Compares the TFLite backend against the tensorflow one on sample_data/test_text_100.csv. For every quantization it
+reports model size, single review latency, batched throughput and the change in accuracy and F1 score against the keras
+model the TFLite models are converted from.
+
+Without --config, a model is trained for a few epochs on sample train data first, so that accuracy is meaningful even
+though it is far from the one of a model trained on the full dataset. With --config, the checkpoint and tokenizer of its
+'predict_params' are used instead.
+
+Usage:
+    python -m benchmarks.tflite_report --model CNN --epochs 2
+    python -m benchmarks.tflite_report --config config/config.yaml
+"""
+import argparse
+import copy
+import os
+import tempfile
+
+import numpy as np
+
+from benchmarks.common import SAMPLE_DATA_DIR, build_artifacts, timed
+from detectors.detector import Predictor
+from detectors.tf_gcp.common import YamlConfig
+from detectors.tf_gcp.metrics import RunningConfusionMatrix
+from detectors.tf_gcp.models.tflite_model import TFLiteModel
+from detectors.tflite_exporter import export
+
+
+def measure(config: dict, rows: int, repeats: int) -> dict:
+    """ Creates a Predictor and measures its model on the sample test data
+    Returns:
+        A dictionary containing single review latency in ms, throughput in reviews/s, probabilities and metrics
+    """
+    predictor = Predictor(config=config)
+    test_data = predictor.test_data
+    lines = predictor.tokenizer.texts_to_padded(list(test_data['input']),
+                                                maxlen=predictor.tokenizer_details.max_sequence_length)
+
+    latencies = [timed(predictor.model.predict_on_batch, lines[i % len(lines): i % len(lines) + 1])[1]
+                 for i in range(repeats * 20)]
+    batch = np.resize(lines, (rows, lines.shape[1]))
+    throughput = max(rows / timed(predictor.predict_batch, batch)[1] for _ in range(repeats))
+
+    probabilities, predictions = predictor.predict_batch(lines)
+    confusion_matrix = RunningConfusionMatrix()
+    confusion_matrix.update(y_true=test_data['labels'], y_pred=predictions)
+    return {'latency': np.median(latencies) * 1000, 'throughput': throughput, 'probabilities': probabilities,
+            'predictions': predictions, 'metrics': confusion_matrix.metrics()}
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--config', type=str, default=None, help='Yaml configuration file with a trained checkpoint')
+    parser.add_argument('--model', type=str, default='CNN', help="One of 'CNN', 'LSTM' and 'Hybrid'")
+    parser.add_argument('--epochs', type=int, default=2, help='Epochs trained on sample data when no config is given')
+    parser.add_argument('--rows', type=int, default=2048, help='Number of reviews scored to measure throughput')
+    parser.add_argument('--repeats', type=int, default=3, help='Number of throughput measurements, best one is shown')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as work_dir:
+        if args.config is not None:
+            config = YamlConfig.load(filepath=args.config)
+        else:
+            config = build_artifacts(work_dir, model_type=args.model, epochs=args.epochs)
+        config['predict_params'].update({'data_path': os.path.join(SAMPLE_DATA_DIR, 'test_text_100.csv'),
+                                         'result_path': os.path.join(work_dir, 'results.csv'), 'cache_size': 0})
+        paths = export(config, output_dir=work_dir, quantizations=list(TFLiteModel.QUANTIZATIONS))
+
+        variants = {'tensorflow': (config, os.path.getsize(config['predict_params']['model_path']))}
+        for quantization, path in paths.items():
+            tflite_config = copy.deepcopy(config)
+            tflite_config['predict_params'].update({'model_path': path, 'backend': 'tflite'})
+            variants[f"tflite {quantization}"] = (tflite_config,
+                                                  os.path.getsize(os.path.join(path, TFLiteModel.MODEL_FILE)))
+
+        results = {name: measure(variant_config, args.rows, args.repeats)
+                   for name, (variant_config, _) in variants.items()}
+
+    reference = results['tensorflow']
+    print(f"\n{config['model_params']['model']} model, {len(reference['predictions'])} test reviews, throughput over "
+          f"{args.rows} reviews")
+    print("| backend | size (MiB) | single review latency (ms) | throughput (reviews/s) | accuracy | F1 | "
+          "max probability change | changed labels |")
+    print("|---|---|---|---|---|---|---|---|")
+    for name, result in results.items():
+        metrics = result['metrics']
+        accuracy_change = metrics['val_accuracy'] - reference['metrics']['val_accuracy']
+        f1_change = metrics['val_f1'] - reference['metrics']['val_f1']
+        print(f"| {name} | {variants[name][1] / 2 ** 20:.1f} | {result['latency']:.2f} | {result['throughput']:.0f} | "
+              f"{metrics['val_accuracy']:.2%} ({accuracy_change:+.2%}) | {metrics['val_f1']:.4f} ({f1_change:+.4f}) | "
+              f"{np.abs(result['probabilities'] - reference['probabilities']).max():.5f} | "
+              f"{np.count_nonzero(result['predictions'] != reference['predictions'])} |")
+
+
+if __name__ == '__main__':
+    main()
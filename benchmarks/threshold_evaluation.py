@@ -0,0 +1,69 @@
+""" Measures how ThresholdEvaluation scales with the number of reviews, on synthetic probabilities of a classifier,
+against thresholding the probabilities again for every candidate threshold the way operating points used to be
+chosen. ROC AUC and PR AUC are checked against scikit-learn on the smallest size.
+
+Usage:
+    python -m benchmarks.threshold_evaluation --rows 1000000 10000000 30000000 --thresholds 100
+"""
+import argparse
+import time
+
+import numpy as np
+from sklearn.metrics import average_precision_score, roc_auc_score
+
+from benchmarks.common import timed
+from detectors.tf_gcp.metrics import RunningConfusionMatrix, ThresholdEvaluation
+
+CHUNK_SIZE = 1000000
+
+
+def make_scores(num_rows: int, seed: int = 0):
+    """ Creates labels and float32 probabilities rounded to 4 decimals like the ones of a result csv file, so that
+        many reviews share a probability
+    """
+    rng = np.random.default_rng(seed)
+    labels = rng.random(num_rows) < 0.5
+    scores = np.clip(rng.normal(0.35 + 0.3 * labels, 0.2), 0, 1).round(4).astype(np.float32)
+    return labels, scores
+
+
+def evaluate(labels: np.ndarray, scores: np.ndarray):
+    evaluation = ThresholdEvaluation()
+    for start in range(0, len(labels), CHUNK_SIZE):
+        evaluation.update(labels[start: start + CHUNK_SIZE], scores[start: start + CHUNK_SIZE])
+    return evaluation.evaluate()
+
+
+def rethreshold(labels: np.ndarray, scores: np.ndarray, num_thresholds: int):
+    """ Builds a confusion matrix for every threshold separately
+    """
+    for threshold in np.linspace(0, 1, num_thresholds):
+        confusion_matrix = RunningConfusionMatrix()
+        confusion_matrix.update(y_true=labels, y_pred=scores > threshold)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--rows', type=int, nargs='+', default=[1000000, 10000000, 30000000],
+                        help='Numbers of reviews to be evaluated')
+    parser.add_argument('--thresholds', type=int, default=100, help='Thresholds of the thresholding baseline')
+    args = parser.parse_args()
+
+    for num_rows in args.rows:
+        labels, scores = make_scores(num_rows)
+        (report, curve), elapsed = timed(evaluate, labels, scores)
+        if num_rows == min(args.rows):
+            start = time.perf_counter()
+            roc_auc, pr_auc = roc_auc_score(labels, scores), average_precision_score(labels, scores)
+            sklearn_elapsed = time.perf_counter() - start
+            assert np.isclose(report['roc_auc'], roc_auc) and np.isclose(report['pr_auc'], pr_auc), \
+                f"AUCs differ from scikit-learn: {report['roc_auc']} {roc_auc}, {report['pr_auc']} {pr_auc}"
+            print(f"AUCs match scikit-learn, which takes {sklearn_elapsed:.2f}s for both on {num_rows} reviews")
+        _, baseline_elapsed = timed(rethreshold, labels, scores, args.thresholds)
+        print(f"{num_rows} reviews: every one of {len(curve)} thresholds, AUCs and calibration in {elapsed:.2f}s "
+              f"({elapsed / num_rows * 1e9:.0f}ns per review), {args.thresholds} thresholds one by one in "
+              f"{baseline_elapsed:.2f}s")
+
+
+if __name__ == '__main__':
+    main()
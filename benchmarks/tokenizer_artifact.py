@@ -0,0 +1,67 @@
+""" Compares size and load time of the json tokenizer artifact against the legacy pickled TokenizerDetails, and checks
+that both load into tokenizers producing the same sequences.
+
+Usage:
+    python -m benchmarks.tokenizer_artifact --repeat-data 10
+"""
+import argparse
+import os
+import pickle
+import tempfile
+
+import numpy as np
+import pandas as pd
+from tensorflow.keras.preprocessing.text import Tokenizer
+
+from benchmarks.common import SAMPLE_DATA_DIR, timed
+from detectors.tf_gcp.tokenizer import FastTokenizer
+from detectors.tf_gcp.trainer import Trainer, TokenizerDetails
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--repeat-data', type=int, default=1,
+                        help='Number of times sample texts are repeated, each copy with its words suffixed differently '
+                             'so that the vocabulary keeps growing like it does on the full corpus')
+    parser.add_argument('--repeats', type=int, default=5, help='Number of timed loads, best one is reported')
+    args = parser.parse_args()
+
+    texts = list(pd.read_csv(os.path.join(SAMPLE_DATA_DIR, 'train_text.csv'))['input'])
+    tokenizer = Tokenizer(num_words=Trainer.TOP_K)
+    tokenizer.fit_on_texts(texts)
+    for copy in range(1, args.repeat_data):
+        tokenizer.fit_on_texts([' '.join(f"{word}{copy}" for word in text.split()) for text in texts])
+
+    with tempfile.TemporaryDirectory() as work_dir:
+        legacy_path = os.path.join(work_dir, 'tokenizer.pickle')
+        with open(legacy_path, 'wb') as handle:
+            pickle.dump(TokenizerDetails(tokenizer=tokenizer, top_k=Trainer.TOP_K,
+                                         max_sequence_length=Trainer.MAX_SEQUENCE_LENGTH),
+                        handle, protocol=pickle.HIGHEST_PROTOCOL)
+        compact_path = os.path.join(work_dir, 'tokenizer.json')
+        TokenizerDetails(tokenizer=FastTokenizer.from_keras(tokenizer), top_k=Trainer.TOP_K,
+                         max_sequence_length=Trainer.MAX_SEQUENCE_LENGTH).save(compact_path)
+
+        def unpickle():
+            with open(legacy_path, 'rb') as handle:
+                return pickle.load(handle)
+
+        _, pickle_time = min((timed(unpickle) for _ in range(args.repeats)), key=lambda r: r[1])
+        legacy, legacy_time = min((timed(TokenizerDetails.load, legacy_path) for _ in range(args.repeats)),
+                                  key=lambda r: r[1])
+        compact, compact_time = min((timed(TokenizerDetails.load, compact_path) for _ in range(args.repeats)),
+                                    key=lambda r: r[1])
+
+        assert compact.num_features == legacy.num_features
+        assert np.array_equal(compact.tokenizer.texts_to_padded(texts, Trainer.MAX_SEQUENCE_LENGTH),
+                              legacy.tokenizer.texts_to_padded(texts, Trainer.MAX_SEQUENCE_LENGTH))
+
+        print(f"word index size: {len(tokenizer.word_index)}")
+        print(f"legacy pickle: {os.path.getsize(legacy_path) / 1024:.0f} KiB, unpickled in {pickle_time * 1000:.1f}ms, "
+              f"loaded through TokenizerDetails.load in {legacy_time * 1000:.1f}ms")
+        print(f"json artifact: {os.path.getsize(compact_path) / 1024:.0f} KiB, "
+              f"loaded in {compact_time * 1000:.1f}ms (outputs identical)")
+
+
+if __name__ == '__main__':
+    main()
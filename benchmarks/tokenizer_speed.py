@@ -0,0 +1,45 @@
+""" Compares speed of keras texts_to_sequences + pad_sequences against FastTokenizer.texts_to_padded. That both
+produce identical sequences is tested in tests/test_tokenizer.py.
+
+Usage:
+    python -m benchmarks.tokenizer_speed --data sample_data/train_text.csv
+"""
+import argparse
+import os
+
+import pandas as pd
+from tensorflow.keras.preprocessing import sequence
+from tensorflow.keras.preprocessing.text import Tokenizer
+
+from benchmarks.common import SAMPLE_DATA_DIR, timed
+from detectors.tf_gcp.tokenizer import FastTokenizer
+from detectors.tf_gcp.trainer import Trainer
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--data', type=str, default=os.path.join(SAMPLE_DATA_DIR, 'train_text.csv'),
+                        help='csv file containing review texts in input column')
+    parser.add_argument('--repeats', type=int, default=3, help='Number of timed runs, best one is reported')
+    args = parser.parse_args()
+
+    texts = list(pd.read_csv(args.data)['input'])
+
+    for oov_token in [None, '<OOV>']:
+        tokenizer = Tokenizer(num_words=Trainer.TOP_K, oov_token=oov_token)
+        tokenizer.fit_on_texts(texts)
+        fast_tokenizer = FastTokenizer.from_keras(tokenizer)
+
+        def keras_path():
+            return sequence.pad_sequences(tokenizer.texts_to_sequences(texts), maxlen=Trainer.MAX_SEQUENCE_LENGTH)
+
+        _, keras_time = min((timed(keras_path) for _ in range(args.repeats)), key=lambda r: r[1])
+        _, fast_time = min((timed(fast_tokenizer.texts_to_padded, texts, Trainer.MAX_SEQUENCE_LENGTH)
+                                 for _ in range(args.repeats)), key=lambda r: r[1])
+
+        print(f"oov_token={oov_token}: keras {keras_time:.3f}s, fast {fast_time:.3f}s, "
+              f"{keras_time / fast_time:.1f}x faster on {len(texts)} texts")
+
+
+if __name__ == '__main__':
+    main()
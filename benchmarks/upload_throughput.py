@@ -0,0 +1,98 @@
+""" Compares the sequential upload loop CloudIO used to have against its concurrent uploader, on a directory shaped like
+the output of a training run: nested model directories, checkpoints and small artifacts. Uploads go to a LocalBucket
+which adds a latency to every request and limits the bandwidth of every stream, so results reflect round trips to
+Google Cloud Storage rather than local disk speed. Also measures uploading the same directory again, with nothing and
+with one checkpoint changed, and checks that the destination matches the source.
+
+Usage:
+    python -m benchmarks.upload_throughput --files 40 --file-size-mb 2 --latency-ms 30 --bandwidth-mbps 200
+"""
+import argparse
+import os
+import tempfile
+
+import numpy as np
+
+from benchmarks.common import timed
+from detectors.tf_gcp.data_ops.io_ops import CloudIO
+from detectors.tf_gcp.data_ops.local_bucket import LocalBucket
+
+
+def make_run_directory(path: str, num_files: int, file_size: int, seed: int = 0):
+    """ Creates a directory of checkpoints and a nested model directory, along with a few small files
+    """
+    rng = np.random.default_rng(seed)
+    for sub_dir in ['checkpoints', os.path.join('trained_model', 'inference_model', 'variables')]:
+        os.makedirs(os.path.join(path, sub_dir), exist_ok=True)
+    for idx in range(num_files):
+        sub_dir = 'checkpoints' if idx % 2 == 0 else os.path.join('trained_model', 'inference_model', 'variables')
+        with open(os.path.join(path, sub_dir, f"part_{idx:03d}.bin"), 'wb') as fstream:
+            fstream.write(rng.bytes(file_size))
+    for name in ['train_logs.csv', 'tokenizer.json', os.path.join('trained_model', 'inference_model', 'metadata.json')]:
+        with open(os.path.join(path, name), 'w') as fstream:
+            fstream.write('{}' * 100)
+
+
+def sequential_upload(bucket: LocalBucket, local_path: str, gcs_path: str):
+    """ Uploads every file one after the other, like CloudIO did before, except that subdirectories are included so
+        that both paths upload the same files
+    """
+    for root, _, names in os.walk(local_path):
+        for name in names:
+            l_file = os.path.join(root, name)
+            bucket.blob(os.path.join(gcs_path, os.path.relpath(l_file, local_path))).upload_from_filename(l_file)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--files', type=int, default=40, help='Number of large files in the directory')
+    parser.add_argument('--file-size-mb', type=float, default=2, help='Size of every large file in MB')
+    parser.add_argument('--latency-ms', type=float, default=30, help='Latency added to every request')
+    parser.add_argument('--bandwidth-mbps', type=float, default=200, help='Upload bandwidth of a single stream')
+    parser.add_argument('--workers', type=int, default=8, help='Number of concurrent uploads')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as work_dir:
+        local_path = os.path.join(work_dir, 'run')
+        make_run_directory(local_path, args.files, int(args.file_size_mb * 2 ** 20))
+        num_files = sum(len(names) for _, _, names in os.walk(local_path))
+        total_mb = sum(os.path.getsize(os.path.join(root, name))
+                       for root, _, names in os.walk(local_path) for name in names) / 2 ** 20
+
+        def make_bucket(name: str) -> LocalBucket:
+            return LocalBucket(root=os.path.join(work_dir, name), name=name, latency=args.latency_ms / 1000,
+                               bandwidth=args.bandwidth_mbps * 2 ** 20 / 8)
+
+        sequential_bucket = make_bucket('sequential')
+        _, sequential_time = timed(sequential_upload, sequential_bucket, local_path, 'results/run')
+
+        bucket = make_bucket('concurrent')
+        cloud_io = CloudIO(bucket=bucket, max_workers=args.workers)
+        _, concurrent_time = timed(cloud_io.write, local_path, 'gs://concurrent/results', use_system_cmd=False)
+
+        for root, _, names in os.walk(local_path):
+            for name in names:
+                l_file = os.path.join(root, name)
+                blob = bucket.blob(os.path.join('results', 'run', os.path.relpath(l_file, local_path)))
+                assert blob.md5_hash == CloudIO.md5_checksum(l_file), f"{blob.name} differs from {l_file}"
+
+        uploads_before = bucket.num_uploads
+        _, unchanged_time = timed(cloud_io.write, local_path, 'gs://concurrent/results', use_system_cmd=False)
+        assert bucket.num_uploads == uploads_before
+
+        with open(os.path.join(local_path, 'checkpoints', 'part_000.bin'), 'r+b') as fstream:
+            fstream.write(b'changed')
+        _, changed_time = timed(cloud_io.write, local_path, 'gs://concurrent/results', use_system_cmd=False)
+        assert bucket.num_uploads == uploads_before + 1
+
+        print(f"{num_files} files, {total_mb:.1f}MB, {args.latency_ms:.0f}ms latency, "
+              f"{args.bandwidth_mbps:.0f}Mbit/s per stream")
+        print(f"sequential: {sequential_time:.2f}s ({total_mb / sequential_time:.1f}MB/s)")
+        print(f"concurrent, {args.workers} workers: {concurrent_time:.2f}s ({total_mb / concurrent_time:.1f}MB/s, "
+              f"{sequential_time / concurrent_time:.1f}x faster)")
+        print(f"again, nothing changed: {unchanged_time:.2f}s, again, one file changed: {changed_time:.2f}s")
+        print("destination matches source")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,127 @@
+""" Compares peak memory and time of fitting a keras Tokenizer, which counts every distinct word of the corpus, against
+the heavy hitters vocabulary selected by 'vocabulary: heavy_hitters', which keeps a bounded summary of candidate words
+and recounts them exactly in a second pass. Reviews of the synthetic corpus are made of words drawn from a Zipf
+distribution, mixed with tokens which hardly ever repeat, like typos, urls and product codes do. Every builder runs in a
+fresh process, and its peak resident memory is reported on top of the memory the process had once tensorflow was
+imported, along with how many of the exact top words it finds and how many get the exact same index.
+
+Usage:
+    python -m benchmarks.vocabulary_sketch --reviews 200000 --capacities 100000 200000
+"""
+import argparse
+import multiprocessing
+import resource
+import time
+from typing import Dict, Iterator, List, Optional
+
+import numpy as np
+
+WORDS_PER_REVIEW = 80
+
+
+def make_words(num_words: int, seed: int) -> np.ndarray:
+    """ Creates distinct random lower case words of 3 to 10 letters
+    """
+    rng = np.random.default_rng(seed)
+    words = set()
+    while len(words) < num_words:
+        lengths = rng.integers(3, 11, num_words)
+        letters = rng.integers(ord('a'), ord('z') + 1, (num_words, 10), dtype=np.uint8)
+        words.update(row[:length].tobytes().decode() for row, length in zip(letters, lengths))
+    return np.array(sorted(words)[:num_words], dtype=object)
+
+
+def iter_corpus(num_reviews: int, chunk_size: int, num_words: int, noise: float, seed: int = 0) -> Iterator[List[str]]:
+    """ Yields chunks of synthetic reviews. The same arguments always produce the same corpus
+    Args:
+        num_reviews (int): number of reviews in the corpus
+        chunk_size (int): number of reviews per chunk
+        num_words (int): number of distinct regular words
+        noise (float): share of tokens which are random product codes
+        seed (int): seed of the corpus
+    """
+    words = make_words(num_words, seed)
+    ranks = np.arange(1, num_words + 1, dtype=np.float64)
+    cdf = np.cumsum(1 / ranks)
+    cdf /= cdf[-1]
+    for idx, start in enumerate(range(0, num_reviews, chunk_size)):
+        rng = np.random.default_rng([seed, idx])
+        num_tokens = min(chunk_size, num_reviews - start) * WORDS_PER_REVIEW
+        tokens = words[np.minimum(np.searchsorted(cdf, rng.random(num_tokens)), num_words - 1)]
+        is_noise = rng.random(num_tokens) < noise
+        tokens[is_noise] = [f"sku{code:010x}" for code in rng.integers(0, 2 ** 40, int(is_noise.sum())).tolist()]
+        yield [' '.join(tokens[row: row + WORDS_PER_REVIEW]) for row in range(0, num_tokens, WORDS_PER_REVIEW)]
+
+
+def run_builder(args: argparse.Namespace, capacity: Optional[int]) -> Dict:
+    """ Builds the vocabulary of the corpus in the current process, exactly if 'capacity' is None
+    Returns:
+        A dictionary containing wall time, peak resident memory on top of the one before building, number of words held
+        and words of the vocabulary in order of their indices
+    """
+    from tensorflow.keras.preprocessing.text import Tokenizer
+
+    from detectors.tf_gcp.data_ops.preprocessor import ParallelPreprocessor
+    from detectors.tf_gcp.instrumentation import current_rss
+    from detectors.tf_gcp.tokenizer import FastTokenizer
+    from detectors.tf_gcp.trainer import Trainer
+    from detectors.tf_gcp.vocabulary import HeavyHittersVocabulary
+
+    def corpus() -> Iterator[List[str]]:
+        return iter_corpus(args.reviews, args.chunk_size, args.words, args.noise)
+
+    preprocessor = ParallelPreprocessor(workers=args.workers)
+    tokenizer = Tokenizer(num_words=Trainer.TOP_K)
+    base_rss = current_rss()
+    start_time = time.perf_counter()
+    if capacity is None:
+        preprocessor.fit_on_chunks(tokenizer, corpus())
+        fast_tokenizer = FastTokenizer.from_keras(tokenizer)
+        words_held = len(tokenizer.word_counts)
+    else:
+        vocabulary = HeavyHittersVocabulary.from_keras(tokenizer, capacity=capacity)
+        preprocessor.sketch_chunks(vocabulary, corpus())
+        vocabulary.start_recount()
+        preprocessor.recount_chunks(vocabulary, corpus())
+        fast_tokenizer = vocabulary.to_tokenizer()
+        # Largest size the summary reached
+        words_held = vocabulary.word_index_size
+    elapsed = time.perf_counter() - start_time
+    peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+    return {'seconds': elapsed, 'peak_mb': (peak_rss - base_rss) / 2 ** 20, 'words_held': words_held,
+            'vocabulary': sorted(fast_tokenizer.vocabulary, key=fast_tokenizer.vocabulary.get),
+            'word_index_size': fast_tokenizer.word_index_size}
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--reviews', type=int, default=200000, help='Number of reviews in the corpus')
+    parser.add_argument('--words', type=int, default=500000, help='Number of distinct regular words')
+    parser.add_argument('--noise', type=float, default=0.1, help='Share of tokens which are random product codes')
+    parser.add_argument('--chunk-size', type=int, default=10000, help='Number of reviews counted at once')
+    parser.add_argument('--capacities', type=int, nargs='+', default=[100000, 200000],
+                        help='Values of vocabulary_capacity to be compared against the exact vocabulary')
+    parser.add_argument('--workers', type=int, default=1, help='Number of preprocessing processes')
+    args = parser.parse_args()
+
+    context = multiprocessing.get_context('spawn')
+    results = {}
+    for capacity in [None] + args.capacities:
+        with context.Pool(processes=1) as pool:
+            results[capacity] = pool.apply(run_builder, (args, capacity))
+
+    reference = results[None]
+    exact_words = reference['vocabulary']
+    print(f"\n{args.reviews} reviews of {WORDS_PER_REVIEW} words, {reference['word_index_size']} distinct words, "
+          f"{args.workers} worker(s)")
+    for capacity, result in results.items():
+        name = 'exact' if capacity is None else f"heavy hitters, capacity {capacity}"
+        overlap = len(set(result['vocabulary']) & set(exact_words)) / len(exact_words)
+        same_index = np.mean([a == b for a, b in zip(result['vocabulary'], exact_words)])
+        print(f"{name}: {result['seconds']:.2f}s, {result['peak_mb']:.0f}MB peak memory on top of start up, "
+              f"{result['words_held']} words held at most, top {len(exact_words)} overlap {overlap:.2%}, "
+              f"same index {same_index:.2%}")
+
+
+if __name__ == '__main__':
+    main()
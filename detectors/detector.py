@@ -1,90 +1,266 @@
 import argparse
+import json
 import os
-import pickle
-from typing import Dict
+import re
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Iterator, List, Optional, Tuple
 
+import h5py
 import pandas as pd
 import numpy as np
 
 from tqdm import tqdm
 from argparse import Namespace
-from sklearn.metrics import confusion_matrix
-from tensorflow.keras.preprocessing import sequence
 
 from detectors.tf_gcp.common import YamlConfig, SystemOps
+from detectors.tf_gcp.data_ops.storage import Storage
+from detectors.tf_gcp.instrumentation import Instrumentation, path_size
+from detectors.tf_gcp.metrics import RunningConfusionMatrix, ThresholdEvaluation
+from detectors.tf_gcp.prediction_cache import PredictionCache
+from detectors.tf_gcp.models.inference_model import InferenceModel
 from detectors.tf_gcp.models.models import CNNModel, LSTMModel, HybridModel
+from detectors.tf_gcp.models.tflite_model import TFLiteModel
+from detectors.tf_gcp.sweep import Sweep
+from detectors.tf_gcp.trainer import TokenizerDetails
 from detectors.vertex_ai_job import Trainer
 
 
 class Predictor(object):
+    THRESHOLD = 0.5
+    BACKENDS = ('tensorflow', 'tflite')
+    ENSEMBLES = ('average', 'vote')
 
-    def __init__(self, config: Dict):
+    def __init__(self, config: Dict, load_test_data: bool = True, storage: Optional[Storage] = None):
         """ Init method
         Args:
             config (Dict): A dictionary containing user configurations.
+            load_test_data (bool): whether test data is to be loaded. Only model and tokenizer are needed to score
+                                   reviews which don't come from a file, like in detectors.server
+            storage (Optional[Storage]): storage test data, tokenizer and model are read from
         """
         self.config = config.get('predict_params', {})
         self.data_path = self.config.get('data_path')
         self.result_path = self.config.get('result_path')
-        self.model_params = Namespace(**config.get('model_params'))
+        self.model_params = Namespace(**config.get('model_params', {}))
         self.model_path = self.config.get('model_path')
         self.tokenizer_path = self.config.get('tokenizer_path')
-        self.test_data = self.load_data()
+        self.batch_size = self.config.get('batch_size', 1024)
+        self.chunk_size = self.config.get('chunk_size', None)
+        self.backend = self.config.get('backend', 'tensorflow')
+        if self.backend not in Predictor.BACKENDS:
+            raise ValueError(f"'backend' should be one of {Predictor.BACKENDS}, not {self.backend}")
+        self.ensemble = self.config.get('ensemble', 'average')
+        if self.ensemble not in Predictor.ENSEMBLES:
+            raise ValueError(f"'ensemble' should be one of {Predictor.ENSEMBLES}, not {self.ensemble}")
+        self.storage = storage or Storage()
+        self.instrumentation = Instrumentation(run_name=os.path.basename(self.result_path or 'predict'))
+        self.test_data = self.load_data() if load_test_data else None
         self.tokenizer_details = self.load_tokenizer()
-        self.model = self.load_model()
+        self.tokenizer = self.tokenizer_details.tokenizer
+        self.models, self.model_paths = self.load_models()
+        # The first model is the one used where a single model is expected, like in predict and tflite_exporter
+        self.model = next(iter(self.models.values()))
+        self.executor = self.create_executor()
+        self.prediction_cache = self.load_prediction_cache()
 
     def load_data(self):
-        """ loads test data from the specified directory
+        """ loads test data from the specified path. Files in Google Cloud Storage are parsed while they are read,
+            without being copied here first
+        Returns:
+            A dataframe containing test data, or an iterator over dataframes of 'chunk_size' rows if it is specified
         """
-        if self.data_path.startswith('gs://'):
-            print(f'[Predictor::load_data] Copying test data {self.data_path} to here...')
-            SystemOps.run_command(f"gsutil -m cp -r {self.data_path} ./")
-            self.data_path = os.path.basename(self.data_path)
+        if self.chunk_size:
+            print(f'[Predictor::load_data] Streaming texts from {self.data_path} in chunks of {self.chunk_size}')
+            return self.parse_chunks(self.storage.iter_csv(self.data_path, chunk_size=self.chunk_size))
 
         print(f'[Predictor::load_data] Reading texts from {self.data_path}')
-        test_data = pd.read_csv(self.data_path)
+        with self.instrumentation.stage('csv_parse', unit='reviews') as record:
+            test_data = self.storage.read_csv(self.data_path)
+            record['items'] = len(test_data)
         return test_data
+
+    def parse_chunks(self, reader: Iterator[pd.DataFrame]) -> Iterator[pd.DataFrame]:
+        """ Yields chunks of a csv reader, recording time taken to parse every one of them
+        Args:
+            reader (Iterator[pd.DataFrame]): iterator over chunks of a csv file
+        """
+        while True:
+            with self.instrumentation.stage('csv_parse', unit='reviews') as record:
+                chunk = next(reader, None)
+                record['items'] = 0 if chunk is None else len(chunk)
+            if chunk is None:
+                return
+            yield chunk
         
     def load_tokenizer(self):
-        """ Loads tokenizer from the pickle file. This file is created during training
-        """
-        if self.tokenizer_path.startswith('gs://'):
-            print(f'[Predictor::load_tokenizer] Copying tokenizer {self.tokenizer_path} to here...')
-            SystemOps.run_command(f"gsutil -m cp -r {self.tokenizer_path} ./")
-            self.tokenizer_path = os.path.basename(self.tokenizer_path)
-
-        with open(self.tokenizer_path, 'rb') as handle:
-            tokenizer_details = pickle.load(handle)
-        return tokenizer_details
-
-    def load_model(self):
-        """ Loads the model saved during training
-        """
-        if self.model_path.startswith('gs://'):
-            print(f'[Predictor::load_model] Copying model {self.model_path} to here...')
-            SystemOps.run_command(f"gsutil -m cp -r {self.model_path} ./")
-            self.model_path = os.path.basename(self.model_path)
-
-        num_features = min(len(self.tokenizer_details.tokenizer.word_index) + 1, self.tokenizer_details.top_k)
-
-        # Load the correct model based on user configurations
-        if self.model_params.model == 'CNN':
-            model = CNNModel(num_features=num_features,
-                             max_sequence_length=self.tokenizer_details.max_sequence_length).build(self.model_params)
-        elif self.model_params.model == 'LSTM':
-            model = LSTMModel(num_features=num_features,
-                              max_sequence_length=self.tokenizer_details.max_sequence_length).build(self.model_params)
-        elif self.model_params.model == 'Hybrid':
-            model = HybridModel(num_features=num_features,
-                                max_sequence_length=self.tokenizer_details.max_sequence_length).build(self.model_params)
+        """ Loads tokenizer artifact created during training. Pickle files created by older versions are also supported
+        """
+        with self.instrumentation.stage('tokenizer_load'):
+            return TokenizerDetails.load(self.tokenizer_path, storage=self.storage)
+
+    @staticmethod
+    def infer_model_type(weights_path: str, storage: Optional[Storage] = None) -> Tuple[Optional[str], Optional[bool]]:
+        """ Infers type of model, and whether it masks padding, from names of layers stored in an hdf5 weights file
+        Args:
+            weights_path (str): path to weights saved by Trainer or ModelCheckpoint callback
+            storage (Optional[Storage]): storage the weights file is read from. Only the parts of the file holding
+                                         layer names are read
+        Returns:
+            A tuple containing one of 'CNN', 'LSTM' and 'Hybrid', or None if the type can't be inferred, and whether
+            the model masks padding, None if layer names can't be read
+        """
+        try:
+            with (storage or Storage()).open(weights_path) as stream, h5py.File(stream, 'r') as weights:
+                layer_names = weights.attrs['layer_names']
+        except (OSError, KeyError):
+            return None, None
+
+        # Keras names layers after their type, adding a numeric suffix when there are several of them. Layers of models
+        # which mask padding are named after the keras layers they extend, with a 'masked_' prefix
+        layer_names = [name.decode() if isinstance(name, bytes) else name for name in layer_names]
+        mask_padding = any(name.startswith('masked_') for name in layer_names)
+        layer_types = {re.sub(r'^masked_|_\d+$', '', name) for name in layer_names}
+        if 'lstm' in layer_types:
+            return ('Hybrid' if 'conv1d' in layer_types else 'LSTM'), mask_padding
+        if 'conv1d' in layer_types:
+            return 'CNN', mask_padding
+        return None, mask_padding
+
+    def load_models(self) -> Tuple[Dict[str, object], Dict[str, str]]:
+        """ Loads the models listed in 'models' of 'predict_params', or the single model of 'model_path' if there is no
+            such list. Every entry of 'models' holds a 'model_path', and optionally 'model' and other 'model_params'
+            needed to rebuild a model from weights, overriding the ones of 'model_params'
+        Returns:
+            A tuple containing dictionaries from model name to model and to model path. Models are named after their
+            type, followed by their position in 'models' when several of them have the same type
+        """
+        entries = self.config.get('models')
+        if not entries:
+            model = self.load_model(self.model_path, self.model_params)
+            return {self.model_params.model: model}, {self.model_params.model: self.model_path}
+
+        loaded = []
+        for entry in entries:
+            entry = dict(entry)
+            model_path = entry.pop('model_path')
+            model_params = Namespace(**{**vars(self.model_params), **entry})
+            loaded.append((model_params, model_path, self.load_model(model_path, model_params)))
+
+        model_types = [model_params.model for model_params, _, _ in loaded]
+        models, model_paths = {}, {}
+        for idx, (model_params, model_path, model) in enumerate(loaded):
+            name = model_params.model if model_types.count(model_params.model) == 1 \
+                else f"{model_params.model}_{idx + 1}"
+            models[name] = model
+            model_paths[name] = model_path
+        # Model params of the first model are the ones used where a single model is expected
+        self.model_params = loaded[0][0]
+        self.model_path = loaded[0][1]
+        return models, model_paths
+
+    def create_executor(self) -> Optional[ThreadPoolExecutor]:
+        """ Creates the threads scoring a batch through several models at once. Models release the GIL while they run,
+            so they overlap as long as there are free cores. Number of threads is set by 'ensemble_workers' and defaults
+            to the number of models or of cores, whichever is lower. With a single model or thread, models are called
+            one after another on the calling thread instead
+        """
+        num_workers = self.config.get('ensemble_workers', min(len(self.models), os.cpu_count() or 1))
+        if len(self.models) == 1 or num_workers <= 1:
+            return None
+        print(f"[Predictor::create_executor] Scoring {len(self.models)} models with {num_workers} threads")
+        return ThreadPoolExecutor(max_workers=num_workers, thread_name_prefix='Predictor')
+
+    def load_model(self, model_path: str, model_params: Namespace):
+        """ Loads a model saved during training. With 'tflite' backend, a TFLite model exported by
+            detectors.tflite_exporter is loaded into the TFLite interpreter. Otherwise an exported inference model is
+            loaded directly, and for weights the model is rebuilt based on the type inferred from the weights file,
+            falling back to 'model' of 'model_params'. Either way the model is warmed up with a dummy batch. Models in
+            Google Cloud Storage are read from there directly
+        Args:
+            model_path (str): path to the model
+            model_params (Namespace): parameters of the model, whose 'model' is set to the type of the loaded model
+        """
+        record = self.instrumentation.start('model_load')
+        start_time = time.perf_counter()
+        configured_type = getattr(model_params, 'model', None)
+        if self.backend == 'tflite':
+            if not TFLiteModel.is_exported(model_path, storage=self.storage):
+                raise ValueError(f"'tflite' backend needs 'model_path' to be a TFLite model exported by "
+                                 f"detectors.tflite_exporter, {model_path} is not")
+            print(f"[Predictor::load_model] Loading TFLite model from {model_path}")
+            model = TFLiteModel.load(model_path, storage=self.storage)
+        elif TFLiteModel.is_exported(model_path, storage=self.storage):
+            raise ValueError(f"{model_path} is a TFLite model, set 'backend' of 'predict_params' to 'tflite' to "
+                             f"use it")
+        elif InferenceModel.is_exported(model_path, storage=self.storage):
+            print(f"[Predictor::load_model] Loading exported inference model from {model_path}")
+            model = InferenceModel.load(model_path, storage=self.storage)
         else:
-            raise NotImplementedError(f"{self.model_params.model} model is currently not supported. "
-                                      f"Please choose between CNN, LSTM and Hybrid")
+            inferred_type, mask_padding = Predictor.infer_model_type(model_path, storage=self.storage)
+            model_type = inferred_type or configured_type
+            # Weights trained before padding was masked fit models which mask it too, but score differently in them
+            if mask_padding is not None:
+                if getattr(model_params, 'mask_padding', mask_padding) != mask_padding:
+                    print(f"[Predictor::load_model] {model_path} holds a model which "
+                          f"{'masks' if mask_padding else 'does not mask'} padding, but 'mask_padding' in "
+                          f"'model_params' is set to {model_params.mask_padding}. Using {mask_padding}")
+                model_params.mask_padding = mask_padding
+            model = self.build_model(model_type, model_params)
+            print(f"[Predictor::load_model] Loading weights for {model_type} model from {model_path}")
+            model.load_weights(model_path)
+
+        if isinstance(model, (TFLiteModel, InferenceModel)):
+            if model.tokenizer_fingerprint != self.tokenizer_details.fingerprint:
+                raise ValueError(f"Model {model_path} was trained with a different tokenizer than "
+                                 f"{self.tokenizer_path}")
+            model_type = model.model_type
 
-        print(f"[Predictor::load_model] Loading weights for {self.model_params.model} model from {self.model_path}")
-        model.load_weights(self.model_path)
+        if configured_type is not None and model_type != configured_type:
+            print(f"[Predictor::load_model] {model_path} holds a {model_type} model, but 'model' in "
+                  f"'model_params' is set to {configured_type}. Using {model_type} model")
+        model_params.model = model_type
+
+        # The first call initialises the graph, so it is made here instead of on the first real batch
+        model.predict_on_batch(np.zeros((1, self.tokenizer_details.max_sequence_length), dtype=np.int32))
+        print(f"[Predictor::load_model] {model_type} model ready in {time.perf_counter() - start_time:.2f}s")
+        self.instrumentation.stop(record)
         return model
 
+    def build_model(self, model_type: str, model_params: Namespace):
+        """ Builds a model of given type to load weights into
+        Args:
+            model_type (str): one of 'CNN', 'LSTM' and 'Hybrid'
+            model_params (Namespace): parameters the model is built with
+        """
+        num_features = self.tokenizer_details.num_features
+        if model_type == 'CNN':
+            return CNNModel(num_features=num_features,
+                            max_sequence_length=self.tokenizer_details.max_sequence_length).build(model_params)
+        elif model_type == 'LSTM':
+            return LSTMModel(num_features=num_features,
+                             max_sequence_length=self.tokenizer_details.max_sequence_length).build(model_params)
+        elif model_type == 'Hybrid':
+            return HybridModel(num_features=num_features,
+                               max_sequence_length=self.tokenizer_details.max_sequence_length).build(model_params)
+        raise NotImplementedError(f"{model_type} model is currently not supported. "
+                                  f"Please choose between CNN, LSTM and Hybrid")
+
+    def load_prediction_cache(self) -> Optional[PredictionCache]:
+        """ Creates the prediction cache if 'cache_size' is specified, loading cached predictions from
+            'cache_path' if it exists
+        """
+        cache_size = self.config.get('cache_size', 0)
+        if not cache_size:
+            return None
+        if len(self.models) > 1:
+            print(f"[Predictor::load_prediction_cache] Prediction cache only holds predictions of a single model, it "
+                  f"is not used when scoring {len(self.models)} models")
+            return None
+        fingerprint = PredictionCache.make_fingerprint([self.model_path, self.tokenizer_path], self.model_params.model,
+                                                       storage=self.storage)
+        return PredictionCache(fingerprint=fingerprint, max_entries=cache_size, path=self.config.get('cache_path'))
+
     def predict(self, review: np.ndarray):
         """ Takes one value and calculates it's prediction
         Args:
@@ -92,57 +268,222 @@ class Predictor(object):
         """
         result = self.model.predict(np.array([review]))
         result = result[0][0]
-        if result > 0.5:
+        if result > Predictor.THRESHOLD:
             return 1
         else:
             return 0
 
-    def run(self):
-        """ Loads test data and model, and creates predictions
+    def predict_models(self, reviews: np.ndarray) -> Dict[str, np.ndarray]:
+        """ Scores a matrix of reviews through every model, 'batch_size' rows at a time. Every batch is handed to all
+            models at once when there are threads to score them concurrently
+        Args:
+            reviews (np.ndarray): 2D array of reviews in the form of padded sequences of integers
+        Returns:
+            A dictionary from model name to probabilities predicted by the model
         """
-        lines = list(self.test_data['input'])
-        true_labels = []
-        predicted_labels = []
-        
-        if 'labels' in self.test_data.columns:
-            true_labels = list(self.test_data['labels'])
+        probabilities = {name: np.empty(len(reviews), dtype=np.float32) for name in self.models}
+        for start in tqdm(range(0, len(reviews), self.batch_size), desc="Predicting"):
+            batch = reviews[start: start + self.batch_size]
+            for name, result in self.predict_models_on_batch(batch).items():
+                probabilities[name][start: start + len(batch)] = result
+        return probabilities
+
+    def predict_models_on_batch(self, batch: np.ndarray) -> Dict[str, np.ndarray]:
+        """ Scores a single batch of reviews through every model, concurrently when there are threads to do so
+        Args:
+            batch (np.ndarray): 2D array of reviews in the form of padded sequences of integers
+        Returns:
+            A dictionary from model name to probabilities predicted by the model, as a vector
+        """
+        if self.executor is None:
+            results = {name: model.predict_on_batch(batch) for name, model in self.models.items()}
         else:
-            print(f"[Predictor::run] Labels are not found in {self.data_path} file. "
-                  f"Performance metrics and Confusion matrix will not be calculated")
-        
-        lines = self.tokenizer_details.tokenizer.texts_to_sequences(lines)
-        lines = sequence.pad_sequences(lines, maxlen=self.tokenizer_details.max_sequence_length)
+            futures = {name: self.executor.submit(model.predict_on_batch, batch) for name, model in self.models.items()}
+            results = {name: future.result() for name, future in futures.items()}
+        return {name: np.asarray(result)[:, 0] for name, result in results.items()}
+
+    def combine(self, probabilities: Dict[str, np.ndarray]) -> Tuple[np.ndarray, np.ndarray]:
+        """ Combines probabilities of several models according to 'ensemble' of 'predict_params'. 'average' takes the
+            mean probability of the models. 'vote' takes the share of models predicting a positive review, and ties are
+            broken by the mean probability. Probabilities of a single model are returned as they are
+        Args:
+            probabilities (Dict[str, np.ndarray]): dictionary from model name to predicted probabilities
+        Returns:
+            A tuple containing ensemble probabilities and labels predicted from them
+        """
+        stacked = np.stack(list(probabilities.values()))
+        mean = stacked.mean(axis=0)
+        if len(stacked) == 1 or self.ensemble == 'average':
+            return mean, (mean > Predictor.THRESHOLD).astype(np.int64)
+
+        votes = (stacked > Predictor.THRESHOLD).mean(axis=0, dtype=np.float32)
+        labels = np.where(votes == 0.5, mean > Predictor.THRESHOLD, votes > 0.5)
+        return votes, labels.astype(np.int64)
+
+    def predict_batch(self, reviews: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """ Scores a matrix of reviews through the model, or the ensemble of models, 'batch_size' rows at a time
+        Args:
+            reviews (np.ndarray): 2D array of reviews in the form of padded sequences of integers
+        Returns:
+            A tuple containing predicted probabilities and labels obtained by thresholding them
+        """
+        return self.combine(self.predict_models(reviews))
+
+    def tokenize(self, texts: List[str]) -> np.ndarray:
+        """ Converts texts to sequences padded to the maximum sequence length. Both happen in a single pass, so they
+            are recorded as a single stage
+        """
+        with self.instrumentation.stage('sequence_conversion_and_padding', items=len(texts), unit='reviews'):
+            return self.tokenizer.texts_to_padded(texts, maxlen=self.tokenizer_details.max_sequence_length)
+
+    def score(self, test_data: pd.DataFrame):
+        """ Tokenizes, pads and scores reviews of a dataframe, and adds predictions to it as new columns. With a
+            prediction cache, only reviews whose normalized text is not cached are tokenized and scored. With several
+            models, reviews are tokenized once for all of them, and probabilities and predictions of every model are
+            added as '<model>_probabilities' and '<model>_predictions' columns next to the ones of the ensemble
+        Args:
+            test_data (pd.DataFrame): dataframe containing review texts in 'input' column
+        """
+        texts = list(test_data['input'])
+        if self.prediction_cache is None:
+            lines = self.tokenize(texts)
+            with self.instrumentation.stage('prediction', items=len(lines), unit='reviews'):
+                model_probabilities = self.predict_models(lines)
+            probabilities, predicted_labels = self.combine(model_probabilities)
+            if len(model_probabilities) > 1:
+                for name, values in model_probabilities.items():
+                    test_data[f'{name}_probabilities'] = values
+                    test_data[f'{name}_predictions'] = (values > Predictor.THRESHOLD).astype(np.int64)
+        else:
+            with self.instrumentation.stage('cache_lookup', items=len(texts), unit='reviews'):
+                probabilities, missing = self.prediction_cache.lookup([self.tokenizer.normalize(text)
+                                                                       for text in texts])
+            if missing:
+                positions = list(missing.values())
+                lines = self.tokenize([texts[rows[0]] for rows in positions])
+                with self.instrumentation.stage('prediction', items=len(lines), unit='reviews'):
+                    missing_probabilities, _ = self.predict_batch(lines)
+                self.prediction_cache.update(list(missing.keys()), missing_probabilities)
+                for rows, probability in zip(positions, missing_probabilities):
+                    probabilities[rows] = probability
+            predicted_labels = (probabilities > Predictor.THRESHOLD).astype(np.int64)
+
+        test_data['probabilities'] = probabilities
+        test_data['predictions'] = predicted_labels
+
+    def evaluate(self, evaluations: Dict[str, ThresholdEvaluation], output_path: str) -> List[str]:
+        """ Evaluates probabilities of every model at every threshold, and dumps reports to
+            '<result>_evaluation.json' and metrics at every threshold to '<result>_thresholds.csv', next to the result
+            csv file. At most 'max_thresholds' thresholds of every model are written, evenly spaced in rank
+        Args:
+            evaluations (Dict[str, ThresholdEvaluation]): probabilities and labels gathered for every model
+            output_path (str): local path of the result csv file
+        Returns:
+            Local paths of both files
+        """
+        reports, curves = {}, []
+        with self.instrumentation.stage('evaluation', items=next(iter(evaluations.values())).total, unit='reviews'):
+            for name, evaluation in evaluations.items():
+                report, curve = evaluation.evaluate(threshold=Predictor.THRESHOLD)
+                reports[name] = ThresholdEvaluation.to_json(report)
+                curve = ThresholdEvaluation.thin(curve, self.config.get('max_thresholds', 10000))
+                curve.insert(0, 'model', name)
+                curves.append(curve)
+                print(f"[Predictor::evaluate] {name}: ROC AUC {report['roc_auc']:.4f}, PR AUC {report['pr_auc']:.4f}, "
+                      f"expected calibration error {report['expected_calibration_error']:.4f}")
+                if report['best_f1'] is not None:
+                    best = report['best_f1']
+                    print(f"[Predictor::evaluate] {name}: best F1 {best['f1']:.4f} at threshold "
+                          f"{best['threshold']:.4f}, with precision {best['precision']:.4f} and recall "
+                          f"{best['recall']:.4f}")
 
-        for line in tqdm(lines, desc="Predicting"):
-            predicted_labels.append(self.predict(line))
+        evaluation_path = f"{output_path[:-len('.csv')]}_evaluation.json"
+        thresholds_path = f"{output_path[:-len('.csv')]}_thresholds.csv"
+        with open(evaluation_path, 'w') as fstream:
+            json.dump(reports, fstream, indent=2)
+        pd.concat(curves).to_csv(thresholds_path, index=False)
+        print(f"[Predictor::evaluate] Dumped evaluation to {evaluation_path} and {thresholds_path}")
+        return [evaluation_path, thresholds_path]
 
-        self.test_data['predictions'] = predicted_labels
+    def run(self):
+        """ Loads test data and model, and creates predictions. If 'chunk_size' is specified, test data is streamed
+            through the model one chunk at a time and results are appended to the result csv file as they are created
+        """
         if not self.result_path.endswith('.csv'):
             raise ValueError(f"Cannot save result csv file! Specified path {self.result_path} is not a csv file...")
 
+        output_path = self.result_path
         if self.result_path.startswith("gs://"):
-            directory, file_name = os.path.split(self.result_path)
-            self.test_data.to_csv(file_name, index=False)
-            print(f'[Predictor::run] Copying result csv file to Google Storage bucket...')
-            SystemOps.run_command(f"gsutil mv -r {file_name} {self.result_path}")
+            _, output_path = os.path.split(self.result_path)
+        SystemOps.check_and_delete(output_path)
+
+        chunks = self.test_data if self.chunk_size else [self.test_data]
+        # With several models, predictions of every model are in a column of their own and the ones of the ensemble
+        # are in 'predictions' column
+        if len(self.models) > 1:
+            prediction_columns = {name: f'{name}_predictions' for name in self.models}
+            prediction_columns['ensemble'] = 'predictions'
+            probability_columns = {name: f'{name}_probabilities' for name in self.models}
+            probability_columns['ensemble'] = 'probabilities'
         else:
-            self.test_data.to_csv(self.result_path, index=False)
+            prediction_columns = {name: 'predictions' for name in self.models}
+            probability_columns = {name: 'probabilities' for name in self.models}
+        confusion_matrices = {name: RunningConfusionMatrix() for name in prediction_columns}
+        # Probabilities are kept to be evaluated at every threshold once all chunks are scored
+        evaluations = {name: ThresholdEvaluation(num_bins=self.config.get('calibration_bins', 10))
+                       for name in prediction_columns} if self.config.get('evaluate', False) else {}
+        has_labels = True
+        num_reviews = 0
+        start_time = time.perf_counter()
 
-        if len(true_labels) != 0:
-            cm = confusion_matrix(y_true=true_labels, y_pred=predicted_labels)
-            tn, fp, fn, tp = cm.ravel()
-            metrics = {'val_accuracy': (tp + tn) / len(true_labels), 'val_precision': tp / (tp + fp),
-                       'val_recall': tp / (tp + fn), 'val_f1': tp / (tp + 0.5 * (fp + fn))}
+        for idx, chunk in enumerate(chunks):
+            self.score(chunk)
+            num_reviews += len(chunk)
 
-            for key, value in metrics.items():
-                print(f"{key}: {value}")
+            if 'labels' in chunk.columns:
+                for name, column in prediction_columns.items():
+                    confusion_matrices[name].update(y_true=chunk['labels'], y_pred=chunk[column])
+                    if name in evaluations:
+                        evaluations[name].update(y_true=chunk['labels'], y_score=chunk[probability_columns[name]])
+            elif has_labels:
+                has_labels = False
+                print(f"[Predictor::run] Labels are not found in {self.data_path} file. "
+                      f"Performance metrics and Confusion matrix will not be calculated")
+            with self.instrumentation.stage('write_results', items=len(chunk), unit='reviews'):
+                chunk.to_csv(output_path, mode='a', header=(idx == 0), index=False)
 
-    def clean_up(self):
-        """ Cleans up all temporarily created directories while running
-        """
-        SystemOps.check_and_delete(self.data_path)
-        SystemOps.check_and_delete(self.model_path)
-        SystemOps.check_and_delete(self.tokenizer_path)
+        elapsed = time.perf_counter() - start_time
+        print(f"[Predictor::run] Scored {num_reviews} reviews in {elapsed:.2f}s "
+              f"({num_reviews / max(elapsed, 1e-9):.1f} reviews/s)")
+
+        if self.prediction_cache is not None:
+            cache = self.prediction_cache
+            print(f"[Predictor::run] Prediction cache: {cache.hits} hits, {cache.misses} misses "
+                  f"({cache.hits / max(cache.hits + cache.misses, 1):.1%} hit rate)")
+            cache.save()
+
+        evaluation_paths = []
+        if has_labels and evaluations and num_reviews:
+            evaluation_paths = self.evaluate(evaluations, output_path)
+
+        report_path = f"{output_path[:-len('.csv')]}_instrumentation.json"
+        if self.result_path.startswith("gs://"):
+            print(f'[Predictor::run] Copying result csv file to Google Storage bucket...')
+            with self.instrumentation.stage('upload', items=path_size(output_path), unit='bytes'):
+                SystemOps.run_command(f"gsutil mv -r {output_path} {self.result_path}")
+            self.instrumentation.save(report_path)
+            for path in evaluation_paths + [report_path]:
+                SystemOps.run_command(f"gsutil mv {path} {os.path.dirname(self.result_path)}/")
+        else:
+            self.instrumentation.save(report_path)
+
+        for name, confusion_matrix in confusion_matrices.items():
+            if not has_labels or confusion_matrix.total == 0:
+                break
+            if len(confusion_matrices) > 1:
+                print(f"[Predictor::run] Metrics of {name}" + (f" ({self.ensemble})" if name == 'ensemble' else ''))
+            for key, value in confusion_matrix.metrics().items():
+                print(f"{key}: {value}")
 
 
 def main():
@@ -151,13 +492,15 @@ def main():
                         help='A boolean switch to tell the script to run predictor')
     parser.add_argument('--train', action='store_true', required=False,
                         help='A boolean switch to tell the script to run trainer')
+    parser.add_argument('--sweep', action='store_true', required=False,
+                        help='A boolean switch to tell the script to run a hyperparameter sweep over sweep_params')
     parser.add_argument('--config', type=str, required=True,
                         help='Yaml configuration file path')
 
     args = parser.parse_args()
 
-    if not args.train and not args.predict:
-        raise ValueError('Please specify either --train or --predict command line argument while running')
+    if not args.train and not args.sweep and not args.predict:
+        raise ValueError('Please specify either --train, --sweep or --predict command line argument while running')
 
     config = YamlConfig.load(filepath=args.config)
 
@@ -167,11 +510,16 @@ def main():
         trainer.train()
         Trainer.clean_up()
 
+    if args.sweep:
+        print('[main] Initialising hyperparameter sweep')
+        sweep = Sweep(config=config)
+        sweep.run()
+        Trainer.clean_up()
+
     if args.predict:
         print('[main] Initialising testing')
         predictor = Predictor(config=config)
         predictor.run()
-        predictor.clean_up()
 
 
 if __name__ == '__main__':
@@ -0,0 +1,244 @@
+import argparse
+import json
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List, Union
+
+import numpy as np
+
+from detectors.detector import Predictor
+from detectors.tf_gcp.common import YamlConfig
+
+
+class MicroBatcher(object):
+    """ Gathers reviews submitted concurrently by many request threads into micro batches, so that the model is called
+        once per batch instead of once per request. A single background thread waits for the first pending request,
+        then keeps collecting requests until 'max_batch_size' reviews are gathered or 'max_wait_ms' milliseconds have
+        passed, tokenizes all texts of the batch together and scores them in one call of every model. With several
+        models, probabilities are combined the same way as Predictor does, according to 'ensemble'. """
+
+    def __init__(self, predictor: Predictor, max_batch_size: int = 256, max_wait_ms: float = 5):
+        """ Init method
+        Args:
+            predictor (Predictor): predictor whose tokenizer and models are used for scoring
+            max_batch_size (int): maximum number of reviews scored in a single model call
+            max_wait_ms (float): maximum time in milliseconds a batch is held open for more requests
+        """
+        self.predictor = predictor
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000
+        self.max_sequence_length = predictor.tokenizer_details.max_sequence_length
+        self.requests = queue.Queue()
+        self.num_batches = 0
+        self.num_reviews = 0
+        self.thread = threading.Thread(target=self._run, name='MicroBatcher', daemon=True)
+        self.thread.start()
+
+    def submit(self, reviews: List[Union[str, List[int]]]) -> Future:
+        """ Queues reviews of a request for scoring
+        Args:
+            reviews (List[Union[str, List[int]]]): review texts, or reviews already converted to sequences of integers
+        Returns:
+            A future which resolves to a tuple containing predicted probabilities and labels
+        Raises:
+            ValueError: if a review is neither a text nor a sequence of valid word indices. Invalid reviews are
+                        rejected here, since they would otherwise fail the whole batch they end up in
+        """
+        num_features = self.predictor.tokenizer_details.num_features
+        for review in reviews:
+            if isinstance(review, str):
+                continue
+            if not isinstance(review, list) or \
+                    not all(isinstance(index, int) and 0 <= index < num_features for index in review):
+                raise ValueError(f"A review should either be a text or a list of integers in range [0, {num_features})")
+
+        future = Future()
+        self.requests.put((reviews, future))
+        return future
+
+    def stop(self):
+        """ Stops the background thread once pending requests are scored
+        """
+        self.requests.put(None)
+        self.thread.join()
+
+    def _collect(self, first: tuple) -> tuple:
+        """ Collects requests following the first one until the batch is full or the wait time has passed
+        Returns:
+            A tuple containing collected requests and whether the batcher was asked to stop meanwhile
+        """
+        pending = [first]
+        num_reviews = len(first[0])
+        deadline = time.perf_counter() + self.max_wait
+        while num_reviews < self.max_batch_size:
+            timeout = deadline - time.perf_counter()
+            if timeout <= 0:
+                break
+            try:
+                request = self.requests.get(timeout=timeout)
+            except queue.Empty:
+                break
+            if request is None:
+                return pending, True
+            pending.append(request)
+            num_reviews += len(request[0])
+        return pending, False
+
+    def _pad(self, reviews: List[Union[str, List[int]]]) -> np.ndarray:
+        """ Converts a batch of reviews to padded sequences. All texts of the batch are tokenized in a single call
+        """
+        padded = np.zeros((len(reviews), self.max_sequence_length), dtype=np.int32)
+        text_rows = [row for row, review in enumerate(reviews) if isinstance(review, str)]
+        if text_rows:
+            padded[text_rows] = self.predictor.tokenizer.texts_to_padded([reviews[row] for row in text_rows],
+                                                                         maxlen=self.max_sequence_length)
+        for row, review in enumerate(reviews):
+            if not isinstance(review, str) and len(review) > 0:
+                # Same as keras pad_sequences, sequences are truncated from the start and padded at the start
+                review = review[-self.max_sequence_length:]
+                padded[row, self.max_sequence_length - len(review):] = review
+        return padded
+
+    def _score(self, pending: List[tuple]):
+        """ Scores reviews of all pending requests together and resolves their futures
+        """
+        reviews = [review for request_reviews, _ in pending for review in request_reviews]
+        try:
+            padded = self._pad(reviews)
+            model_probabilities = {name: np.empty(len(padded), dtype=np.float32) for name in self.predictor.models}
+            for start in range(0, len(padded), self.max_batch_size):
+                batch = padded[start: start + self.max_batch_size]
+                for name, result in self.predictor.predict_models_on_batch(batch).items():
+                    model_probabilities[name][start: start + len(batch)] = result
+            probabilities, labels = self.predictor.combine(model_probabilities)
+        except Exception as e:
+            for _, future in pending:
+                future.set_exception(e)
+            return
+
+        self.num_batches += 1
+        self.num_reviews += len(reviews)
+        start = 0
+        for request_reviews, future in pending:
+            end = start + len(request_reviews)
+            future.set_result((probabilities[start: end], labels[start: end]))
+            start = end
+
+    def _run(self):
+        stop = False
+        while not stop:
+            first = self.requests.get()
+            if first is None:
+                break
+            pending, stop = self._collect(first)
+            self._score(pending)
+
+
+class PredictionServer(ThreadingHTTPServer):
+    """ An http server which scores reviews with models and a tokenizer loaded once at start up. Requests are handled
+        in separate threads and scored together through a MicroBatcher.
+
+        POST /predict takes the same json body as experiments/ai_platform_deploy/input.json, i.e.
+        {"instances": [{"input": ...}, ...]}, where each input is either a review text or a review already converted
+        to a sequence of integers. It responds with {"predictions": [{"probability": ..., "label": ...}, ...]}, in
+        the same order as instances. GET /health responds with batching statistics. """
+
+    daemon_threads = True
+    # The default backlog of 5 makes connections of concurrent clients wait for tcp retransmission
+    request_queue_size = 128
+
+    def __init__(self, predictor: Predictor, host: str = '0.0.0.0', port: int = 8080, max_batch_size: int = 256,
+                 max_wait_ms: float = 5):
+        """ Init method
+        Args:
+            predictor (Predictor): predictor whose tokenizer and models are used for scoring
+            host (str): address to listen on
+            port (int): port to listen on, 0 picks a free port
+            max_batch_size (int): maximum number of reviews scored in a single model call
+            max_wait_ms (float): maximum time in milliseconds a batch is held open for more requests
+        """
+        super().__init__((host, port), PredictionRequestHandler)
+        self.batcher = MicroBatcher(predictor=predictor, max_batch_size=max_batch_size, max_wait_ms=max_wait_ms)
+
+    def server_close(self):
+        super().server_close()
+        self.batcher.stop()
+
+
+class PredictionRequestHandler(BaseHTTPRequestHandler):
+
+    def _send_json(self, status: int, body: Dict):
+        content = json.dumps(body).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(content)))
+        self.end_headers()
+        self.wfile.write(content)
+
+    def do_GET(self):
+        if self.path != '/health':
+            self._send_json(404, {'error': f"Unknown path {self.path}"})
+            return
+        batcher = self.server.batcher
+        self._send_json(200, {'status': 'ok', 'batches': batcher.num_batches, 'reviews': batcher.num_reviews})
+
+    def do_POST(self):
+        if self.path != '/predict':
+            self._send_json(404, {'error': f"Unknown path {self.path}"})
+            return
+
+        try:
+            body = json.loads(self.rfile.read(int(self.headers.get('Content-Length', 0))))
+            reviews = [instance['input'] for instance in body['instances']]
+            future = self.server.batcher.submit(reviews) if reviews else None
+        except (ValueError, KeyError, TypeError) as e:
+            self._send_json(400, {'error': f"Invalid request body: {e}"})
+            return
+
+        if future is None:
+            self._send_json(200, {'predictions': []})
+            return
+
+        try:
+            probabilities, labels = future.result()
+        except Exception as e:
+            self._send_json(500, {'error': str(e)})
+            return
+        self._send_json(200, {'predictions': [{'probability': float(probability), 'label': int(label)}
+                                              for probability, label in zip(probabilities, labels)]})
+
+    def log_message(self, format: str, *args):
+        # Logging every request slows the server down considerably under load
+        pass
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--config', type=str, required=True,
+                        help='Yaml configuration file path')
+    args = parser.parse_args()
+
+    config = YamlConfig.load(filepath=args.config)
+    serve_params = config.get('serve_params', {})
+
+    print('[main] Loading model and tokenizer')
+    predictor = Predictor(config=config, load_test_data=False)
+    server = PredictionServer(predictor=predictor,
+                              host=serve_params.get('host', '0.0.0.0'),
+                              port=serve_params.get('port', 8080),
+                              max_batch_size=serve_params.get('max_batch_size', 256),
+                              max_wait_ms=serve_params.get('max_wait_ms', 5))
+    print(f"[main] Serving predictions on http://{server.server_address[0]}:{server.server_address[1]}/predict")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == '__main__':
+    main()
@@ -1,38 +1,369 @@
 import importlib
+import json
 import os
+import queue
+import shutil
+import tempfile
+import threading
 
-from typing import Dict, Union
-from tensorflow.keras.callbacks import Callback
+from typing import Dict, List, Optional, Union
+import tensorflow as tf
+from tensorflow.keras.callbacks import BackupAndRestore, Callback
 
 from detectors.tf_gcp.data_ops.io_ops import LocalIO, CloudIO
+from detectors.tf_gcp.data_ops.storage import Storage
+from detectors.tf_gcp.instrumentation import Instrumentation
 
 
 class GCSCallback(Callback):
     """ A custom callback created to copy checkpoints created by ModelCheckpoint callback to GCS bucket.
         ModelCheckpoint writes to a local directory called 'checkpoints' and this custom callback will check
-        this directory at the end of every epoch and if any checkpoints are found, they are copied to GCS bucket """
+        this directory at the end of every epoch and copy new or changed checkpoints to GCS bucket.
 
-    def __init__(self, cp_path: str, io_operator: Union[LocalIO, CloudIO]):
+        A manifest records size and modification time of every synced checkpoint, so earlier checkpoints are not
+        uploaded again. Uploads run on a background thread, so the next epoch starts right away. A checkpoint rewritten
+        while it is being uploaded no longer matches its manifest entry and is uploaded again at the next epoch or at
+        the end of training, when remaining uploads are flushed and the destination is checked against the manifest.
+        With 'keep_best', only that many checkpoints with the best 'monitor' value are kept at the destination.
+
+        The manifest is uploaded after every batch of uploads. A resumed run loads it, along with checkpoints at the
+        destination it doesn't list, which were uploaded right before the run was interrupted. Their score is unknown,
+        so 'keep_best' deletes them before any checkpoint it has a score of. """
+
+    CHECKPOINT_DIR = './checkpoints'
+    MANIFEST_FILE = 'sync_manifest.json'
+
+    def __init__(self, cp_path: str, io_operator: Union[LocalIO, CloudIO], keep_best: Optional[int] = None,
+                 monitor: str = 'val_loss', mode: str = 'min', resume: bool = False,
+                 storage: Optional[Storage] = None):
         """ init method
         Args:
             cp_path (str): GCS/Local path to checkpoints directory
             io_operator (Union[LocalIO, CloudIO]): an operator which contains functions to copy or move from
                                                    one path to other
+            keep_best (Optional[int]): number of checkpoints kept at 'cp_path', all of them if not given
+            monitor (str): metric checkpoints are ranked by when 'keep_best' is given
+            mode (str): 'min' if lower values of 'monitor' are better, 'max' otherwise
+            resume (bool): if True, checkpoints an interrupted run already synced to 'cp_path' are loaded when training
+                           begins
+            storage (Optional[Storage]): storage the manifest of an interrupted run is read from
         """
         super(GCSCallback, self).__init__()
+        if mode not in ('min', 'max'):
+            raise ValueError(f"'mode' of GCSCallback should either be 'min' or 'max', not {mode}")
         self.checkpoint_path = cp_path
         self.io_operator = io_operator
+        self.keep_best = keep_best
+        self.monitor = monitor
+        self.mode = mode
+        self.resume = resume
+        self.storage = storage or Storage()
+        # checkpoint file name -> size, modification time, epoch and score it was written with, and sync state
+        self.manifest = {}
+        self.lock = threading.Lock()
+        self.uploads = queue.Queue()
+        self.worker = None
+        self.errors = []
+        self.last_logs = {}
+        self.synced = True
+
+    def on_train_begin(self, logs=None):
+        if self.resume:
+            self._load_synced()
+        self.worker = threading.Thread(target=self._upload_forever, name='GCSCallback', daemon=True)
+        self.worker.start()
 
     def on_epoch_end(self, epoch, logs=None):
-        for cp_file in os.listdir('./checkpoints'):
-            src_path = os.path.join('./checkpoints', cp_file)
-            self.io_operator.write(src_path=src_path, dest_path=self.checkpoint_path, use_system_cmd=False)
+        self.last_logs = dict(logs or {})
+        changed = self._scan(epoch=epoch + 1, logs=self.last_logs)
+        if changed:
+            self.uploads.put(changed)
+
+    def on_train_end(self, logs=None):
+        """ Uploads checkpoints written since the last epoch, waits for all uploads, and checks that the destination
+            holds every synced checkpoint
+        """
+        changed = self._scan(epoch=None, logs=self.last_logs)
+        if changed:
+            self.uploads.put(changed)
+        if self.worker is not None:
+            self.uploads.put(None)
+            self.worker.join()
+            self.worker = None
+
+        missing = self._verify()
+        self.synced = not self.errors and not missing
+        if self.synced:
+            num_synced = sum(1 for entry in self.manifest.values() if not entry['pruned'])
+            print(f"[GCSCallback::on_train_end] {num_synced} checkpoints synced to {self.checkpoint_path}")
+        else:
+            # Training itself succeeded, so the trained model is still saved and uploaded
+            print(f"[GCSCallback::on_train_end] ERROR: checkpoints {missing} did not reach {self.checkpoint_path}. "
+                  f"Upload errors: {[repr(error) for error in self.errors]}")
+
+        self._upload_manifest()
+
+    def _load_synced(self):
+        """ Loads the manifest of the interrupted run being resumed, keeping checkpoints which are still at the
+            destination, and adds the ones at the destination which it doesn't list
+        """
+        remote = self.io_operator.list_files(self.checkpoint_path)
+        manifest = {}
+        if GCSCallback.MANIFEST_FILE in remote:
+            manifest = json.loads(self.storage.read_bytes(os.path.join(self.checkpoint_path,
+                                                                       GCSCallback.MANIFEST_FILE)))
+        with self.lock:
+            for cp_file, (size, _) in remote.items():
+                if cp_file == GCSCallback.MANIFEST_FILE:
+                    continue
+                entry = manifest.get(cp_file)
+                if entry is None or entry['pruned'] or entry['size'] != size:
+                    entry = {'size': size, 'mtime_ns': None, 'epoch': None, 'score': None, 'pruned': False}
+                self.manifest[cp_file] = {**entry, 'synced': True}
+        unscored = sum(1 for entry in self.manifest.values() if entry['score'] is None)
+        print(f"[GCSCallback::_load_synced] Resuming with {len(self.manifest)} checkpoints at "
+              f"{self.checkpoint_path}, {unscored} of them without a score")
+
+    def _upload_manifest(self):
+        """ Writes the manifest and uploads it next to the checkpoints
+        """
+        with self.lock:
+            with open(GCSCallback.MANIFEST_FILE, 'w') as fstream:
+                json.dump(self.manifest, fstream, indent=2)
+        self.io_operator.write(GCSCallback.MANIFEST_FILE, self.checkpoint_path, use_system_cmd=False)
+
+    def _scan(self, epoch: Optional[int], logs: Dict) -> List[str]:
+        """ Finds checkpoints which are new or changed since they were last synced, and records them in the manifest
+        Args:
+            epoch (Optional[int]): epoch which just ended, None at the end of training
+            logs (Dict): logs of the epoch, holding the metric checkpoints are ranked by
+        Returns:
+            Names of checkpoints to be uploaded
+        """
+        if not os.path.isdir(GCSCallback.CHECKPOINT_DIR):
+            return []
+        changed = []
+        with self.lock:
+            for cp_file in sorted(os.listdir(GCSCallback.CHECKPOINT_DIR)):
+                stat = os.stat(os.path.join(GCSCallback.CHECKPOINT_DIR, cp_file))
+                entry = self.manifest.get(cp_file)
+                if entry is not None and (entry['size'], entry['mtime_ns']) == (stat.st_size, stat.st_mtime_ns):
+                    continue
+                score = logs.get(self.monitor)
+                self.manifest[cp_file] = {
+                    'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns,
+                    'epoch': epoch if epoch is not None else (entry or {}).get('epoch'),
+                    'score': float(score) if score is not None else None, 'synced': False, 'pruned': False}
+                changed.append(cp_file)
+        return changed
+
+    def _upload_forever(self):
+        """ Uploads batches of checkpoints queued by on_epoch_end until None is queued
+        """
+        while True:
+            cp_files = self.uploads.get()
+            if cp_files is None:
+                return
+            for cp_file in cp_files:
+                try:
+                    src_path = os.path.join(GCSCallback.CHECKPOINT_DIR, cp_file)
+                    self.io_operator.write(src_path=src_path, dest_path=self.checkpoint_path, use_system_cmd=False)
+                    with self.lock:
+                        self.manifest[cp_file]['synced'] = True
+                except Exception as error:
+                    self.errors.append(error)
+            try:
+                self._prune()
+                self._upload_manifest()
+            except Exception as error:
+                self.errors.append(error)
+
+    def _prune(self):
+        """ Deletes synced checkpoints beyond the 'keep_best' best ones from the destination. Checkpoints loaded
+            from an interrupted run without a score rank below all others
+        """
+        if self.keep_best is None:
+            return
+        with self.lock:
+            ranked = sorted((entry['score'], cp_file) for cp_file, entry in self.manifest.items()
+                            if entry['synced'] and not entry['pruned'] and entry['score'] is not None)
+            unscored = sorted(cp_file for cp_file, entry in self.manifest.items()
+                              if entry['synced'] and not entry['pruned'] and entry['score'] is None
+                              and entry['mtime_ns'] is None)
+        if self.mode == 'max':
+            ranked.reverse()
+        ranked = [cp_file for _, cp_file in ranked] + unscored
+        for cp_file in ranked[self.keep_best:]:
+            self.io_operator.delete(os.path.join(self.checkpoint_path, cp_file))
+            with self.lock:
+                self.manifest[cp_file]['pruned'] = True
+            print(f"[GCSCallback::_prune] Deleted {cp_file} from {self.checkpoint_path}, it is not among the "
+                  f"{self.keep_best} best checkpoints by {self.monitor}")
+
+    def _verify(self) -> List[str]:
+        """ Checks that every synced checkpoint which wasn't pruned is at the destination with the right size
+        Returns:
+            Names of checkpoints which are missing or differ
+        """
+        remote = self.io_operator.list_files(self.checkpoint_path)
+        return [cp_file for cp_file, entry in self.manifest.items()
+                if not entry['pruned'] and (not entry['synced'] or remote.get(cp_file, (None,))[0] != entry['size'])]
+
+
+class InstrumentationCallback(Callback):
+    """ Records every epoch as a stage of an Instrumentation, and adds its wall time, CPU time and peak resident
+        memory to the epoch logs, so that callbacks running after it, like CSVLogger and TensorBoard, record them
+        too """
+
+    def __init__(self, instrumentation: Instrumentation):
+        """ Init method
+        Args:
+            instrumentation (Instrumentation): instrumentation epochs are recorded in
+        """
+        super(InstrumentationCallback, self).__init__()
+        self.instrumentation = instrumentation
+        self.record = None
+
+    def on_epoch_begin(self, epoch, logs=None):
+        self.record = self.instrumentation.start(f"epoch_{epoch + 1}", items=self.params.get('steps'),
+                                                 unit='batches')
+
+    def on_epoch_end(self, epoch, logs=None):
+        record = self.instrumentation.stop(self.record)
+        if logs is not None:
+            logs.update({'epoch_wall_seconds': record['wall_seconds'], 'epoch_cpu_seconds': record['cpu_seconds'],
+                         'epoch_peak_rss_mb': record['peak_rss_mb']})
+
+
+class MedianStoppingCallback(Callback):
+    """ Stops a trial of a hyperparameter sweep once the best value of 'monitor' it reached is worse than the median of
+        the best values other trials had reached after as many epochs (median stopping rule). Trials share the values
+        of 'monitor' they reach through a json file each in 'progress_dir', so that trials running in other processes
+        and trials which are already over are compared alike. """
+
+    def __init__(self, progress_dir: str, trial: str, monitor: str = 'val_accuracy', mode: str = 'max',
+                 grace_epochs: int = 1, min_trials: int = 3):
+        """ Init method
+        Args:
+            progress_dir (str): local directory shared by all trials of the sweep
+            trial (str): name of this trial
+            monitor (str): metric trials are compared by
+            mode (str): 'min' if lower values of 'monitor' are better, 'max' otherwise
+            grace_epochs (int): number of epochs every trial runs for before it can be stopped
+            min_trials (int): number of other trials which have to have run as many epochs for a trial to be stopped
+        """
+        super(MedianStoppingCallback, self).__init__()
+        if mode not in ('min', 'max'):
+            raise ValueError(f"'mode' of MedianStoppingCallback should either be 'min' or 'max', not {mode}")
+        self.progress_path = os.path.join(progress_dir, f"{trial}.json")
+        self.progress_dir = progress_dir
+        self.monitor = monitor
+        self.mode = mode
+        self.best = max if mode == 'max' else min
+        self.grace_epochs = grace_epochs
+        self.min_trials = min_trials
+        self.values = []
+        self.stopped_epoch = None
+
+    def _others(self, num_epochs: int) -> List[float]:
+        """ Best values other trials reached in their first 'num_epochs' epochs, for trials which ran that many
+        """
+        values = []
+        for name in os.listdir(self.progress_dir):
+            path = os.path.join(self.progress_dir, name)
+            if path == self.progress_path or not name.endswith('.json'):
+                continue
+            with open(path) as fstream:
+                progress = json.load(fstream)
+            if len(progress) >= num_epochs:
+                values.append(self.best(progress[:num_epochs]))
+        return values
+
+    def on_epoch_end(self, epoch, logs=None):
+        if not logs or logs.get(self.monitor) is None:
+            return
+        self.values.append(float(logs[self.monitor]))
+        # Written next to the file and renamed, so that other trials never read half of it
+        with open(f"{self.progress_path}.tmp", 'w') as fstream:
+            json.dump(self.values, fstream)
+        os.replace(f"{self.progress_path}.tmp", self.progress_path)
+
+        if epoch + 1 <= self.grace_epochs:
+            return
+        others = sorted(self._others(epoch + 1))
+        if len(others) < self.min_trials:
+            return
+        median = (others[(len(others) - 1) // 2] + others[len(others) // 2]) / 2
+        best = self.best(self.values)
+        if (best >= median) if self.mode == 'max' else (best <= median):
+            return
+        print(f"[MedianStoppingCallback::on_epoch_end] Stopping after epoch {epoch + 1}, best {self.monitor} "
+              f"{best:.4f} is worse than the median {median:.4f} of {len(others)} other trials")
+        self.stopped_epoch = epoch + 1
+        self.model.stop_training = True
+
+
+class TrainingStateCallback(BackupAndRestore):
+    """ Backs up model weights, optimizer state and the number of epochs done to 'backup_dir' at the end of every epoch,
+        and restores them when training starts again after the process was killed, so that model.fit carries on from
+        the epoch after the last backed up one instead of starting over. The backup is deleted once training is over.
+
+        ModelCheckpoint checkpoints only hold weights, hence this separate backup. Train logs written by CSVLogger are
+        copied to 'out_dir' after every epoch as well, so that a resumed run appends to them. The number of epochs done
+        is also written to EPOCHS_FILE in 'backup_dir', which Trainer reads to pass 'initial_epoch' to model.fit. """
+
+    STATE_DIR = 'training_state'
+    EPOCHS_FILE = 'epochs.json'
+
+    def __init__(self, backup_dir: str, io_operator: Union[LocalIO, CloudIO], out_dir: str,
+                 logs_path: Optional[str] = None, chief: bool = True):
+        """ Init method
+        Args:
+            backup_dir (str): GCS/Local directory of the backup, which tensorflow writes to directly
+            io_operator (Union[LocalIO, CloudIO]): an operator which contains functions to copy or move from
+                                                   one path to other
+            out_dir (str): Directory where output artifacts of the trainer are to be dumped
+            logs_path (Optional[str]): local csv file of CSVLogger, None if there is none or on workers of distributed
+                                       training other than the chief
+            chief (bool): False for workers of distributed training other than the chief, which don't write EPOCHS_FILE
+        """
+        super(TrainingStateCallback, self).__init__(backup_dir=backup_dir)
+        self.io_operator = io_operator
+        self.out_dir = out_dir
+        self.logs_path = logs_path
+        self.chief = chief
+
+    def on_epoch_end(self, epoch, logs=None):
+        super(TrainingStateCallback, self).on_epoch_end(epoch, logs)
+        if self.chief:
+            # Next to the backup, which tensorflow writes to GCS directly too
+            with tf.io.gfile.GFile(os.path.join(self.backup_dir, TrainingStateCallback.EPOCHS_FILE), 'w') as fstream:
+                json.dump({'epochs': epoch + 1}, fstream)
+        if self.logs_path is None or not os.path.isfile(self.logs_path):
+            return
+        # LocalIO moves what it writes, and CSVLogger keeps its file open, so a copy is written instead
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            shutil.copy(self.logs_path, tmp_dir)
+            self.io_operator.write(os.path.join(tmp_dir, os.path.basename(self.logs_path)), self.out_dir,
+                                   use_system_cmd=False)
+
+    def on_train_end(self, logs=None):
+        super(TrainingStateCallback, self).on_train_end(logs)
+        # Tensorflow only deletes the directory it backs up to, which may be inside 'backup_dir'
+        if self.chief:
+            try:
+                tf.io.gfile.rmtree(self.backup_dir)
+            except tf.errors.NotFoundError:
+                pass
 
 
 class CallBacksCreator(object):
+    # Callbacks which write logs, and are left to the chief in distributed training
+    LOGGING_CALLBACKS = ('CSVLogger', 'TensorBoard')
 
     @staticmethod
-    def get_callbacks(callbacks_config: Dict, model_type: str, io_operator: Union[LocalIO, CloudIO], out_dir: str):
+    def get_callbacks(callbacks_config: Dict, model_type: str, io_operator: Union[LocalIO, CloudIO], out_dir: str,
+                      instrumentation: Optional[Instrumentation] = None, chief: bool = True, resume: bool = False):
         """ creates callbacks
         Args:
             callbacks_config (Dict): a dictionary containing callback configurations.
@@ -40,13 +371,27 @@ class CallBacksCreator(object):
             io_operator (Union[LocalIO, CloudIO]): an operator which contains functions to copy or move from
                                                    one path to other.
             out_dir (str): Directory where output artifacts of the trainer are to be dumped.
+            instrumentation (Optional[Instrumentation]): if given, epochs are recorded in it. Its callback comes
+                                                         first, so that other callbacks see epoch timings in logs
+            chief (bool): False for workers of distributed training other than the chief, which get no logging
+                          callbacks and don't upload checkpoints. They still run ModelCheckpoint, since saving a
+                          distributed model takes every worker, and EarlyStopping, so that they stop training along
+                          with the chief
+            resume (bool): if True, training state is backed up to 'training_state' in 'out_dir' by
+                           TrainingStateCallback, and restored from it if it is already there. All workers of
+                           distributed training get this callback
         Returns:
             A list containing created callback objects
         """
         callbacks = []
+        if instrumentation is not None and chief:
+            callbacks.append(InstrumentationCallback(instrumentation=instrumentation))
         module = importlib.import_module('tensorflow.keras.callbacks')
         cp_path = os.path.join(out_dir, 'checkpoints')
         for cb in callbacks_config:
+            if cb == 'GCSCallback' or (not chief and cb in CallBacksCreator.LOGGING_CALLBACKS):
+                continue
+
             if cb == 'ModelCheckpoint':
                 _, filename = os.path.split(callbacks_config[cb]['filepath'])
                 callbacks_config[cb]['filepath'] = os.path.join('./checkpoints',
@@ -61,6 +406,15 @@ class CallBacksCreator(object):
 
             obj = getattr(module, cb)
             callbacks.append(obj(**callbacks_config[cb]))
-        gcs_callback = GCSCallback(cp_path=cp_path, io_operator=io_operator)
+        if resume:
+            # Comes after CSVLogger, which has written the row of an epoch by the time its logs are copied
+            logs_path = callbacks_config['CSVLogger']['filename'] if chief and 'CSVLogger' in callbacks_config else None
+            callbacks.append(TrainingStateCallback(backup_dir=os.path.join(out_dir, TrainingStateCallback.STATE_DIR),
+                                                   io_operator=io_operator, out_dir=out_dir, logs_path=logs_path,
+                                                   chief=chief))
+        if not chief:
+            return callbacks
+        gcs_callback = GCSCallback(cp_path=cp_path, io_operator=io_operator, resume=resume,
+                                   **(callbacks_config.get('GCSCallback') or {}))
         callbacks.append(gcs_callback)
         return callbacks
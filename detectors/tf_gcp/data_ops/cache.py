@@ -0,0 +1,142 @@
+import hashlib
+import json
+import os
+import shutil
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+from detectors.tf_gcp.common import SystemOps
+from detectors.tf_gcp.data_ops.storage import Storage
+
+
+class PreprocessCache(object):
+    """ An on-disk cache of preprocessed datasets. Each entry is a directory named after a hash of the input files and
+        preprocessing settings, containing one .npy file per array and the tokenizer artifact. Arrays are memory
+        mapped when loaded, and least recently used entries are evicted once the cache grows beyond its size limit """
+
+    TOKENIZER_FILE = 'tokenizer.json'
+
+    def __init__(self, cache_dir: str, max_size_gb: float = 50):
+        """ Init method
+        Args:
+            cache_dir (str): local directory in which cache entries are stored
+            max_size_gb (float): maximum total size of the cache in gigabytes
+        """
+        self.cache_dir = os.path.expanduser(cache_dir)
+        self.max_size = int(max_size_gb * 1024 ** 3)
+        os.makedirs(self.cache_dir, exist_ok=True)
+
+    @staticmethod
+    def make_key(input_files: List[str], storage: Optional[Storage] = None, **settings) -> str:
+        """ Creates a key from contents of input files and preprocessing settings
+        Args:
+            input_files (List[str]): paths of files preprocessing reads from. Files in Google Cloud Storage are
+                                     identified by their md5 checksums, so that they aren't downloaded to make the key
+            storage (Optional[Storage]): storage checksums of files in Google Cloud Storage are read from
+            settings: any json serializable settings which affect preprocessing output
+        Returns:
+            A hex digest identifying the cache entry
+        """
+        digest = hashlib.sha256()
+        for path in input_files:
+            digest.update(os.path.basename(path).encode())
+            if Storage.is_remote(path):
+                digest.update(json.dumps((storage or Storage()).checksums(path), sort_keys=True).encode())
+                continue
+            with open(path, 'rb') as fstream:
+                for block in iter(lambda: fstream.read(1 << 20), b''):
+                    digest.update(block)
+        digest.update(json.dumps(settings, sort_keys=True).encode())
+        return digest.hexdigest()
+
+    def _entry_dir(self, key: str) -> str:
+        return os.path.join(self.cache_dir, key)
+
+    def load(self, key: str) -> Optional[Tuple[Dict[str, np.ndarray], str]]:
+        """ Loads a cache entry
+        Args:
+            key (str): key created by make_key
+        Returns:
+            None if the entry doesn't exist, otherwise a tuple containing a dictionary of read only memory mapped arrays
+            and path to the tokenizer artifact
+        """
+        entry_dir = self._entry_dir(key)
+        if not os.path.isdir(entry_dir):
+            return None
+
+        arrays = {}
+        for file_name in os.listdir(entry_dir):
+            if file_name.endswith('.npy'):
+                arrays[file_name[:-len('.npy')]] = np.load(os.path.join(entry_dir, file_name), mmap_mode='r')
+
+        # Modification time of the entry directory marks when it was last used
+        os.utime(entry_dir)
+        return arrays, os.path.join(entry_dir, PreprocessCache.TOKENIZER_FILE)
+
+    @staticmethod
+    def entry_of(arrays: Dict[str, np.ndarray]) -> Optional[str]:
+        """ Finds the entry directory arrays were loaded from, so that other processes can memory map the same files
+        Args:
+            arrays (Dict[str, np.ndarray]): arrays by name, as returned by load
+        Returns:
+            Path of the entry directory, None unless every array is memory mapped from the .npy file named after it in
+            a single directory
+        """
+        entry_dirs = set()
+        for name, array in arrays.items():
+            if not isinstance(array, np.memmap) or os.path.basename(array.filename or '') != f"{name}.npy":
+                return None
+            # Slices of memory mapped arrays are memory mapped from the same file too
+            if array.shape != np.load(array.filename, mmap_mode='r').shape:
+                return None
+            entry_dirs.add(os.path.dirname(array.filename))
+        return entry_dirs.pop() if len(entry_dirs) == 1 else None
+
+    def store(self, key: str, arrays: Dict[str, np.ndarray], tokenizer_path: str) -> Tuple[Dict[str, np.ndarray], str]:
+        """ Stores arrays and tokenizer artifact as a cache entry, then evicts old entries if required
+        Args:
+            key (str): key created by make_key
+            arrays (Dict[str, np.ndarray]): arrays to be stored, by name
+            tokenizer_path (str): path to tokenizer artifact to be stored along with arrays
+        Returns:
+            Stored entry, same as returned by load
+        """
+        # Entry is written to a temporary directory and renamed at the end, so a crash never leaves a partial entry
+        tmp_dir = os.path.join(self.cache_dir, f".{key}.{os.getpid()}.tmp")
+        SystemOps.clean_dir(tmp_dir)
+        for name, array in arrays.items():
+            np.save(os.path.join(tmp_dir, f"{name}.npy"), array)
+        shutil.copy(tokenizer_path, os.path.join(tmp_dir, PreprocessCache.TOKENIZER_FILE))
+
+        try:
+            os.rename(tmp_dir, self._entry_dir(key))
+        except OSError:
+            # Another run stored the same entry in the meantime
+            SystemOps.check_and_delete(tmp_dir)
+
+        self.evict(keep=key)
+        return self.load(key)
+
+    def evict(self, keep: Optional[str] = None):
+        """ Deletes least recently used entries until total size of the cache is within its limit
+        Args:
+            keep (Optional[str]): key of an entry which must not be evicted
+        """
+        entries = []
+        for key in os.listdir(self.cache_dir):
+            entry_dir = self._entry_dir(key)
+            if key.startswith('.') or not os.path.isdir(entry_dir):
+                continue
+            size = sum(os.path.getsize(os.path.join(entry_dir, f)) for f in os.listdir(entry_dir))
+            entries.append((os.path.getmtime(entry_dir), key, size))
+
+        total_size = sum(size for _, _, size in entries)
+        for _, key, size in sorted(entries):
+            if total_size <= self.max_size:
+                break
+            if key == keep:
+                continue
+            print(f"[PreprocessCache::evict] Evicting cache entry {key}")
+            SystemOps.check_and_delete(self._entry_dir(key))
+            total_size -= size
@@ -1,34 +1,145 @@
-from typing import Dict
+import threading
+from typing import Dict, Optional
 
 import numpy as np
-from google.cloud.storage import Bucket
 from tensorflow import keras
 
+from detectors.tf_gcp.data_ops.sequences import RaggedSequences
+
+
+class BatchBuffers(object):
+    """ Preallocated flat buffers which batches are padded into, so that no new matrix is allocated for every batch.
+        Keras keeps up to 'max_queue_size' prepared batches in a queue, and tensors created from numpy arrays may share
+        their memory, so a buffer must not be reused while the batch in it is still waiting. Each thread therefore
+        cycles through its own ring of buffers, which has to be longer than that queue. """
+
+    def __init__(self, size: int, num_buffers: int = 16):
+        """ Init Method
+        Args:
+            size (int): number of values each buffer can hold
+            num_buffers (int): number of buffers in the ring of every thread
+        """
+        self.size = size
+        self.num_buffers = num_buffers
+        self._local = threading.local()
+
+    def __getstate__(self):
+        """ Thread local storage can't be pickled. Every process allocates its own buffers
+        """
+        state = self.__dict__.copy()
+        del state['_local']
+        return state
+
+    def __setstate__(self, state: Dict):
+        self.__dict__.update(state)
+        self._local = threading.local()
+
+    def next(self) -> np.ndarray:
+        """ Returns the next buffer of the ring of calling thread
+        """
+        local = self._local
+        if not hasattr(local, 'buffers'):
+            local.buffers = []
+            local.position = 0
+        if len(local.buffers) < self.num_buffers:
+            local.buffers.append(np.empty(self.size, dtype=np.int32))
+        buffer = local.buffers[local.position]
+        local.position = (local.position + 1) % self.num_buffers
+        return buffer
+
 
 class DataGenerator(keras.utils.Sequence):
 
-    def __init__(self, input_text: np.ndarray, labels: np.ndarray, batch_size: int):
+    def __init__(self, sequences: RaggedSequences, labels: np.ndarray, batch_size: int, max_sequence_length: int,
+                 num_buffers: int = 16):
         """ Init Method
         Args:
-            input_text (np.array): numpy array of input texts
-            labels (np.array): labels associated with filenames
+            sequences (RaggedSequences): unpadded tokenized texts
+            labels (np.array): labels associated with sequences, as a uint8 vector
             batch_size (int): batch size of model
+            max_sequence_length (int): length to which every sequence is padded
+            num_buffers (int): number of reused batch buffers per thread, must exceed 'max_queue_size' of model.fit
         """
-        self.input = input_text
+        self.sequences = sequences
         self.labels = labels
         self.batch_size = batch_size
+        self.max_sequence_length = max_sequence_length
+        self.buffers = BatchBuffers(size=batch_size * max_sequence_length, num_buffers=num_buffers)
+
+    def __len__(self):
+        return int(np.ceil(len(self.sequences) / float(self.batch_size)))
+
+    def __getitem__(self, idx: int):
+        """ Creates a batch of padded sequences and associated labels and returns it
+        Args:
+            idx (int): index of the batch
+        Returns:
+            A batch of tokenized text and labels associated with it
+        """
+        indices = np.arange(idx * self.batch_size, min((idx + 1) * self.batch_size, len(self.sequences)))
+        batch_x = self.sequences.pad(indices, length=self.max_sequence_length, out=self.buffers.next())
+        # Labels of a batch are contiguous, so this is a view and not a copy
+        batch_y = self.labels[indices[0]: indices[-1] + 1].reshape(-1, 1)
+        return batch_x, batch_y
+
+
+class BucketedDataGenerator(keras.utils.Sequence):
+    """ Creates batches out of sequences of similar lengths, and pads every batch only up to the length of its longest
+        sequence instead of a fixed maximum length. Sequences are sorted by length and split into buckets holding
+        roughly the same number of sequences. Batches are formed within buckets, and both bucket contents and the
+        order of batches are shuffled at the end of every epoch. """
+
+    # Pooling layers halve the sequence length, so batches are never padded to less than this
+    MIN_LENGTH = 8
+
+    def __init__(self, sequences: RaggedSequences, labels: np.ndarray, batch_size: int, num_buckets: int = 10,
+                 shuffle: bool = True, seed: Optional[int] = None, num_buffers: int = 16):
+        """ Init Method
+        Args:
+            sequences (RaggedSequences): unpadded tokenized texts
+            labels (np.array): labels associated with sequences
+            batch_size (int): batch size of model
+            num_buckets (int): number of length buckets
+            shuffle (bool): whether batches are to be reshuffled at the end of every epoch
+            seed (Optional[int]): seed for shuffling
+            num_buffers (int): number of reused batch buffers per thread, must exceed 'max_queue_size' of model.fit
+        """
+        self.sequences = sequences
+        self.labels = labels
+        self.batch_size = batch_size
+        self.shuffle = shuffle
+        self.rng = np.random.default_rng(seed)
+        max_length = max(int(sequences.lengths.max(initial=0)), BucketedDataGenerator.MIN_LENGTH)
+        self.buffers = BatchBuffers(size=batch_size * max_length, num_buffers=num_buffers)
+
+        order = np.argsort(sequences.lengths, kind='stable')
+        self.buckets = [bucket for bucket in np.array_split(order, min(num_buckets, len(order))) if len(bucket)]
+        self.batches = []
+        self.on_epoch_end()
+
+    def on_epoch_end(self):
+        """ Reshuffles sequences within each bucket, splits buckets into batches and shuffles the order of batches
+        """
+        batches = []
+        for bucket in self.buckets:
+            if self.shuffle:
+                bucket = self.rng.permutation(bucket)
+            batches += [bucket[start: start + self.batch_size] for start in range(0, len(bucket), self.batch_size)]
+        if self.shuffle:
+            batches = [batches[i] for i in self.rng.permutation(len(batches))]
+        self.batches = batches
 
     def __len__(self):
-        return (np.ceil(len(self.input) / float(self.batch_size))).astype(np.int)
+        return len(self.batches)
 
     def __getitem__(self, idx: int):
-        """ Creates a batch of images and associated labels and returns it
+        """ Creates a batch of dynamically padded sequences and associated labels and returns it
         Args:
-            idx (int): index from which to start the batch
+            idx (int): index of the batch
         Returns:
             A batch of tokenized text and labels associated with it
         """
-        batch_x = self.input[idx * self.batch_size: (idx + 1) * self.batch_size]
-        batch_y = self.labels[idx * self.batch_size: (idx + 1) * self.batch_size]
-        batch_y = [[i] for i in batch_y]
-        return np.array(batch_x), np.array(batch_y)
+        indices = self.batches[idx]
+        batch_x = self.sequences.pad(indices, min_length=BucketedDataGenerator.MIN_LENGTH, out=self.buffers.next())
+        batch_y = self.labels[indices].reshape(-1, 1)
+        return batch_x, batch_y
@@ -0,0 +1,101 @@
+from typing import Optional, Tuple
+
+import numpy as np
+import tensorflow as tf
+
+from detectors.tf_gcp.data_ops.sequences import RaggedSequences
+
+
+class SequenceDataset(object):
+    """ Builds a tf.data input pipeline over ragged sequences and labels, as an alternative to the keras Sequence
+        generators. Only indices of sequences go through tf.data: they are shuffled with a buffer of 'shuffle_buffer'
+        indices, batched, and every batch is gathered and padded by numpy on tf.data's own threads, with prefetching
+        overlapping it with training. Nothing is pickled or sent to other processes, and arrays are never converted to
+        tensors as a whole, so memory mapped arrays of the preprocessing cache are read from disk only as batches need
+        them.
+
+        With 'size', the dataset is padded with empty reviews up to that many reviews, and batches come with sample
+        weights, 0 for padding reviews. Workers of distributed training pad their shards to the same size, so that
+        they all take the same number of steps through them. """
+
+    # Pooling layers halve the sequence length, so batches are never padded to less than this
+    MIN_LENGTH = 8
+
+    def __init__(self, sequences: RaggedSequences, labels: np.ndarray, batch_size: int,
+                 max_sequence_length: Optional[int] = None, shuffle_buffer: int = 0, seed: Optional[int] = None,
+                 size: Optional[int] = None, weight: float = 1.0):
+        """ Init Method
+        Args:
+            sequences (RaggedSequences): unpadded tokenized texts, possibly memory mapped
+            labels (np.array): labels associated with sequences, as a uint8 vector
+            batch_size (int): batch size of model
+            max_sequence_length (Optional[int]): length to which every sequence is padded. If not given, every batch is
+                                                 padded to its longest sequence
+            shuffle_buffer (int): number of indices sequences are drawn from at random, 0 keeps them in order. The
+                                  whole dataset fits in a buffer as large as it, smaller buffers keep reads of memory
+                                  mapped arrays closer together
+            seed (Optional[int]): seed for shuffling
+            size (Optional[int]): number of reviews the dataset is padded to with zero weight reviews, at least the
+                                  number of sequences. If given, batches come with sample weights
+            weight (float): sample weight of actual reviews when 'size' is given
+        """
+        if size is not None and size < len(sequences):
+            raise ValueError(f"'size' should be at least the number of sequences, {len(sequences)}, not {size}")
+        self.sequences = sequences
+        self.labels = labels
+        self.batch_size = batch_size
+        self.max_sequence_length = max_sequence_length
+        self.shuffle_buffer = shuffle_buffer
+        self.seed = seed
+        self.size = size
+        self.weight = weight
+
+    def _gather(self, indices: np.ndarray) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """ Creates a batch of padded sequences, associated labels and sample weights
+        Args:
+            indices (np.ndarray): indices of sequences in the batch, indices past the last sequence are padding reviews
+        """
+        # Sorted so that reads from memory mapped arrays move forward through the file, and padding reviews come last
+        indices = np.sort(indices)
+        reviews = indices[:np.searchsorted(indices, len(self.sequences))]
+        if self.max_sequence_length is None:
+            batch_x = self.sequences.pad(reviews, min_length=SequenceDataset.MIN_LENGTH).astype(np.int32)
+        else:
+            batch_x = self.sequences.pad(reviews, length=self.max_sequence_length,
+                                         out=np.empty(len(indices) * self.max_sequence_length, dtype=np.int32))
+        batch_y = np.asarray(self.labels[reviews], dtype=np.uint8).reshape(-1, 1)
+        weights = np.full(len(reviews), self.weight, dtype=np.float32)
+        if len(reviews) < len(indices):
+            num_padding = len(indices) - len(reviews)
+            batch_x = np.concatenate([batch_x, np.zeros((num_padding, batch_x.shape[1]), dtype=np.int32)])
+            batch_y = np.concatenate([batch_y, np.zeros((num_padding, 1), dtype=np.uint8)])
+            weights = np.concatenate([weights, np.zeros(num_padding, dtype=np.float32)])
+        return batch_x, batch_y, weights
+
+    def _load_batch(self, indices: tf.Tensor) -> Tuple[tf.Tensor, ...]:
+        batch_x, batch_y, weights = tf.numpy_function(self._gather, [indices], [tf.int32, tf.uint8, tf.float32])
+        batch_x.set_shape([None, self.max_sequence_length])
+        batch_y.set_shape([None, 1])
+        if self.size is None:
+            return batch_x, batch_y
+        weights.set_shape([None])
+        return batch_x, batch_y, weights
+
+    def build(self, repeat: bool = False) -> tf.data.Dataset:
+        """ Creates the dataset
+        Args:
+            repeat (bool): whether the dataset repeats forever, which model.fit needs when 'steps_per_epoch' is given.
+                           Otherwise every iteration over it is one epoch, reshuffled every time
+        Returns:
+            A dataset of batches of padded sequences and labels, and sample weights if 'size' is given
+        """
+        size = len(self.sequences) if self.size is None else self.size
+        dataset = tf.data.Dataset.range(size)
+        if self.shuffle_buffer:
+            dataset = dataset.shuffle(max(min(self.shuffle_buffer, size), 1), seed=self.seed,
+                                      reshuffle_each_iteration=True)
+        if repeat:
+            dataset = dataset.repeat()
+        dataset = dataset.batch(self.batch_size)
+        dataset = dataset.map(self._load_batch, num_parallel_calls=tf.data.AUTOTUNE)
+        return dataset.prefetch(tf.data.AUTOTUNE)
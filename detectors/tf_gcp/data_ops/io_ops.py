@@ -1,6 +1,10 @@
 import abc
+import base64
+import hashlib
 import os
-from typing import Optional
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional, Tuple
 
 import numpy as np
 from io import BytesIO
@@ -23,7 +27,17 @@ class IO(abc.ABC):
         self.bucket = bucket
 
     @abc.abstractmethod
-    def write(self, src_path: str, dest_path: str):
+    def write(self, src_path: str, dest_path: str, use_system_cmd: bool = True):
+        """ This method does not require implementation inside abstract class"""
+        ...
+
+    @abc.abstractmethod
+    def list_files(self, dest_path: str) -> Dict[str, Tuple[int, Optional[str]]]:
+        """ This method does not require implementation inside abstract class"""
+        ...
+
+    @abc.abstractmethod
+    def delete(self, path: str):
         """ This method does not require implementation inside abstract class"""
         ...
 
@@ -40,19 +54,45 @@ class LocalIO(IO):
         """
         super(LocalIO, self).__init__()
 
-    def write(self, src_path: str, dest_path: str):
-        SystemOps.move(src_path=src_path, dst_path=dest_path)
+    def write(self, src_path: str, dest_path: str, use_system_cmd: bool = True):
+        """ Moves files/folders into a local directory, creating it if needed and replacing files/folders of the same
+            name in it. 'use_system_cmd' is accepted for compatibility with CloudIO and ignored
+        """
+        os.makedirs(dest_path, exist_ok=True)
+        target_path = os.path.join(dest_path, os.path.basename(src_path.rstrip('/')))
+        SystemOps.check_and_delete(target_path)
+        SystemOps.move(src_path=src_path, dst_path=target_path)
+
+    def list_files(self, dest_path: str) -> Dict[str, Tuple[int, Optional[str]]]:
+        """ Lists files in a local directory, including subdirectories
+        Returns:
+            A dictionary from path relative to 'dest_path' to file size and None, since checksums aren't calculated
+        """
+        return {os.path.relpath(os.path.join(root, name), dest_path): (os.path.getsize(os.path.join(root, name)), None)
+                for root, _, names in os.walk(dest_path) for name in names}
+
+    def delete(self, path: str):
+        SystemOps.check_and_delete(path)
 
 
 class CloudIO(IO):
-    """ To perform IO operations from/to Google Cloud Storage"""
+    """ To perform IO operations from/to Google Cloud Storage. Files are uploaded concurrently by a pool of threads
+        sharing the client of the bucket, and files whose size and md5 checksum already match the destination object
+        are skipped, so uploading a directory again only sends what changed. """
 
-    def __init__(self, bucket: Bucket):
+    # Files larger than this are uploaded in chunks through a resumable upload session, so that a failure only
+    # retries the current chunk. Chunk size has to be a multiple of 256KB
+    RESUMABLE_THRESHOLD = 8 * 1024 * 1024
+    RESUMABLE_CHUNK_SIZE = 32 * 1024 * 1024
+
+    def __init__(self, bucket: Bucket, max_workers: int = 8):
         """ Init method
         Args:
             bucket (Bucket): Google Cloud Storage bucket name
+            max_workers (int): maximum number of files uploaded concurrently
         """
         super(CloudIO, self).__init__(bucket=bucket)
+        self.max_workers = max_workers
 
     @staticmethod
     def load_npy(file_name: str):
@@ -70,39 +110,115 @@ class CloudIO(IO):
     def copy_from_gcs(src_path: str, dest_path: str):
         SystemOps.run_command(f'gsutil -m cp -r {src_path} {dest_path}')
 
-    def upload_file_to_gcs(self, src_path: str, dest_path: str):
-        """ Uploads file to Google Cloud Storage
+    @staticmethod
+    def md5_checksum(path: str) -> str:
+        """ Calculates md5 checksum of a local file, base64 encoded like the md5 hash of Google Cloud Storage objects
+        """
+        digest = hashlib.md5()
+        with open(path, 'rb') as fstream:
+            for block in iter(lambda: fstream.read(1 << 20), b''):
+                digest.update(block)
+        return base64.b64encode(digest.digest()).decode('ascii')
+
+    def relative_path(self, path: str) -> str:
+        """ Returns path inside the bucket of an absolute Google Cloud Storage path
+        """
+        if path.startswith('gs://'):
+            return path.split(f"{self.bucket.name}/", 1)[1]
+        return path
+
+    def list_objects(self, prefix: str) -> Dict[str, Tuple[int, Optional[str]]]:
+        """ Lists objects in the bucket whose names start with prefix
+        Returns:
+            A dictionary from object name to its size and md5 hash
+        """
+        return {blob.name: (blob.size, blob.md5_hash) for blob in self.bucket.list_blobs(prefix=prefix)}
+
+    def upload_file_to_gcs(self, src_path: str, dest_path: str,
+                           existing: Optional[Dict[str, Tuple[int, Optional[str]]]] = None) -> bool:
+        """ Uploads file to Google Cloud Storage, unless an object with the same size and md5 checksum already exists
         Args:
             src_path (str): path in local file system
             dest_path (str): path in Google Cloud Storage Bucket
+            existing (Optional[Dict[str, Tuple[int, Optional[str]]]]): objects returned by list_objects for a prefix of
+                                                                       dest_path. Listed here if not given
         Returns:
+            Whether the file was uploaded
         """
-        blob = self.bucket.blob(dest_path)
+        if existing is None:
+            existing = self.list_objects(prefix=dest_path)
+        size = os.path.getsize(src_path)
+        remote_size, remote_md5 = existing.get(dest_path, (None, None))
+        # Composite objects have no md5 hash, they are always uploaded again
+        if remote_size == size and remote_md5 is not None and remote_md5 == CloudIO.md5_checksum(src_path):
+            return False
+
+        chunk_size = CloudIO.RESUMABLE_CHUNK_SIZE if size > CloudIO.RESUMABLE_THRESHOLD else None
+        blob = self.bucket.blob(dest_path, chunk_size=chunk_size)
         blob.upload_from_filename(src_path)
+        return True
+
+    def upload_files(self, files: List[Tuple[str, str]], prefix: str) -> Tuple[int, int]:
+        """ Uploads files concurrently, skipping the ones which are unchanged
+        Args:
+            files (List[Tuple[str, str]]): pairs of local path and path in Google Cloud Storage Bucket
+            prefix (str): common prefix of all destination paths, used to list existing objects in a single request
+        Returns:
+            A tuple containing number of uploaded files and number of skipped files
+        """
+        start_time = time.perf_counter()
+        existing = self.list_objects(prefix=prefix)
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            futures = [executor.submit(self.upload_file_to_gcs, src_path, dest_path, existing)
+                       for src_path, dest_path in files]
+            # Waits for all uploads before raising the first error, if any
+            uploaded = [future.exception() or future.result() for future in futures]
+        for result in uploaded:
+            if isinstance(result, BaseException):
+                raise result
+
+        num_uploaded = sum(uploaded)
+        print(f"[CloudIO::upload_files] Uploaded {num_uploaded} files, skipped {len(files) - num_uploaded} unchanged "
+              f"files in {time.perf_counter() - start_time:.2f}s")
+        return num_uploaded, len(files) - num_uploaded
 
     def copy_directory_to_gcs(self, local_path: str, gcs_path: str):
-        """ Copies a directory's contents to Google Cloud Storage
+        """ Copies a directory's contents, including subdirectories, to Google Cloud Storage
         Args:
             local_path (str): path in local file system
             gcs_path (str): path in Google Cloud Storage Bucket
         Returns:
         """
-        for local_file in os.listdir(local_path):
-            l_file = os.path.join(local_path, local_file)
-            if not os.path.isfile(l_file):
-                continue
+        files = []
+        for root, _, names in os.walk(local_path):
+            for name in sorted(names):
+                l_file = os.path.join(root, name)
+                # Create path to file system inside GCS
+                remote_path = os.path.join(gcs_path, os.path.relpath(l_file, local_path))
+                files.append((l_file, remote_path))
+        self.upload_files(files, prefix=gcs_path.rstrip('/') + '/')
+
+    def list_files(self, dest_path: str) -> Dict[str, Tuple[int, Optional[str]]]:
+        """ Lists objects under a Google Cloud Storage directory
+        Returns:
+            A dictionary from object path relative to 'dest_path' to its size and md5 hash
+        """
+        prefix = self.relative_path(dest_path).rstrip('/') + '/'
+        return {name[len(prefix):]: details for name, details in self.list_objects(prefix=prefix).items()}
 
-            # Create path to file system inside GCS
-            remote_path = os.path.join(gcs_path, local_file)
-            self.upload_file_to_gcs(src_path=l_file, dest_path=remote_path)
+    def delete(self, path: str):
+        """ Deletes an object from Google Cloud Storage
+        """
+        self.bucket.blob(self.relative_path(path)).delete()
 
     def write(self, src_path: str, dest_path: str, use_system_cmd: bool = True):
         """ Writes files/folders to Google Cloud Storage
         Args:
             src_path (str): path in local file system
             dest_path (str): path in Google Cloud Storage
-            use_system_cmd (bool): a boolean switch to inform whether to use GCS modules or system commands to write
-                                   to GCS
+            use_system_cmd (bool): a boolean switch to inform whether to move files with gsutil, or to upload them
+                                   with GCS modules through the pool of threads. Local files are only removed with
+                                   gsutil
         Returns:
         """
         if use_system_cmd:
@@ -113,11 +229,10 @@ class CloudIO(IO):
             raise ValueError('Please provide the bucket object to copy file to GCS')
 
         # Get relative path inside bucket from absolute path of file/directory in Google Cloud Storage
-        if dest_path.startswith('gs://'):
-            dest_path = dest_path.split(f"{self.bucket.name}/")[1]
+        dest_path = self.relative_path(dest_path)
 
-        dest_path = os.path.join(dest_path, os.path.basename(src_path))
+        dest_path = os.path.join(dest_path, os.path.basename(src_path.rstrip('/')))
         if os.path.isfile(src_path):
-            self.upload_file_to_gcs(src_path=src_path, dest_path=dest_path)
+            self.upload_files([(src_path, dest_path)], prefix=dest_path)
         else:
             self.copy_directory_to_gcs(local_path=src_path, gcs_path=dest_path)
@@ -0,0 +1,129 @@
+import base64
+import hashlib
+import os
+import shutil
+import threading
+import time
+from typing import Iterator, Optional
+
+
+class LocalBlob(object):
+    """ An object of a LocalBucket, stored as a file under the root directory of the bucket """
+
+    def __init__(self, bucket: 'LocalBucket', name: str, chunk_size: Optional[int] = None):
+        """ Init method
+        Args:
+            bucket (LocalBucket): bucket the object belongs to
+            name (str): name of the object
+            chunk_size (Optional[int]): size of chunks of resumable uploads, recorded but otherwise unused
+        """
+        self.bucket = bucket
+        self.name = name
+        self.chunk_size = chunk_size
+
+    @property
+    def path(self) -> str:
+        return os.path.join(self.bucket.root, self.name)
+
+    @property
+    def size(self) -> Optional[int]:
+        return os.path.getsize(self.path) if os.path.isfile(self.path) else None
+
+    @property
+    def md5_hash(self) -> Optional[str]:
+        """ Base64 encoded md5 digest of the contents, like the one of Google Cloud Storage objects
+        """
+        if not os.path.isfile(self.path):
+            return None
+        with open(self.path, 'rb') as fstream:
+            return base64.b64encode(hashlib.md5(fstream.read()).digest()).decode('ascii')
+
+    def upload_from_filename(self, filename: str):
+        """ Copies a local file to the object, taking as long as the bucket's latency and bandwidth say
+        """
+        size = os.path.getsize(filename)
+        self.bucket.wait(size)
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        # Copied to a temporary file first, so that readers never see a partially written object
+        tmp_path = f"{self.path}.{os.getpid()}.{id(self)}.tmp"
+        shutil.copyfile(filename, tmp_path)
+        os.replace(tmp_path, self.path)
+        with self.bucket.lock:
+            self.bucket.num_uploads += 1
+            self.bucket.uploaded_bytes += size
+
+    def download_as_bytes(self, start: Optional[int] = None, end: Optional[int] = None) -> bytes:
+        """ Reads the object, or the range of it from 'start' to 'end' inclusive, taking as long as the bucket's latency
+            and bandwidth say
+        """
+        start = start or 0
+        with open(self.path, 'rb') as fstream:
+            fstream.seek(start)
+            content = fstream.read(-1 if end is None else end - start + 1)
+        self.bucket.wait(len(content))
+        with self.bucket.lock:
+            self.bucket.num_downloads += 1
+            self.bucket.downloaded_bytes += len(content)
+        return content
+
+    def delete(self):
+        self.bucket.wait()
+        os.remove(self.path)
+
+
+class LocalBucket(object):
+    """ A stand-in for google.cloud.storage.Bucket backed by a local directory, implementing the subset of its
+        interface used by CloudIO and Storage. Every request can be delayed by a fixed latency and transfers can be
+        limited to a bandwidth per stream, so that the relative cost of sequential and concurrent transfers resembles
+        the one against Google Cloud Storage. Meant for trying out and benchmarking transfers without a bucket. """
+
+    def __init__(self, root: str, name: str = 'local-bucket', latency: float = 0.0,
+                 bandwidth: Optional[float] = None):
+        """ Init method
+        Args:
+            root (str): directory holding the objects
+            name (str): name of the bucket
+            latency (float): time in seconds added to every request
+            bandwidth (Optional[float]): bandwidth of a single stream in bytes per second, unlimited if not given
+        """
+        self.root = root
+        self.name = name
+        self.latency = latency
+        self.bandwidth = bandwidth
+        self.num_requests = 0
+        self.num_uploads = 0
+        self.uploaded_bytes = 0
+        self.num_downloads = 0
+        self.downloaded_bytes = 0
+        self.lock = threading.Lock()
+        os.makedirs(root, exist_ok=True)
+
+    def wait(self, size: int = 0):
+        """ Simulates the time taken by a request transferring 'size' bytes
+        """
+        with self.lock:
+            self.num_requests += 1
+        delay = self.latency + (size / self.bandwidth if self.bandwidth else 0)
+        if delay > 0:
+            time.sleep(delay)
+
+    def blob(self, blob_name: str, chunk_size: Optional[int] = None) -> LocalBlob:
+        return LocalBlob(bucket=self, name=blob_name, chunk_size=chunk_size)
+
+    def get_blob(self, blob_name: str) -> Optional[LocalBlob]:
+        self.wait()
+        blob = self.blob(blob_name)
+        return blob if blob.size is not None else None
+
+    def list_blobs(self, prefix: Optional[str] = None) -> Iterator[LocalBlob]:
+        """ Lists objects whose names start with prefix, in a single request
+        """
+        self.wait()
+        prefix = prefix or ''
+        names = []
+        for root, _, files in os.walk(self.root):
+            for name in files:
+                blob_name = os.path.relpath(os.path.join(root, name), self.root)
+                if blob_name.startswith(prefix) and not blob_name.endswith('.tmp'):
+                    names.append(blob_name)
+        return iter([self.blob(name) for name in sorted(names)])
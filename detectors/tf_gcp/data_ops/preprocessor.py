@@ -0,0 +1,296 @@
+from collections import Counter, deque
+from multiprocessing import Pool
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+
+import numpy as np
+from tensorflow.keras.preprocessing.text import Tokenizer, text_to_word_sequence
+
+from detectors.tf_gcp.data_ops.sequences import RaggedSequences
+from detectors.tf_gcp.tokenizer import FastTokenizer
+from detectors.tf_gcp.vocabulary import HeavyHittersVocabulary
+
+# Tokenizer used by worker processes of ParallelPreprocessor.texts_to_padded and texts_to_ragged, set once per worker
+# by the pool
+_worker_tokenizer = None
+# Vocabulary whose candidates are counted by worker processes of ParallelPreprocessor.recount_chunks
+_worker_vocabulary = None
+
+
+def _count_words(args: Tuple) -> Tuple[Dict[str, int], Dict[str, int], int, int]:
+    """ Counts words of a shard of texts the same way keras Tokenizer.fit_on_texts does
+    Args:
+        args (Tuple): texts of the shard, filters, lower and split settings of the tokenizer, and optionally a maximum
+                      sequence length
+    Returns:
+        A tuple containing word counts and document counts of words, both in order of first appearance, the number of
+        texts and the total number of words of the texts, counting at most the maximum sequence length of words per
+        text
+    """
+    texts, filters, lower, split, maxlen = args if len(args) == 5 else args + (None,)
+    word_counts = Counter()
+    word_docs = Counter()
+    num_words = 0
+    for text in texts:
+        seq = text_to_word_sequence(text, filters=filters, lower=lower, split=split)
+        word_counts.update(seq)
+        word_docs.update(set(seq))
+        num_words += len(seq) if maxlen is None else min(len(seq), maxlen)
+    return word_counts, word_docs, len(texts), num_words
+
+
+def _init_worker(tokenizer: FastTokenizer):
+    global _worker_tokenizer
+    _worker_tokenizer = tokenizer
+
+
+def _init_vocabulary_worker(vocabulary: HeavyHittersVocabulary):
+    global _worker_vocabulary
+    _worker_vocabulary = vocabulary
+
+
+def _candidates_shard(texts: List[str]) -> Counter:
+    """ Counts candidates of the vocabulary of the worker process in a shard of texts
+    """
+    return _worker_vocabulary.count_candidates(texts)
+
+
+def _pad_shard(args: Tuple) -> np.ndarray:
+    """ Converts a shard of texts to padded sequences using the tokenizer of the worker process
+    Args:
+        args (Tuple): texts of the shard and length of padded sequences
+    """
+    texts, maxlen = args
+    return _worker_tokenizer.texts_to_padded(texts, maxlen=maxlen)
+
+
+def _ragged_shard(args: Tuple) -> RaggedSequences:
+    """ Converts a shard of texts to ragged sequences using the tokenizer of the worker process
+    Args:
+        args (Tuple): texts of the shard, maximum length of sequences and type of word indices
+    """
+    texts, maxlen, dtype = args
+    return _worker_tokenizer.texts_to_ragged(texts, maxlen=maxlen, dtype=dtype)
+
+
+class ParallelPreprocessor(object):
+    """ Fits tokenizers and converts texts to padded sequences on a pool of worker processes. Texts are split into
+        contiguous shards and results are merged back in shard order, so the outcome is identical to the serial one """
+
+    def __init__(self, workers: int = 1, shards_per_worker: int = 4):
+        """ Init method
+        Args:
+            workers (int): number of worker processes, 1 runs everything in the current process
+            shards_per_worker (int): number of shards each worker gets on average, more shards balance load better
+        """
+        self.workers = max(int(workers), 1)
+        self.shards_per_worker = shards_per_worker
+
+    def _shard(self, texts: List[str]) -> List[List[str]]:
+        """ Splits texts into contiguous shards
+        Args:
+            texts (List[str]): input texts
+        Returns:
+            A list of shards which concatenate back to input texts
+        """
+        num_shards = max(min(self.workers * self.shards_per_worker, len(texts)), 1)
+        bounds = np.linspace(0, len(texts), num_shards + 1).astype(int)
+        return [texts[start: end] for start, end in zip(bounds[:-1], bounds[1:])]
+
+    def fit_on_texts(self, tokenizer: Tokenizer, texts: List[str]):
+        """ Updates vocabulary of a keras tokenizer from texts, same as tokenizer.fit_on_texts(texts)
+        Args:
+            tokenizer (Tokenizer): keras tokenizer to be fitted
+            texts (List[str]): input texts
+        """
+        if self.workers == 1:
+            tokenizer.fit_on_texts(texts)
+            return
+
+        if tokenizer.char_level or tokenizer.analyzer is not None:
+            raise ValueError("Character level tokenizers and tokenizers with custom analyzers are not supported")
+
+        shards = [(shard, tokenizer.filters, tokenizer.lower, tokenizer.split) for shard in self._shard(texts)]
+        with Pool(processes=self.workers) as pool:
+            results = pool.map(_count_words, shards)
+        for word_counts, word_docs, _, _ in results:
+            ParallelPreprocessor._merge_counts(tokenizer, word_counts, word_docs)
+        tokenizer.document_count += len(texts)
+        ParallelPreprocessor._build_word_index(tokenizer)
+
+    @staticmethod
+    def _merge_counts(tokenizer: Tokenizer, word_counts: Dict[str, int], word_docs: Dict[str, int]):
+        """ Adds counts of a shard to a keras tokenizer
+        """
+        # Shards are merged in order, so words enter word_counts in order of their first appearance in whole of
+        # texts. Keras relies on this order to break ties between words with equal counts.
+        for word, count in word_counts.items():
+            tokenizer.word_counts[word] = tokenizer.word_counts.get(word, 0) + count
+        for word, count in word_docs.items():
+            tokenizer.word_docs[word] += count
+
+    @staticmethod
+    def _build_word_index(tokenizer: Tokenizer):
+        """ Builds word index of a keras tokenizer from its counts. Same as the end of keras Tokenizer.fit_on_texts
+        """
+        wcounts = list(tokenizer.word_counts.items())
+        wcounts.sort(key=lambda x: x[1], reverse=True)
+        sorted_voc = [] if tokenizer.oov_token is None else [tokenizer.oov_token]
+        sorted_voc.extend(wc[0] for wc in wcounts)
+        tokenizer.word_index = dict(zip(sorted_voc, list(range(1, len(sorted_voc) + 1))))
+        tokenizer.index_word = {c: w for w, c in tokenizer.word_index.items()}
+        for word, count in list(tokenizer.word_docs.items()):
+            tokenizer.index_docs[tokenizer.word_index[word]] = count
+
+    def _imap(self, pool: Optional[Pool], func: Callable, iterable: Iterable) -> Iterator:
+        """ Maps a function over an iterable in order, on the pool if there is one. Unlike Pool.imap, at most two tasks
+            per worker are submitted ahead of the results being consumed, so inputs are read only as fast as they are
+            processed
+        """
+        if pool is None:
+            yield from map(func, iterable)
+            return
+        pending = deque()
+        for item in iterable:
+            pending.append(pool.apply_async(func, (item,)))
+            if len(pending) >= 2 * self.workers:
+                yield pending.popleft().get()
+        while pending:
+            yield pending.popleft().get()
+
+    def fit_on_chunks(self, tokenizer: Tokenizer, chunks: Iterable[List[str]],
+                      maxlen: Optional[int] = None) -> Tuple[int, int]:
+        """ Updates vocabulary of a keras tokenizer from texts arriving in chunks, same as fitting it on all of them at
+            once. Only a few chunks are held in memory at a time
+        Args:
+            tokenizer (Tokenizer): keras tokenizer to be fitted
+            chunks (Iterable[List[str]]): chunks of input texts
+            maxlen (Optional[int]): maximum length of sequences the texts are later converted to
+        Returns:
+            A tuple containing number of texts and number of words in them, counting at most 'maxlen' words per text.
+            The latter bounds the number of values of ragged sequences the texts are converted to
+        """
+        if tokenizer.char_level or tokenizer.analyzer is not None:
+            raise ValueError("Character level tokenizers and tokenizers with custom analyzers are not supported")
+
+        num_texts = 0
+        num_words = 0
+        settings = (tokenizer.filters, tokenizer.lower, tokenizer.split, maxlen)
+        pool = Pool(processes=self.workers) if self.workers > 1 else None
+        try:
+            for word_counts, word_docs, chunk_texts, chunk_words in self._imap(
+                    pool, _count_words, ((texts, *settings) for texts in chunks)):
+                ParallelPreprocessor._merge_counts(tokenizer, word_counts, word_docs)
+                num_texts += chunk_texts
+                num_words += chunk_words
+        finally:
+            if pool is not None:
+                pool.terminate()
+        tokenizer.document_count += num_texts
+        ParallelPreprocessor._build_word_index(tokenizer)
+        return num_texts, num_words
+
+    def sketch_chunks(self, vocabulary: HeavyHittersVocabulary, chunks: Iterable[List[str]],
+                      maxlen: Optional[int] = None) -> Tuple[int, int]:
+        """ First pass of a heavy hitters vocabulary, adds word counts of texts arriving in chunks to its summary.
+            Chunks are counted on the pool and added to the summary in order
+        Args:
+            vocabulary (HeavyHittersVocabulary): vocabulary being built
+            chunks (Iterable[List[str]]): chunks of input texts
+            maxlen (Optional[int]): maximum length of sequences the texts are later converted to
+        Returns:
+            A tuple containing number of texts and number of words in them, same as fit_on_chunks
+        """
+        num_texts = 0
+        num_words = 0
+        settings = (vocabulary.filters, vocabulary.lower, vocabulary.split, maxlen)
+        pool = Pool(processes=self.workers) if self.workers > 1 else None
+        try:
+            for word_counts, _, chunk_texts, chunk_words in self._imap(
+                    pool, _count_words, ((texts, *settings) for texts in chunks)):
+                vocabulary.update(word_counts)
+                num_texts += chunk_texts
+                num_words += chunk_words
+        finally:
+            if pool is not None:
+                pool.terminate()
+        return num_texts, num_words
+
+    def recount_chunks(self, vocabulary: HeavyHittersVocabulary, chunks: Iterable[List[str]]):
+        """ Second pass of a heavy hitters vocabulary, counts its candidates exactly in texts arriving in chunks. It
+            has to follow vocabulary.start_recount()
+        Args:
+            vocabulary (HeavyHittersVocabulary): vocabulary being built
+            chunks (Iterable[List[str]]): chunks of input texts, the same ones as in the first pass
+        """
+        if self.workers == 1:
+            for texts in chunks:
+                vocabulary.add_counts(vocabulary.count_candidates(texts))
+            return
+
+        pool = Pool(processes=self.workers, initializer=_init_vocabulary_worker, initargs=(vocabulary,))
+        try:
+            for counts in self._imap(pool, _candidates_shard, chunks):
+                vocabulary.add_counts(counts)
+        finally:
+            pool.terminate()
+
+    def texts_to_padded(self, tokenizer: FastTokenizer, texts: List[str], maxlen: int) -> np.ndarray:
+        """ Converts texts to padded sequences, same as tokenizer.texts_to_padded(texts, maxlen)
+        Args:
+            tokenizer (FastTokenizer): tokenizer to be used
+            texts (List[str]): input texts
+            maxlen (int): length of every sequence in output matrix
+        Returns:
+            An int32 matrix of shape (len(texts), maxlen)
+        """
+        if self.workers == 1:
+            return tokenizer.texts_to_padded(texts, maxlen=maxlen)
+
+        padded = np.empty((len(texts), maxlen), dtype=np.int32)
+        row = 0
+        with Pool(processes=self.workers, initializer=_init_worker, initargs=(tokenizer,)) as pool:
+            for shard in pool.imap(_pad_shard, [(shard, maxlen) for shard in self._shard(texts)]):
+                padded[row: row + len(shard)] = shard
+                row += len(shard)
+        return padded
+
+    def texts_to_ragged(self, tokenizer: FastTokenizer, texts: List[str], maxlen: int,
+                        dtype: type = np.int32) -> RaggedSequences:
+        """ Converts texts to ragged sequences, same as tokenizer.texts_to_ragged(texts, maxlen, dtype)
+        Args:
+            tokenizer (FastTokenizer): tokenizer to be used
+            texts (List[str]): input texts
+            maxlen (int): maximum length of a sequence
+            dtype (type): integer type of word indices in the output
+        Returns:
+            RaggedSequences object with one sequence per text
+        """
+        if self.workers == 1:
+            return tokenizer.texts_to_ragged(texts, maxlen=maxlen, dtype=dtype)
+
+        with Pool(processes=self.workers, initializer=_init_worker, initargs=(tokenizer,)) as pool:
+            parts = list(pool.imap(_ragged_shard, [(shard, maxlen, dtype) for shard in self._shard(texts)]))
+        return RaggedSequences.concatenate(parts)
+
+    def iter_ragged(self, tokenizer: FastTokenizer, chunks: Iterable[List[str]], maxlen: int,
+                    dtype: type = np.int32) -> Iterator[RaggedSequences]:
+        """ Converts texts arriving in chunks to ragged sequences, one chunk at a time. Only a few chunks are held in
+            memory at a time
+        Args:
+            tokenizer (FastTokenizer): tokenizer to be used
+            chunks (Iterable[List[str]]): chunks of input texts
+            maxlen (int): maximum length of a sequence
+            dtype (type): integer type of word indices in the output
+        Returns:
+            An iterator over RaggedSequences objects, one per chunk
+        """
+        if self.workers == 1:
+            for texts in chunks:
+                yield tokenizer.texts_to_ragged(texts, maxlen=maxlen, dtype=dtype)
+            return
+
+        pool = Pool(processes=self.workers, initializer=_init_worker, initargs=(tokenizer,))
+        try:
+            yield from self._imap(pool, _ragged_shard, ((texts, maxlen, dtype) for texts in chunks))
+        finally:
+            pool.terminate()
@@ -0,0 +1,87 @@
+from typing import List, Optional
+
+import numpy as np
+
+
+class RaggedSequences(object):
+    """ Variable length sequences of word indices stored back to back in a single flat array, along with offsets at
+        which each sequence starts (CSR layout). Sequence i is values[offsets[i]: offsets[i + 1]]. Compared to a
+        matrix padded to the maximum sequence length, only the actual words are stored, and values can be kept in a
+        narrow integer type such as uint16. """
+
+    def __init__(self, values: np.ndarray, offsets: np.ndarray):
+        """ Init method
+        Args:
+            values (np.ndarray): word indices of all sequences, concatenated
+            offsets (np.ndarray): start offset of every sequence in values, followed by len(values)
+        """
+        self.values = values
+        self.offsets = offsets
+
+    @classmethod
+    def from_lengths(cls, values: np.ndarray, lengths: np.ndarray) -> 'RaggedSequences':
+        """ Creates ragged sequences from concatenated values and length of each sequence
+        Args:
+            values (np.ndarray): word indices of all sequences, concatenated
+            lengths (np.ndarray): length of each sequence
+        """
+        offsets = np.zeros(len(lengths) + 1, dtype=np.int64)
+        np.cumsum(lengths, out=offsets[1:])
+        return cls(values=values, offsets=offsets)
+
+    @classmethod
+    def concatenate(cls, parts: List['RaggedSequences']) -> 'RaggedSequences':
+        """ Joins ragged sequences one after the other
+        Args:
+            parts (List[RaggedSequences]): sequences to be joined, all having values of the same type
+        """
+        return cls.from_lengths(values=np.concatenate([part.values for part in parts]),
+                                lengths=np.concatenate([part.lengths for part in parts]))
+
+    def __len__(self) -> int:
+        return len(self.offsets) - 1
+
+    @property
+    def lengths(self) -> np.ndarray:
+        return np.diff(self.offsets)
+
+    def slice(self, start: int, stop: int) -> 'RaggedSequences':
+        """ Sequences start to stop, sharing values with these sequences instead of copying them
+        Args:
+            start (int): index of first sequence
+            stop (int): index after the last sequence
+        """
+        return RaggedSequences(values=self.values, offsets=self.offsets[start: stop + 1])
+
+    def pad(self, indices: np.ndarray, length: Optional[int] = None, min_length: int = 0,
+            out: Optional[np.ndarray] = None) -> np.ndarray:
+        """ Gathers sequences and left pads them with zeros, same as keras pad_sequences
+        Args:
+            indices (np.ndarray): indices of sequences to be gathered
+            length (Optional[int]): length of output rows, defaults to length of the longest gathered sequence.
+                                    Longer sequences are truncated from the start.
+            min_length (int): minimum length of output rows when length is not given
+            out (Optional[np.ndarray]): flat buffer in which the output is to be written instead of a new array. It
+                                        must have room for len(indices) * length values.
+        Returns:
+            A 2D array with one row per index
+        """
+        indices = np.asarray(indices)
+        ends = self.offsets[indices + 1]
+        lengths = ends - self.offsets[indices]
+        if length is None:
+            length = max(int(lengths.max(initial=0)), min_length)
+        lengths = np.minimum(lengths, length)
+
+        if out is None:
+            padded = np.zeros((len(lengths), length), dtype=self.values.dtype)
+        else:
+            padded = out[:len(lengths) * length].reshape(len(lengths), length)
+            padded.fill(0)
+
+        # Position of every kept value in the flat array and the cell it goes to in the output
+        rows = np.repeat(np.arange(len(lengths)), lengths)
+        within_row = np.arange(len(rows)) - np.repeat(np.cumsum(lengths) - lengths, lengths)
+        sources = np.repeat(ends - lengths, lengths) + within_row
+        padded[rows, np.repeat(length - lengths, lengths) + within_row] = self.values[sources]
+        return padded
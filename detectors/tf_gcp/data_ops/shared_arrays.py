@@ -0,0 +1,80 @@
+from multiprocessing.shared_memory import SharedMemory
+from typing import Dict, List, Tuple
+
+import numpy as np
+
+
+class SharedArrays(object):
+    """ Numpy arrays held in shared memory blocks, which a parent process creates once and the processes it starts
+        attach to without copying or unpickling the arrays. Only the small dictionary returned by specs has to be sent
+        to them. Attached arrays are read only.
+
+        Blocks outlive processes attached to them, the process which created them has to close them, which also frees
+        them. """
+
+    def __init__(self, arrays: Dict[str, np.ndarray], blocks: List[SharedMemory], owner: bool):
+        """ Init method, use create or attach instead
+        Args:
+            arrays (Dict[str, np.ndarray]): arrays backed by blocks, by name
+            blocks (List[SharedMemory]): shared memory blocks
+            owner (bool): whether blocks were created by this process and are to be freed by close
+        """
+        self.arrays = arrays
+        self.blocks = blocks
+        self.owner = owner
+
+    @classmethod
+    def create(cls, arrays: Dict[str, np.ndarray]) -> 'SharedArrays':
+        """ Copies arrays to new shared memory blocks
+        Args:
+            arrays (Dict[str, np.ndarray]): arrays to be shared, by name
+        """
+        shared, blocks = {}, []
+        try:
+            for name, array in arrays.items():
+                # Blocks can't be empty
+                block = SharedMemory(create=True, size=max(array.nbytes, 1))
+                blocks.append(block)
+                shared[name] = np.ndarray(array.shape, dtype=array.dtype, buffer=block.buf)
+                shared[name][...] = array
+        except BaseException:
+            cls(shared, blocks, owner=True).close()
+            raise
+        return cls(shared, blocks, owner=True)
+
+    @property
+    def specs(self) -> Dict[str, Tuple[str, Tuple[int, ...], str]]:
+        """ Name of block, shape and type of every array, from which other processes attach to them
+        """
+        return {name: (block.name, array.shape, array.dtype.str)
+                for (name, array), block in zip(self.arrays.items(), self.blocks)}
+
+    @classmethod
+    def attach(cls, specs: Dict[str, Tuple[str, Tuple[int, ...], str]]) -> 'SharedArrays':
+        """ Attaches to arrays created by another process
+        Args:
+            specs (Dict[str, Tuple[str, Tuple[int, ...], str]]): specs of the arrays, see specs
+        """
+        arrays, blocks = {}, []
+        for name, (block_name, shape, dtype) in specs.items():
+            block = SharedMemory(name=block_name)
+            blocks.append(block)
+            arrays[name] = np.ndarray(shape, dtype=np.dtype(dtype), buffer=block.buf)
+            arrays[name].flags.writeable = False
+        return cls(arrays, blocks, owner=False)
+
+    def close(self):
+        """ Detaches from blocks, freeing them if this process created them. Arrays can't be used afterwards
+        """
+        self.arrays = {}
+        for block in self.blocks:
+            block.close()
+            if self.owner:
+                block.unlink()
+        self.blocks = []
+
+    def __enter__(self) -> 'SharedArrays':
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
@@ -0,0 +1,189 @@
+import io
+import os
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import BinaryIO, Callable, Dict, Iterator, Optional, Tuple
+
+import pandas as pd
+from google.cloud.storage import Blob, Bucket
+
+from detectors.tf_gcp.common import BucketOps
+
+
+class ObjectReader(io.RawIOBase):
+    """ Reads an object of a bucket with ranged requests of 'chunk_size' bytes. While a chunk is consumed, the next one
+        is fetched by a background thread, so a parser reading the stream overlaps with the download. Seeking is
+        supported, which zip archives need to find their members. """
+
+    def __init__(self, blob: Blob, chunk_size: int):
+        """ Init method
+        Args:
+            blob (Blob): object to be read, with its size loaded, as returned by Bucket.get_blob
+            chunk_size (int): number of bytes fetched by a single request
+        """
+        super(ObjectReader, self).__init__()
+        self.blob = blob
+        self.size = blob.size
+        self.chunk_size = chunk_size
+        self.position = 0
+        self.chunk_start = None
+        self.chunk = b''
+        self.prefetched: Optional[Tuple[int, Future]] = None
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='ObjectReader')
+
+    def readable(self) -> bool:
+        return True
+
+    def seekable(self) -> bool:
+        return True
+
+    def tell(self) -> int:
+        return self.position
+
+    def seek(self, offset: int, whence: int = io.SEEK_SET) -> int:
+        if whence == io.SEEK_CUR:
+            offset += self.position
+        elif whence == io.SEEK_END:
+            offset += self.size
+        self.position = max(offset, 0)
+        return self.position
+
+    def _fetch(self, start: int) -> bytes:
+        # End of range is inclusive
+        return self.blob.download_as_bytes(start=start, end=min(start + self.chunk_size, self.size) - 1)
+
+    def _load_chunk(self, start: int):
+        """ Makes the chunk starting at 'start' current, and starts fetching the one after it
+        """
+        if self.prefetched is not None and self.prefetched[0] == start:
+            self.chunk = self.prefetched[1].result()
+        else:
+            self.chunk = self._fetch(start)
+        self.chunk_start = start
+        next_start = start + self.chunk_size
+        self.prefetched = (next_start, self.executor.submit(self._fetch, next_start)) if next_start < self.size \
+            else None
+
+    def readinto(self, buffer) -> int:
+        if self.position >= self.size:
+            return 0
+        # Chunks start wherever reading starts, so that a read after a seek, like the one of the central directory at
+        # the end of a zip archive, only fetches what follows it
+        if self.chunk_start is None or not self.chunk_start <= self.position < self.chunk_start + len(self.chunk):
+            self._load_chunk(self.position)
+        offset = self.position - self.chunk_start
+        num_bytes = min(len(buffer), len(self.chunk) - offset)
+        buffer[:num_bytes] = self.chunk[offset: offset + num_bytes]
+        self.position += num_bytes
+        return num_bytes
+
+    def close(self):
+        if not self.closed:
+            self.executor.shutdown(wait=False, cancel_futures=True)
+        super(ObjectReader, self).close()
+
+
+class Storage(object):
+    """ Opens local files and objects in Google Cloud Storage as binary streams, in process. Objects are streamed in
+        chunks as they are read instead of being copied to the working directory first, so parsing csv files or
+        decompressing zip and gzip files overlaps with the download, and nothing is left behind to be cleaned up.
+
+        Buckets are created by 'get_bucket', which defaults to BucketOps.get_bucket. Passing a function returning a
+        LocalBucket reads from a local directory standing in for Google Cloud Storage instead. """
+
+    # Objects are read with requests of this many bytes
+    CHUNK_SIZE = 8 * 1024 * 1024
+    COMPRESSIONS = {'.gz': 'gzip', '.zip': 'zip', '.bz2': 'bz2', '.xz': 'xz'}
+
+    def __init__(self, get_bucket: Optional[Callable[[str], Bucket]] = None, chunk_size: int = CHUNK_SIZE):
+        """ Init method
+        Args:
+            get_bucket (Optional[Callable[[str], Bucket]]): creates a bucket object from a bucket name
+            chunk_size (int): number of bytes fetched by a single request
+        """
+        self.get_bucket = get_bucket or BucketOps.get_bucket
+        self.chunk_size = chunk_size
+        self.buckets = {}
+
+    @staticmethod
+    def is_remote(path: str) -> bool:
+        return path.startswith('gs://')
+
+    @staticmethod
+    def split(path: str) -> Tuple[str, str]:
+        """ Splits a Google Cloud Storage path into bucket name and object name
+        """
+        bucket_name, _, name = path[len('gs://'):].partition('/')
+        return bucket_name, name
+
+    @staticmethod
+    def compression(path: str) -> Optional[str]:
+        """ Returns compression of a file inferred from its extension, in the form pandas.read_csv accepts. pandas
+            only infers it from paths, not from streams
+        """
+        return Storage.COMPRESSIONS.get(os.path.splitext(path)[1])
+
+    def bucket(self, bucket_name: str) -> Bucket:
+        if bucket_name not in self.buckets:
+            self.buckets[bucket_name] = self.get_bucket(bucket_name)
+        return self.buckets[bucket_name]
+
+    def get_blob(self, path: str) -> Optional[Blob]:
+        bucket_name, name = Storage.split(path)
+        return self.bucket(bucket_name).get_blob(name)
+
+    def exists(self, path: str) -> bool:
+        """ Checks whether a local file or an object exists
+        """
+        if not Storage.is_remote(path):
+            return os.path.isfile(path)
+        return self.get_blob(path) is not None
+
+    def open(self, path: str) -> BinaryIO:
+        """ Opens a local file or an object for reading
+        Args:
+            path (str): local path, or Google Cloud Storage path starting with 'gs://'
+        Returns:
+            A seekable binary stream
+        """
+        if not Storage.is_remote(path):
+            return open(path, 'rb')
+        blob = self.get_blob(path)
+        if blob is None:
+            raise FileNotFoundError(f"{path} does not exist")
+        return io.BufferedReader(ObjectReader(blob, chunk_size=self.chunk_size), buffer_size=1024 * 1024)
+
+    def read_bytes(self, path: str) -> bytes:
+        with self.open(path) as stream:
+            return stream.read()
+
+    def read_csv(self, path: str, **kwargs) -> pd.DataFrame:
+        """ Parses a csv file while it is read, decompressing it if its extension says it is compressed
+        Args:
+            path (str): local path, or Google Cloud Storage path starting with 'gs://'
+            kwargs: arguments of pandas.read_csv
+        """
+        kwargs.setdefault('compression', Storage.compression(path))
+        with self.open(path) as stream:
+            return pd.read_csv(stream, **kwargs)
+
+    def iter_csv(self, path: str, chunk_size: int, **kwargs) -> Iterator[pd.DataFrame]:
+        """ Parses a csv file in chunks of 'chunk_size' rows, reading only as much of it as the chunks need
+        Args:
+            path (str): local path, or Google Cloud Storage path starting with 'gs://'
+            chunk_size (int): number of rows of every chunk
+            kwargs: arguments of pandas.read_csv
+        """
+        kwargs.setdefault('compression', Storage.compression(path))
+        with self.open(path) as stream, pd.read_csv(stream, chunksize=chunk_size, **kwargs) as reader:
+            yield from reader
+
+    def checksums(self, path: str) -> Dict[str, str]:
+        """ Lists md5 checksums of the object at a Google Cloud Storage path, or of all objects under it if it is a
+            directory, from object metadata without downloading them
+        Returns:
+            A dictionary from object name to its base64 encoded md5 checksum
+        """
+        bucket_name, name = Storage.split(path)
+        directory = name.rstrip('/') + '/'
+        return {blob.name: blob.md5_hash for blob in self.bucket(bucket_name).list_blobs(prefix=name.rstrip('/'))
+                if blob.name == name or blob.name.startswith(directory)}
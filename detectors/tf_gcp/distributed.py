@@ -0,0 +1,107 @@
+import json
+import multiprocessing
+import os
+import socket
+import tempfile
+from contextlib import ExitStack, closing
+from multiprocessing.connection import wait
+from typing import Callable, Dict, List, Optional
+
+
+def free_ports(num_ports: int) -> List[int]:
+    """ Finds ports which are free on localhost, by letting the OS pick them
+    Args:
+        num_ports (int): number of ports needed
+    """
+    with ExitStack() as stack:
+        sockets = [stack.enter_context(closing(socket.socket(socket.AF_INET, socket.SOCK_STREAM)))
+                   for _ in range(num_ports)]
+        for sock in sockets:
+            sock.bind(('localhost', 0))
+        return [sock.getsockname()[1] for sock in sockets]
+
+
+def _run_worker(target: Callable, index: int, cluster: Dict, threads: Optional[int], args: tuple):
+    """ Entry point of worker processes. Describes the cluster to TensorFlow through TF_CONFIG, limits its threads and
+        calls the target, in a temporary directory of its own unless this worker is the chief
+    """
+    os.environ['TF_CONFIG'] = json.dumps({'cluster': cluster, 'task': {'type': 'worker', 'index': index}})
+    import tensorflow as tf
+    if threads:
+        tf.config.threading.set_intra_op_parallelism_threads(threads)
+        tf.config.threading.set_inter_op_parallelism_threads(threads)
+
+    if index == 0:
+        target(*args)
+        return
+    cwd = os.getcwd()
+    with tempfile.TemporaryDirectory(prefix=f'worker_{index}_') as work_dir:
+        os.chdir(work_dir)
+        try:
+            target(*args)
+        finally:
+            os.chdir(cwd)
+
+
+class LocalCluster(object):
+    """ Runs a function in several local worker processes, which form a TensorFlow cluster over localhost for
+        tf.distribute.MultiWorkerMirroredStrategy. Every process is told about the cluster and its own index through
+        TF_CONFIG before the function runs, so the function only has to create the strategy. Worker 0 is the chief and
+        runs in the current directory, other workers run in temporary directories of their own so that nothing they
+        write locally ends up among the chief's files.
+
+        Processes are spawned rather than forked, since TensorFlow does not survive a fork once it has started its
+        threads. If a worker fails, the others would wait on it forever in collective ops, so they are terminated. """
+
+    def __init__(self, num_workers: int, base_port: Optional[int] = None, threads: Optional[int] = None):
+        """ Init method
+        Args:
+            num_workers (int): number of worker processes
+            base_port (Optional[int]): port of the chief, other workers listen on the following ones. Free ports are
+                                       picked if not given
+            threads (Optional[int]): number of threads every worker runs ops on, defaults to cores of the machine
+                                     divided between workers
+        """
+        if num_workers < 1:
+            raise ValueError(f"'num_workers' should be at least 1, not {num_workers}")
+        self.num_workers = num_workers
+        self.ports = free_ports(num_workers) if base_port is None else list(range(base_port, base_port + num_workers))
+        self.threads = threads or max((os.cpu_count() or 1) // num_workers, 1)
+
+    @property
+    def cluster_spec(self) -> Dict:
+        """ Cluster as described in TF_CONFIG
+        """
+        return {'worker': [f"localhost:{port}" for port in self.ports]}
+
+    def run(self, target: Callable, *args):
+        """ Calls target(*args) in every worker process and waits for all of them to finish
+        Args:
+            target (Callable): function to run, importable by name from worker processes
+            args: arguments of target, which have to be picklable
+        """
+        context = multiprocessing.get_context('spawn')
+        processes = [context.Process(target=_run_worker, args=(target, index, self.cluster_spec, self.threads, args),
+                                     name=f"worker_{index}")
+                     for index in range(self.num_workers)]
+        print(f"[LocalCluster::run] Starting {self.num_workers} workers on ports {self.ports}, with {self.threads} "
+              f"thread(s) each")
+        for process in processes:
+            process.start()
+
+        running = {process.sentinel: process for process in processes}
+        failed = []
+        try:
+            while running and not failed:
+                for sentinel in wait(list(running)):
+                    process = running.pop(sentinel)
+                    process.join()
+                    if process.exitcode != 0:
+                        failed.append(process)
+        finally:
+            for process in running.values():
+                process.terminate()
+                process.join()
+        if failed:
+            raise RuntimeError(f"Worker {failed[0].name} exited with code {failed[0].exitcode}, other workers "
+                               f"were terminated")
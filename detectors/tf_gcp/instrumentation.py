@@ -0,0 +1,159 @@
+import json
+import os
+import resource
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Dict, Iterator, Optional
+
+
+def current_rss() -> int:
+    """ Returns resident memory of this process in bytes. Falls back to peak resident memory over the life of the
+        process where /proc is not available
+    """
+    try:
+        with open('/proc/self/statm') as fstream:
+            return int(fstream.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError):
+        # ru_maxrss is in kilobytes on linux
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+def path_size(path: str) -> int:
+    """ Returns size of a file, or total size of files in a directory, in bytes
+    """
+    if os.path.isfile(path):
+        return os.path.getsize(path)
+    return sum(os.path.getsize(os.path.join(root, name)) for root, _, names in os.walk(path) for name in names)
+
+
+class Instrumentation(object):
+    """ Records wall time, CPU time, peak resident memory and item throughput of every stage of a run, like download,
+        tokenizer fit or an epoch, and dumps them as a JSON report at the end of the run.
+
+        CPU time includes all threads of this process, and child processes such as preprocessing workers once they
+        have exited. Peak resident memory is that of this process, sampled by a background thread every
+        'sample_interval' seconds while any stage is open. Stages may be nested. """
+
+    def __init__(self, run_name: str, sample_interval: float = 0.05):
+        """ Init method
+        Args:
+            run_name (str): name of the run, written to the report
+            sample_interval (float): time in seconds between two samples of resident memory
+        """
+        self.run_name = run_name
+        self.sample_interval = sample_interval
+        self.started_at = datetime.now().isoformat(timespec='seconds')
+        self.stages = []
+        self.open_stages = []
+        self.lock = threading.Lock()
+        self.stop_sampling = None
+
+    def _sample(self):
+        """ Updates peak resident memory of all open stages
+        """
+        rss = current_rss()
+        with self.lock:
+            for record in self.open_stages:
+                record['peak_rss_mb'] = max(record['peak_rss_mb'], rss / 2 ** 20)
+
+    def _sample_until(self, stop_sampling: threading.Event):
+        while not stop_sampling.wait(self.sample_interval):
+            self._sample()
+
+    def start(self, name: str, items: Optional[int] = None, unit: str = 'items') -> Dict:
+        """ Opens a stage
+        Args:
+            name (str): name of stage
+            items (Optional[int]): number of items processed by the stage, if known up front
+            unit (str): what an item is, like 'reviews' or 'bytes'
+        Returns:
+            Record of the stage, to be passed to stop
+        """
+        cpu = os.times()
+        record = {'name': name, 'items': items, 'unit': unit, 'peak_rss_mb': 0.0,
+                  '_wall': time.perf_counter(), '_cpu': cpu.user + cpu.system + cpu.children_user + cpu.children_system}
+        with self.lock:
+            self.open_stages.append(record)
+            if self.stop_sampling is None:
+                self.stop_sampling = threading.Event()
+                threading.Thread(target=self._sample_until, args=(self.stop_sampling,), name='Instrumentation',
+                                 daemon=True).start()
+        self._sample()
+        return record
+
+    def stop(self, record: Dict, items: Optional[int] = None) -> Dict:
+        """ Closes a stage and adds it to the report
+        Args:
+            record (Dict): record returned by start
+            items (Optional[int]): number of items processed by the stage, overriding the one given to start
+        Returns:
+            Completed record of the stage
+        """
+        self._sample()
+        cpu = os.times()
+        wall_seconds = time.perf_counter() - record.pop('_wall')
+        cpu_seconds = cpu.user + cpu.system + cpu.children_user + cpu.children_system - record.pop('_cpu')
+        with self.lock:
+            self.open_stages = [open_record for open_record in self.open_stages if open_record is not record]
+            if not self.open_stages:
+                self.stop_sampling.set()
+                self.stop_sampling = None
+
+        if items is not None:
+            record['items'] = items
+        record.update({'wall_seconds': wall_seconds, 'cpu_seconds': cpu_seconds,
+                       'throughput': record['items'] / wall_seconds if record['items'] and wall_seconds else None})
+        self.stages.append(record)
+        throughput = f", {record['throughput']:.1f} {record['unit']}/s" if record['throughput'] else ''
+        print(f"[Instrumentation::stop] {record['name']}: {wall_seconds:.2f}s wall, {cpu_seconds:.2f}s cpu, "
+              f"{record['peak_rss_mb']:.0f}MB peak rss{throughput}")
+        return record
+
+    @contextmanager
+    def stage(self, name: str, items: Optional[int] = None, unit: str = 'items') -> Iterator[Dict]:
+        """ Records a stage around a block of code. Number of items can also be set on the yielded record inside the
+            block, as record['items']
+        """
+        record = self.start(name, items=items, unit=unit)
+        try:
+            yield record
+        finally:
+            self.stop(record)
+
+    def summary(self) -> Dict:
+        """ Totals of stages recorded so far by stage name, for stages which run many times like scoring of chunks
+        """
+        totals = {}
+        for record in self.stages:
+            total = totals.setdefault(record['name'], {'count': 0, 'wall_seconds': 0.0, 'cpu_seconds': 0.0,
+                                                       'peak_rss_mb': 0.0, 'items': 0, 'unit': record['unit']})
+            total['count'] += 1
+            total['wall_seconds'] += record['wall_seconds']
+            total['cpu_seconds'] += record['cpu_seconds']
+            total['peak_rss_mb'] = max(total['peak_rss_mb'], record['peak_rss_mb'])
+            total['items'] += record['items'] or 0
+        for total in totals.values():
+            total['throughput'] = total['items'] / total['wall_seconds'] if total['items'] and \
+                total['wall_seconds'] else None
+        return totals
+
+    def report(self) -> Dict:
+        """ Creates the report of stages recorded so far
+        """
+        cpu = os.times()
+        return {'run_name': self.run_name, 'started_at': self.started_at, 'cpu_count': os.cpu_count(),
+                'process_cpu_seconds': cpu.user + cpu.system + cpu.children_user + cpu.children_system,
+                'process_peak_rss_mb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+                'summary': self.summary(), 'stages': self.stages}
+
+    def save(self, path: str):
+        """ Writes the report as a JSON file
+        Args:
+            path (str): path of report file
+        """
+        with open(path, 'w') as fstream:
+            json.dump(self.report(), fstream, indent=2)
+        print(f"[Instrumentation::save] Dumped timings of {len(self.stages)} stages to {path}")
+
@@ -0,0 +1,209 @@
+from typing import Dict, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+
+class RunningConfusionMatrix(object):
+    """ Binary confusion matrix which can be built up incrementally, one chunk of predictions at a time """
+
+    def __init__(self):
+        """ Init method
+        """
+        self.tn = np.int64(0)
+        self.fp = np.int64(0)
+        self.fn = np.int64(0)
+        self.tp = np.int64(0)
+
+    @property
+    def total(self) -> np.int64:
+        return self.tn + self.fp + self.fn + self.tp
+
+    def update(self, y_true: np.ndarray, y_pred: np.ndarray):
+        """ Adds counts of a chunk of predictions to the matrix
+        Args:
+            y_true (np.ndarray): true 0/1 labels
+            y_pred (np.ndarray): predicted 0/1 labels
+        """
+        y_true = np.asarray(y_true).astype(bool)
+        y_pred = np.asarray(y_pred).astype(bool)
+        self.tp += np.count_nonzero(y_true & y_pred)
+        self.fp += np.count_nonzero(~y_true & y_pred)
+        self.fn += np.count_nonzero(y_true & ~y_pred)
+        self.tn += np.count_nonzero(~y_true & ~y_pred)
+
+    def metrics(self) -> Dict:
+        """ Calculates performance metrics from the counts gathered so far
+        Returns:
+            A dictionary containing accuracy, precision, recall and f1 score
+        """
+        tn, fp, fn, tp = self.tn, self.fp, self.fn, self.tp
+        return {'val_accuracy': (tp + tn) / self.total, 'val_precision': tp / (tp + fp),
+                'val_recall': tp / (tp + fn), 'val_f1': tp / (tp + 0.5 * (fp + fn))}
+
+
+class ThresholdEvaluation(object):
+    """ Evaluates probabilities of a binary classifier at every threshold at once. Probabilities and labels are
+        gathered chunk by chunk, packed together in a single 32 bit key per review, then sorted once by decreasing
+        probability, so that cumulative sums of labels give counts of true and false positives when every review
+        scoring above a given probability is predicted positive, same as Predictor does. Precision, recall, F1 and
+        accuracy at every distinct probability, ROC AUC, PR AUC (average precision) and calibration bins all come out
+        of that single pass, without scoring reviews again.
+
+        Metrics which are undefined, like precision when nothing is predicted positive or ROC AUC of a single class,
+        are NaN, and null once exported as JSON. """
+
+    def __init__(self, num_bins: int = 10):
+        """ Init method
+        Args:
+            num_bins (int): number of equal width probability bins of the calibration curve
+        """
+        self.num_bins = num_bins
+        self.keys = []
+
+    @property
+    def total(self) -> int:
+        return sum(len(keys) for keys in self.keys)
+
+    @staticmethod
+    def pack(y_true: np.ndarray, y_score: np.ndarray) -> np.ndarray:
+        """ Packs labels and probabilities in keys which sort in the order of probabilities. Bits of a non negative
+            float32 compare the same way as the float does, and their sign bit, always 0, makes room for the label
+        """
+        scores = np.asarray(y_score, dtype=np.float32).reshape(-1)
+        if len(scores) and not (scores.min() >= 0 and scores.max() <= 1):
+            raise ValueError("Probabilities should be between 0 and 1")
+        # Adding 0 turns -0.0 into 0.0
+        keys = (scores + np.float32(0)).view(np.uint32) << np.uint32(1)
+        keys |= np.asarray(y_true).reshape(-1).astype(bool)
+        return keys
+
+    @staticmethod
+    def unpack(keys: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """ Labels and probabilities of packed keys, see pack
+        """
+        return (keys & np.uint32(1)).astype(bool), (keys >> np.uint32(1)).view(np.float32)
+
+    def update(self, y_true: np.ndarray, y_score: np.ndarray):
+        """ Adds a chunk of probabilities
+        Args:
+            y_true (np.ndarray): true 0/1 labels
+            y_score (np.ndarray): predicted probabilities of the positive class
+        """
+        self.keys.append(ThresholdEvaluation.pack(y_true, y_score))
+
+    def curve(self) -> Dict[str, np.ndarray]:
+        """ Counts and metrics at every distinct probability, in decreasing order of probability. Reviews scoring
+            above 'threshold' are predicted positive, so the first row predicts nothing positive. A last row, whose
+            threshold is just below the lowest probability, predicts every review positive
+        Returns:
+            A dictionary of arrays with one value per distinct probability, and one more
+        """
+        keys = np.concatenate(self.keys) if self.keys else np.empty(0, dtype=np.uint32)
+        # Sorting keys moves labels along with probabilities, without an argsort and gathers
+        keys.sort()
+        keys = keys[::-1]
+        # Number of positive reviews among the first i reviews
+        tps = np.concatenate([[0], np.cumsum(keys & np.uint32(1), dtype=np.int64)])
+        keys >>= np.uint32(1)
+        scores = keys.view(np.float32)
+        # First position of every run of equal probabilities, where reviews before it score above the run
+        starts = np.flatnonzero(np.append(True, keys[1:] != keys[:-1])) if len(keys) else np.empty(0, dtype=np.int64)
+        cuts = np.append(starts, len(keys))
+        thresholds = np.append(scores[starts], np.nextafter(scores[-1], np.float32(-1)) if len(keys) else 0)
+        tp = tps[cuts]
+        fp = cuts - tp
+        positives = int(tps[-1])
+        negatives = len(scores) - positives
+        fn = positives - tp
+        tn = negatives - fp
+        with np.errstate(divide='ignore', invalid='ignore'):
+            return {'threshold': thresholds.astype(np.float32), 'tp': tp, 'fp': fp, 'tn': tn, 'fn': fn,
+                    'precision': tp / (tp + fp), 'recall': tp / np.float64(positives),
+                    'fpr': fp / np.float64(negatives), 'f1': 2 * tp / (2 * tp + fp + fn).astype(np.float64),
+                    'accuracy': (tp + tn) / np.float64(len(scores))}
+
+    def calibration(self) -> Dict[str, np.ndarray]:
+        """ Reliability curve: number of reviews, mean probability and share of positive reviews in every bin
+        """
+        counts = np.zeros(self.num_bins, dtype=np.int64)
+        sums = np.zeros(self.num_bins, dtype=np.float64)
+        positives = np.zeros(self.num_bins, dtype=np.int64)
+        for keys in self.keys:
+            labels, scores = ThresholdEvaluation.unpack(keys)
+            bins = np.minimum((scores * self.num_bins).astype(np.int64), self.num_bins - 1)
+            counts += np.bincount(bins, minlength=self.num_bins)
+            sums += np.bincount(bins, weights=scores, minlength=self.num_bins)
+            positives += np.bincount(bins, weights=labels, minlength=self.num_bins).astype(np.int64)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            return {'lower': np.arange(self.num_bins) / self.num_bins,
+                    'upper': np.arange(1, self.num_bins + 1) / self.num_bins, 'count': counts,
+                    'mean_probability': sums / counts, 'positive_rate': positives / counts}
+
+    def metrics_at(self, threshold: float) -> Dict:
+        """ Metrics when reviews scoring above 'threshold' are predicted positive, same as Predictor does
+        """
+        confusion_matrix = RunningConfusionMatrix()
+        for keys in self.keys:
+            labels, scores = ThresholdEvaluation.unpack(keys)
+            confusion_matrix.update(y_true=labels, y_pred=scores > threshold)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            return {'threshold': threshold, **{key[len('val_'):]: float(value)
+                                               for key, value in confusion_matrix.metrics().items()}}
+
+    def evaluate(self, threshold: float = 0.5) -> Tuple[Dict, pd.DataFrame]:
+        """ Evaluates all probabilities gathered so far
+        Args:
+            threshold (float): threshold whose metrics are reported along with the best ones
+        Returns:
+            A tuple containing a report and a dataframe of the curve, see curve. The report holds ROC AUC, PR AUC,
+            expected calibration error, metrics at 'threshold', at the threshold of best F1 and of best accuracy, and
+            calibration bins
+        """
+        curve = self.curve()
+        num_reviews = self.total
+        positives = int(curve['tp'][-1])
+        # ROC curve goes from the first row, where nothing is predicted positive, to the last one
+        tpr, fpr = curve['recall'], curve['fpr']
+        roc_auc = float(np.sum(np.diff(fpr) * (tpr[1:] + tpr[:-1]) / 2)) if 0 < positives < num_reviews else \
+            float('nan')
+        # Average precision: precision weighted by increase of recall at every threshold
+        pr_auc = float(np.sum(np.diff(tpr) * curve['precision'][1:])) if positives else float('nan')
+
+        calibration = self.calibration()
+        filled = calibration['count'] > 0
+        ece = float(np.sum(calibration['count'][filled] * np.abs(calibration['mean_probability'][filled] -
+                                                                  calibration['positive_rate'][filled]))
+                    / num_reviews) if num_reviews else float('nan')
+
+        def at(index: int) -> Dict:
+            return {key: float(values[index]) for key, values in curve.items()
+                    if key in ('threshold', 'precision', 'recall', 'f1', 'accuracy')}
+
+        report = {'num_reviews': num_reviews, 'positives': positives, 'num_thresholds': len(curve['threshold']),
+                  'roc_auc': roc_auc, 'pr_auc': pr_auc, 'expected_calibration_error': ece,
+                  'at_threshold': self.metrics_at(threshold),
+                  'best_f1': at(int(np.nanargmax(curve['f1']))) if positives else None,
+                  'best_accuracy': at(int(np.argmax(curve['accuracy']))) if num_reviews else None,
+                  'calibration': pd.DataFrame(calibration).to_dict(orient='records')}
+        return report, pd.DataFrame(curve)
+
+    @staticmethod
+    def to_json(report: Dict) -> Dict:
+        """ Replaces NaN values of a report, at any depth, with None so that it can be dumped as standard JSON
+        """
+        if isinstance(report, dict):
+            return {key: ThresholdEvaluation.to_json(value) for key, value in report.items()}
+        if isinstance(report, list):
+            return [ThresholdEvaluation.to_json(value) for value in report]
+        if isinstance(report, float) and np.isnan(report):
+            return None
+        return report
+
+    @staticmethod
+    def thin(curve: pd.DataFrame, max_points: Optional[int]) -> pd.DataFrame:
+        """ Keeps at most 'max_points' rows of a curve, evenly spaced in rank, along with its first and last row
+        """
+        if max_points is None or len(curve) <= max_points:
+            return curve
+        return curve.iloc[np.unique(np.linspace(0, len(curve) - 1, max_points).round().astype(np.int64))]
@@ -0,0 +1,95 @@
+import json
+import os
+from typing import Optional
+
+import numpy as np
+import tensorflow as tf
+
+from detectors.tf_gcp.data_ops.storage import Storage
+
+
+class InferenceModel(object):
+    """ A self-contained inference artifact of a trained model. It is a SavedModel holding only the model variables and
+        a single serving function, which takes int32 sequences of any length, along with a metadata file describing
+        the model type, the tokenizer it was trained with and the sequence length.
+
+        Unlike a SavedModel written by keras Model.save, it contains no per layer functions or training configuration,
+        so it loads without reviving keras layers and needs no compile, which makes start up considerably faster. """
+
+    FORMAT = 'amazon-reviews-model'
+    VERSION = 1
+    METADATA_FILE = 'metadata.json'
+
+    def __init__(self, module: tf.Module, metadata: dict):
+        """ Init method
+        Args:
+            module (tf.Module): loaded SavedModel
+            metadata (dict): contents of metadata file
+        """
+        self.module = module
+        self.model_type = metadata['model_type']
+        self.max_sequence_length = metadata['max_sequence_length']
+        self.tokenizer_fingerprint = metadata['tokenizer_fingerprint']
+
+    @staticmethod
+    def is_exported(path: str, storage: Optional[Storage] = None) -> bool:
+        """ Checks whether path is a directory, local or in Google Cloud Storage, containing an exported inference
+            model
+        """
+        return (storage or Storage()).exists(os.path.join(path, InferenceModel.METADATA_FILE))
+
+    @staticmethod
+    def export(model: tf.keras.Model, path: str, model_type: str, max_sequence_length: int,
+               tokenizer_fingerprint: str):
+        """ Exports a trained keras model as an inference artifact
+        Args:
+            model (tf.keras.Model): trained model
+            path (str): directory to export to
+            model_type (str): one of 'CNN', 'LSTM' and 'Hybrid'
+            max_sequence_length (int): length to which sequences are padded at prediction time
+            tokenizer_fingerprint (str): fingerprint of the tokenizer the model was trained with
+        """
+        module = tf.Module()
+        # Only variables are tracked, not the keras model, so that keras doesn't add its own functions to the export
+        module.model_variables = list(model.variables)
+
+        @tf.function(input_signature=[tf.TensorSpec([None, None], tf.int32, name='input')])
+        def serve(sequences):
+            return {'probabilities': model(sequences, training=False)}
+
+        module.serve = serve
+        tf.saved_model.save(module, path, signatures={'serving_default': serve})
+
+        metadata = {'format': InferenceModel.FORMAT, 'version': InferenceModel.VERSION, 'model_type': model_type,
+                    'max_sequence_length': max_sequence_length, 'tokenizer_fingerprint': tokenizer_fingerprint}
+        with open(os.path.join(path, InferenceModel.METADATA_FILE), 'w') as fstream:
+            json.dump(metadata, fstream, indent=2)
+
+    @staticmethod
+    def load(path: str, storage: Optional[Storage] = None) -> 'InferenceModel':
+        """ Loads an exported inference model. Tensorflow reads the SavedModel from Google Cloud Storage paths itself
+        Args:
+            path (str): directory the model was exported to
+            storage (Optional[Storage]): storage the metadata file is read from
+        Returns:
+            InferenceModel object
+        """
+        metadata = json.loads((storage or Storage()).read_bytes(os.path.join(path, InferenceModel.METADATA_FILE)))
+        if metadata.get('format') != InferenceModel.FORMAT:
+            raise ValueError(f"{path} is not an exported inference model")
+        if metadata.get('version', 0) > InferenceModel.VERSION:
+            raise ValueError(f"Inference model {path} has version {metadata['version']}, only versions up to "
+                             f"{InferenceModel.VERSION} are supported. Please update the code")
+        return InferenceModel(module=tf.saved_model.load(path), metadata=metadata)
+
+    def predict_on_batch(self, batch: np.ndarray) -> np.ndarray:
+        """ Scores a batch of padded sequences, same as keras Model.predict_on_batch
+        Args:
+            batch (np.ndarray): 2D array of padded sequences
+        Returns:
+            Predicted probabilities of shape (len(batch), 1)
+        """
+        return self.module.serve(tf.constant(batch, dtype=tf.int32))['probabilities'].numpy()
+
+    def predict(self, batch: np.ndarray) -> np.ndarray:
+        return self.predict_on_batch(batch)
@@ -1,5 +1,6 @@
 from abc import ABC, abstractmethod
 from argparse import Namespace
+from typing import Optional
 
 import tensorflow as tf
 from tensorflow.keras import layers
@@ -18,13 +19,75 @@ class Model(ABC):
         ...
 
 
+class MaskedEmbedding(layers.Embedding):
+    """ Embedding which masks padding, index 0, for the next layers. Models which mask padding all start with it, so
+        the 'masked_' prefix of its name tells their weights apart from the ones of models which don't """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, mask_zero=True, **kwargs)
+
+
+class MaskedConv1D(layers.Conv1D):
+    """ Conv1D which sees padding positions as zeros, and passes the padding mask on to the next layers """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.supports_masking = True
+
+    def call(self, inputs, mask=None):
+        if mask is not None:
+            inputs = inputs * tf.cast(mask, inputs.dtype)[..., tf.newaxis]
+        return super().call(inputs)
+
+    def compute_mask(self, inputs, mask=None):
+        return mask
+
+
+class MaskedMaxPooling1D(layers.MaxPooling1D):
+    """ MaxPooling1D which ignores padding positions. Sequences are padded on the left, so windows are aligned on the
+        last word rather than on the first position, and sequences pool the same way whatever their padded length """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.supports_masking = True
+
+    def align(self, inputs):
+        """ Pads 'inputs' on the left so that their length is a multiple of the stride """
+        extra = -tf.shape(inputs)[1] % self.strides[0]
+        return tf.pad(inputs, [[0, 0], [extra, 0], [0, 0]])
+
+    def call(self, inputs, mask=None):
+        # Inputs are ReLU outputs, so zeros never win over words
+        if mask is not None:
+            inputs = inputs * tf.cast(mask, inputs.dtype)[..., tf.newaxis]
+        return super().call(self.align(inputs))
+
+    def compute_mask(self, inputs, mask=None):
+        if mask is None:
+            return None
+        # A pooled position is kept when its window holds at least one word
+        return tf.cast(tf.squeeze(super().call(self.align(tf.cast(mask, tf.float32)[..., tf.newaxis])), -1), tf.bool)
+
+
+class MaskedGlobalAveragePooling1D(layers.GlobalAveragePooling1D):
+    """ GlobalAveragePooling1D over words only. Unlike keras' masked average, a sequence made only of padding averages
+        to zeros instead of NaN """
+
+    def call(self, inputs, mask=None):
+        if mask is None:
+            return super().call(inputs)
+        mask = tf.cast(mask, inputs.dtype)[..., tf.newaxis]
+        return tf.math.divide_no_nan(tf.reduce_sum(inputs * mask, axis=1), tf.reduce_sum(mask, axis=1))
+
+
 class CNNModel(Model):
 
-    def __init__(self, num_features: int, max_sequence_length: int):
+    def __init__(self, num_features: int, max_sequence_length: Optional[int]):
         """ Init method
         Args:
             num_features (int): Total number of words
-            max_sequence_length (int): Maximum allowed length for an inout sequence
+            max_sequence_length (Optional[int]): Maximum allowed length for an inout sequence, None to accept
+                                                 sequences of any length
         """
         self.num_features = num_features
         self.max_sequence_length = max_sequence_length
@@ -36,31 +99,37 @@ class CNNModel(Model):
             Built model
         """
         print("[CNNModel::build] Building CNN model")
+        mask_padding = getattr(model_params, 'mask_padding', True)
+        Embedding = MaskedEmbedding if mask_padding else layers.Embedding
+        Conv1D = MaskedConv1D if mask_padding else layers.Conv1D
+        MaxPooling1D = MaskedMaxPooling1D if mask_padding else layers.MaxPooling1D
+        GlobalAveragePooling1D = MaskedGlobalAveragePooling1D if mask_padding else layers.GlobalAveragePooling1D
         model = Sequential()
         model.add(layers.InputLayer(input_shape=(self.max_sequence_length,), name="input"))
-        model.add(layers.Embedding(input_dim=self.num_features,
-                                   output_dim=model_params.embedding_dim,
-                                   input_length=self.max_sequence_length))
-        model.add(layers.Conv1D(filters=64, kernel_size=3, padding='same', activation='relu'))
-        model.add(layers.MaxPooling1D(pool_size=2))
-        model.add(layers.Conv1D(filters=128, kernel_size=3, padding='same', activation='relu'))
-        model.add(layers.GlobalAveragePooling1D())
+        model.add(Embedding(input_dim=self.num_features,
+                            output_dim=model_params.embedding_dim,
+                            input_length=self.max_sequence_length))
+        model.add(Conv1D(filters=64, kernel_size=3, padding='same', activation='relu'))
+        model.add(MaxPooling1D(pool_size=2))
+        model.add(Conv1D(filters=128, kernel_size=3, padding='same', activation='relu'))
+        model.add(GlobalAveragePooling1D())
         model.add(layers.Dropout(rate=0.2))
         model.add(layers.Dense(1, activation='sigmoid'))
 
         model.compile(optimizer=model_params.optimizer,
                       loss=model_params.loss,
-                      metrics=model_params.metrics)
+                      weighted_metrics=model_params.metrics)
         return model
 
 
 class LSTMModel(Model):
 
-    def __init__(self, num_features: int, max_sequence_length: int):
+    def __init__(self, num_features: int, max_sequence_length: Optional[int]):
         """ Init method
         Args:
             num_features (int): Total number of words
-            max_sequence_length (int): Maximum allowed length for an inout sequence
+            max_sequence_length (Optional[int]): Maximum allowed length for an inout sequence, None to accept
+                                                 sequences of any length
         """
         self.num_features = num_features
         self.max_sequence_length = max_sequence_length
@@ -72,27 +141,30 @@ class LSTMModel(Model):
             Built model
         """
         print("[LSTMModel::build] Building LSTM model")
+        mask_padding = getattr(model_params, 'mask_padding', True)
+        Embedding = MaskedEmbedding if mask_padding else layers.Embedding
         model = Sequential()
         model.add(layers.InputLayer(input_shape=(self.max_sequence_length,), name="input"))
-        model.add(layers.Embedding(input_dim=self.num_features,
-                                   output_dim=model_params.embedding_dim,
-                                   input_length=self.max_sequence_length))
+        model.add(Embedding(input_dim=self.num_features,
+                            output_dim=model_params.embedding_dim,
+                            input_length=self.max_sequence_length))
         model.add(layers.LSTM(128, recurrent_dropout=0.2))
         model.add(layers.Dense(1, activation='sigmoid'))
 
         model.compile(optimizer=model_params.optimizer,
                       loss=model_params.loss,
-                      metrics=model_params.metrics)
+                      weighted_metrics=model_params.metrics)
         return model
 
 
 class HybridModel(Model):
 
-    def __init__(self, num_features: int, max_sequence_length: int):
+    def __init__(self, num_features: int, max_sequence_length: Optional[int]):
         """ Init method
         Args:
             num_features (int): Total number of words
-            max_sequence_length (int): Maximum allowed length for an inout sequence
+            max_sequence_length (Optional[int]): Maximum allowed length for an inout sequence, None to accept
+                                                 sequences of any length
         """
         self.num_features = num_features
         self.max_sequence_length = max_sequence_length
@@ -104,17 +176,21 @@ class HybridModel(Model):
             Built model
         """
         print("[HybridModel::build] Building Hybrid model")
+        mask_padding = getattr(model_params, 'mask_padding', True)
+        Embedding = MaskedEmbedding if mask_padding else layers.Embedding
+        Conv1D = MaskedConv1D if mask_padding else layers.Conv1D
+        MaxPooling1D = MaskedMaxPooling1D if mask_padding else layers.MaxPooling1D
         model = Sequential()
         model.add(layers.InputLayer(input_shape=(self.max_sequence_length,), name="input"))
-        model.add(layers.Embedding(input_dim=self.num_features,
-                                   output_dim=model_params.embedding_dim,
-                                   input_length=self.max_sequence_length))
-        model.add(layers.Conv1D(filters=64, kernel_size=3, padding='same', activation='relu'))
-        model.add(layers.MaxPooling1D(pool_size=2))
+        model.add(Embedding(input_dim=self.num_features,
+                            output_dim=model_params.embedding_dim,
+                            input_length=self.max_sequence_length))
+        model.add(Conv1D(filters=64, kernel_size=3, padding='same', activation='relu'))
+        model.add(MaxPooling1D(pool_size=2))
         model.add(layers.LSTM(128, recurrent_dropout=0.2))
         model.add(layers.Dense(1, activation='sigmoid'))
 
         model.compile(optimizer=model_params.optimizer,
                       loss=model_params.loss,
-                      metrics=model_params.metrics)
+                      weighted_metrics=model_params.metrics)
         return model
@@ -0,0 +1,146 @@
+import json
+import os
+from typing import Optional
+
+import numpy as np
+import tensorflow as tf
+
+from detectors.tf_gcp.data_ops.storage import Storage
+
+
+class TFLiteModel(object):
+    """ A post training quantized TFLite version of a trained model, scored through the TFLite interpreter on CPU. It
+        is exported to a directory holding the .tflite flatbuffer and a metadata file in the same format as the one of
+        InferenceModel.
+
+        Sequences have a fixed length of 'max_sequence_length'. Convolutional models also take batches of any size, but
+        the converter only lowers LSTM layers for a fixed batch size, so recurrent models are exported for batches of
+        'batch_size' rows. Larger batches are then scored in slices and smaller ones are padded with empty reviews. """
+
+    FORMAT = 'amazon-reviews-tflite-model'
+    VERSION = 1
+    MODEL_FILE = 'model.tflite'
+    METADATA_FILE = 'metadata.json'
+    # 'dynamic_range' stores weights as int8 and quantizes activations on the fly, 'float16' stores weights as float16
+    QUANTIZATIONS = ('none', 'dynamic_range', 'float16')
+
+    def __init__(self, interpreter: tf.lite.Interpreter, metadata: dict):
+        """ Init method
+        Args:
+            interpreter (tf.lite.Interpreter): interpreter of the exported model
+            metadata (dict): contents of metadata file
+        """
+        self.interpreter = interpreter
+        self.model_type = metadata['model_type']
+        self.max_sequence_length = metadata['max_sequence_length']
+        self.tokenizer_fingerprint = metadata['tokenizer_fingerprint']
+        self.quantization = metadata['quantization']
+        self.input_index = interpreter.get_input_details()[0]['index']
+        self.output_index = interpreter.get_output_details()[0]['index']
+        batch_size = int(interpreter.get_input_details()[0]['shape_signature'][0])
+        self.batch_size = batch_size if batch_size > 0 else None
+        self.input_shape = tuple(interpreter.get_input_details()[0]['shape'])
+
+    @staticmethod
+    def is_exported(path: str, storage: Optional[Storage] = None) -> bool:
+        """ Checks whether path is a directory, local or in Google Cloud Storage, containing an exported TFLite model
+        """
+        return (storage or Storage()).exists(os.path.join(path, TFLiteModel.MODEL_FILE))
+
+    @staticmethod
+    def export(model: tf.keras.Model, path: str, model_type: str, max_sequence_length: int,
+               tokenizer_fingerprint: str, quantization: str = 'dynamic_range', batch_size: int = 64):
+        """ Converts a trained keras model into a TFLite model
+        Args:
+            model (tf.keras.Model): trained model
+            path (str): directory to export to
+            model_type (str): one of 'CNN', 'LSTM' and 'Hybrid'
+            max_sequence_length (int): length to which sequences are padded at prediction time
+            tokenizer_fingerprint (str): fingerprint of the tokenizer the model was trained with
+            quantization (str): one of 'none', 'dynamic_range' and 'float16'
+            batch_size (int): number of rows per interpreter call of models with recurrent layers
+        Returns:
+            Size of the exported model in bytes
+        """
+        if quantization not in TFLiteModel.QUANTIZATIONS:
+            raise ValueError(f"Quantization should be one of {TFLiteModel.QUANTIZATIONS}, not {quantization}")
+
+        is_recurrent = any(isinstance(layer, tf.keras.layers.RNN) for layer in model.layers)
+        input_spec = tf.TensorSpec([batch_size if is_recurrent else None, max_sequence_length], tf.int32,
+                                   name='input')
+        serve = tf.function(lambda sequences: model(sequences, training=False)).get_concrete_function(input_spec)
+        converter = tf.lite.TFLiteConverter.from_concrete_functions([serve], model)
+        if quantization != 'none':
+            converter.optimizations = [tf.lite.Optimize.DEFAULT]
+        if quantization == 'float16':
+            converter.target_spec.supported_types = [tf.float16]
+        flatbuffer = converter.convert()
+
+        os.makedirs(path, exist_ok=True)
+        with open(os.path.join(path, TFLiteModel.MODEL_FILE), 'wb') as fstream:
+            fstream.write(flatbuffer)
+        metadata = {'format': TFLiteModel.FORMAT, 'version': TFLiteModel.VERSION, 'model_type': model_type,
+                    'max_sequence_length': max_sequence_length, 'tokenizer_fingerprint': tokenizer_fingerprint,
+                    'quantization': quantization}
+        with open(os.path.join(path, TFLiteModel.METADATA_FILE), 'w') as fstream:
+            json.dump(metadata, fstream, indent=2)
+        print(f"[TFLiteModel::export] Exported {model_type} model with {quantization} quantization to {path} "
+              f"({len(flatbuffer) / 2 ** 20:.1f}MiB)")
+        return len(flatbuffer)
+
+    @staticmethod
+    def load(path: str, num_threads: Optional[int] = None, storage: Optional[Storage] = None) -> 'TFLiteModel':
+        """ Loads an exported TFLite model. The flatbuffer is read into memory, so the model can be loaded from
+            Google Cloud Storage directly
+        Args:
+            path (str): directory the model was exported to
+            num_threads (Optional[int]): number of threads used by the interpreter, all cores if not given
+            storage (Optional[Storage]): storage the model is read from
+        Returns:
+            TFLiteModel object
+        """
+        storage = storage or Storage()
+        metadata = json.loads(storage.read_bytes(os.path.join(path, TFLiteModel.METADATA_FILE)))
+        if metadata.get('format') != TFLiteModel.FORMAT:
+            raise ValueError(f"{path} is not an exported TFLite model")
+        if metadata.get('version', 0) > TFLiteModel.VERSION:
+            raise ValueError(f"TFLite model {path} has version {metadata['version']}, only versions up to "
+                             f"{TFLiteModel.VERSION} are supported. Please update the code")
+        flatbuffer = storage.read_bytes(os.path.join(path, TFLiteModel.MODEL_FILE))
+        interpreter = tf.lite.Interpreter(model_content=flatbuffer, num_threads=num_threads or os.cpu_count())
+        interpreter.allocate_tensors()
+        return TFLiteModel(interpreter=interpreter, metadata=metadata)
+
+    def _invoke(self, batch: np.ndarray) -> np.ndarray:
+        """ Runs the interpreter on a batch matching its input shape, resizing the input first if it doesn't
+        """
+        if batch.shape != self.input_shape:
+            self.interpreter.resize_tensor_input(self.input_index, batch.shape)
+            self.interpreter.allocate_tensors()
+            self.input_shape = batch.shape
+        self.interpreter.set_tensor(self.input_index, batch)
+        self.interpreter.invoke()
+        return self.interpreter.get_tensor(self.output_index)
+
+    def predict_on_batch(self, batch: np.ndarray) -> np.ndarray:
+        """ Scores a batch of padded sequences, same as keras Model.predict_on_batch. The interpreter isn't thread safe,
+            so calls should not be made concurrently
+        Args:
+            batch (np.ndarray): 2D array of sequences padded to 'max_sequence_length'
+        Returns:
+            Predicted probabilities of shape (len(batch), 1)
+        """
+        batch = np.ascontiguousarray(batch, dtype=np.int32)
+        if self.batch_size is None:
+            return self._invoke(batch).copy()
+
+        probabilities = np.empty((len(batch), 1), dtype=np.float32)
+        for start in range(0, len(batch), self.batch_size):
+            rows = batch[start: start + self.batch_size]
+            if len(rows) < self.batch_size:
+                rows = np.concatenate([rows, np.zeros((self.batch_size - len(rows), batch.shape[1]), np.int32)])
+            probabilities[start: start + self.batch_size] = self._invoke(rows)[:len(batch) - start]
+        return probabilities
+
+    def predict(self, batch: np.ndarray) -> np.ndarray:
+        return self.predict_on_batch(batch)
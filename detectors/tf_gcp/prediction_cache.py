@@ -0,0 +1,123 @@
+import hashlib
+import os
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+from detectors.tf_gcp.data_ops.storage import Storage
+
+
+class PredictionCache(object):
+    """ A bounded least recently used cache of predicted probabilities. Keys are hashes of normalized review texts,
+        keyed with a fingerprint of the model and tokenizer, so predictions of one model are never served for another
+        one. The cache can optionally be persisted to a local .npz file and loaded back by later runs. """
+
+    KEY_SIZE = 16
+
+    def __init__(self, fingerprint: bytes, max_entries: int = 100000, path: Optional[str] = None):
+        """ Init method
+        Args:
+            fingerprint (bytes): fingerprint of model and tokenizer, at most 64 bytes
+            max_entries (int): maximum number of cached predictions
+            path (Optional[str]): local .npz file the cache is loaded from, if it exists, and saved to
+        """
+        self.fingerprint = fingerprint
+        self.max_entries = max_entries
+        self.path = os.path.expanduser(path) if path else None
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        if self.path is not None and os.path.exists(self.path):
+            self.load()
+
+    @staticmethod
+    def make_fingerprint(paths: List[str], *settings, storage: Optional[Storage] = None) -> bytes:
+        """ Creates a fingerprint from contents of files and any other settings
+        Args:
+            paths (List[str]): paths of files or directories, like model weights and tokenizer artifact. Paths in
+                               Google Cloud Storage are identified by md5 checksums of their objects
+            settings: any values whose string representation identifies the predictions
+            storage (Optional[Storage]): storage checksums of paths in Google Cloud Storage are read from
+        Returns:
+            A 32 byte digest
+        """
+        digest = hashlib.sha256()
+        for path in paths:
+            if Storage.is_remote(path):
+                checksums = (storage or Storage()).checksums(path)
+                for name in sorted(checksums):
+                    digest.update(checksums[name].encode())
+                continue
+            files = [path]
+            if os.path.isdir(path):
+                files = sorted(os.path.join(root, name) for root, _, names in os.walk(path) for name in names)
+            for file_path in files:
+                with open(file_path, 'rb') as fstream:
+                    for block in iter(lambda: fstream.read(1 << 20), b''):
+                        digest.update(block)
+        for setting in settings:
+            digest.update(str(setting).encode())
+        return digest.digest()
+
+    def make_key(self, normalized_text: str) -> bytes:
+        return hashlib.blake2b(normalized_text.encode('utf-8'), digest_size=PredictionCache.KEY_SIZE,
+                               key=self.fingerprint).digest()
+
+    def lookup(self, normalized_texts: List[str]) -> Tuple[np.ndarray, Dict[bytes, List[int]]]:
+        """ Looks up predictions of texts. A text is counted as a hit if its prediction is cached or if the same text
+            appears earlier in the input, so that misses count the texts which actually have to be scored.
+        Args:
+            normalized_texts (List[str]): normalized review texts
+        Returns:
+            A tuple containing probabilities of all texts, which are NaN for misses, and a dictionary from keys of
+            missing texts to their positions in the input
+        """
+        probabilities = np.full(len(normalized_texts), np.nan, dtype=np.float32)
+        missing = {}
+        for position, text in enumerate(normalized_texts):
+            key = self.make_key(text)
+            probability = self.entries.get(key)
+            if probability is not None:
+                self.entries.move_to_end(key)
+                probabilities[position] = probability
+            else:
+                missing.setdefault(key, []).append(position)
+        self.misses += len(missing)
+        self.hits += len(normalized_texts) - len(missing)
+        return probabilities, missing
+
+    def update(self, keys: List[bytes], probabilities: np.ndarray):
+        """ Adds predictions to the cache, evicting least recently used ones beyond 'max_entries'
+        Args:
+            keys (List[bytes]): keys returned by lookup
+            probabilities (np.ndarray): predicted probabilities, one per key
+        """
+        for key, probability in zip(keys, probabilities.tolist()):
+            self.entries[key] = probability
+            self.entries.move_to_end(key)
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+
+    def load(self):
+        """ Loads entries from the persistence file, least recently used first
+        """
+        with np.load(self.path) as saved:
+            keys, probabilities = saved['keys'], saved['probabilities']
+        self.update([key.tobytes() for key in keys], probabilities)
+        print(f"[PredictionCache::load] Loaded {len(self.entries)} cached predictions from {self.path}")
+
+    def save(self):
+        """ Saves entries to the persistence file, if there is one
+        """
+        if self.path is None:
+            return
+        if os.path.dirname(self.path):
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        keys = np.frombuffer(b''.join(self.entries.keys()), dtype=np.uint8).reshape(-1, PredictionCache.KEY_SIZE)
+        probabilities = np.fromiter(self.entries.values(), dtype=np.float32, count=len(self.entries))
+        # Written to a temporary file first, so that a crash never leaves a truncated cache behind
+        tmp_path = f"{self.path}.{os.getpid()}.tmp.npz"
+        np.savez(tmp_path, keys=keys, probabilities=probabilities)
+        os.replace(tmp_path, self.path)
+        print(f"[PredictionCache::save] Saved {len(self.entries)} cached predictions to {self.path}")
@@ -0,0 +1,256 @@
+import copy
+import multiprocessing
+import os
+import random
+import tempfile
+import time
+from argparse import Namespace
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from datetime import datetime
+from typing import Dict, List, Optional
+
+import pandas as pd
+
+from detectors.tf_gcp.callbacks import MedianStoppingCallback
+from detectors.tf_gcp.common import SystemOps
+from detectors.tf_gcp.data_ops.sequences import RaggedSequences
+from detectors.tf_gcp.data_ops.shared_arrays import SharedArrays
+from detectors.tf_gcp.trainer import Trainer, TokenizerDetails
+
+# Arrays of the sweep, attached once by every trial process
+_worker_arrays: Optional[SharedArrays] = None
+
+
+def _init_trial_worker(specs: Dict, threads: int):
+    """ Attaches a trial process to preprocessed data and limits the threads tensorflow runs ops on
+    """
+    global _worker_arrays
+    import tensorflow as tf
+    tf.config.threading.set_intra_op_parallelism_threads(threads)
+    tf.config.threading.set_inter_op_parallelism_threads(threads)
+    _worker_arrays = SharedArrays.attach(specs)
+
+
+def _run_trial(name: str, config: Dict, output_dir: str, tokenizer_path: str, stopping: Optional[Dict]) -> Dict:
+    """ Trains and saves the model of a trial on the shared preprocessed data, in a temporary directory of its own
+    Args:
+        name (str): name of the trial
+        config (Dict): configuration of the trial
+        output_dir (str): run directory of the trial
+        tokenizer_path (str): local path of the tokenizer artifact sequences were created with
+        stopping (Optional[Dict]): arguments of MedianStoppingCallback, None to let every trial run all its epochs
+    Returns:
+        Dictionary containing status, history and wall and CPU time of the trial
+    """
+    import tensorflow as tf
+    start_time, start_cpu = time.perf_counter(), os.times()
+    result = {'trial': name, 'status': 'completed', 'history': {}, 'error': None}
+    cwd = os.getcwd()
+    with tempfile.TemporaryDirectory(prefix=f"{name}_") as work_dir:
+        os.chdir(work_dir)
+        try:
+            trainer = Trainer(config=config, output_dir=output_dir)
+            trainer.tokenizer_details = TokenizerDetails.load(tokenizer_path)
+            SystemOps.create_dir('parser_output')
+            trainer.save_tokenizer()
+            trainer.save_word_index()
+
+            arrays = _worker_arrays.arrays
+            callbacks = [] if stopping is None else [MedianStoppingCallback(trial=name, **stopping)]
+            history = trainer.train_on(RaggedSequences(values=arrays['X_train_values'],
+                                                       offsets=arrays['X_train_offsets']), arrays['y_train'],
+                                       RaggedSequences(values=arrays['X_val_values'], offsets=arrays['X_val_offsets']),
+                                       arrays['y_val'], callbacks=callbacks)
+            result['history'] = {key: [float(value) for value in values] for key, values in history.history.items()}
+            if callbacks and callbacks[0].stopped_epoch is not None:
+                result['status'] = 'stopped'
+        except Exception as error:
+            print(f"[Sweep::run] Trial {name} failed: {error!r}")
+            result.update(status='failed', error=repr(error))
+        finally:
+            os.chdir(cwd)
+            tf.keras.backend.clear_session()
+    end_cpu = os.times()
+    result.update(wall_seconds=time.perf_counter() - start_time,
+                  cpu_seconds=end_cpu.user + end_cpu.system - start_cpu.user - start_cpu.system)
+    return result
+
+
+class Sweep(object):
+    """ Trains a model for every combination of a search space over model and train parameters, taken from
+        'sweep_params' in config, and ranks them by a validation metric.
+
+        Train data is downloaded and preprocessed once, as Trainer does it, and the arrays are put in shared memory,
+        which a pool of trial processes reads without copies of its own. Every trial process runs ops on
+        'trial_threads' threads, and only as many of them run at once as fit in 'cpu_budget' cores. Each trial gets a
+        run directory of its own inside the sweep directory, with its tokenizer, checkpoints and trained model, so any
+        of them can be used by Predictor. With 'early_stopping', trials falling behind the median of other trials are
+        stopped, see MedianStoppingCallback. A leaderboard of all trials, with their best validation metrics and how
+        much wall and CPU time they took, is written to leaderboard.csv in the sweep directory. """
+
+    SEARCHES = ('grid', 'random')
+    SECTIONS = ('model_params', 'train_params')
+    LEADERBOARD_NAME = 'leaderboard.csv'
+    PROGRESS_DIR = 'sweep_progress'
+
+    def __init__(self, config: dict):
+        """ Init method
+        Args:
+            config (dict): Dictionary containing configurations
+        """
+        self.config = config
+        self.sweep_params = Namespace(**config.get('sweep_params'))
+        self.search = getattr(self.sweep_params, 'search', 'grid')
+        if self.search not in Sweep.SEARCHES:
+            raise ValueError(f"'search' should be one of {Sweep.SEARCHES}, not {self.search}")
+        self.space = self.sweep_params.space
+        for section in self.space:
+            if section not in Sweep.SECTIONS:
+                raise ValueError(f"Search space can only cover {Sweep.SECTIONS}, not {section}")
+        self.monitor = getattr(self.sweep_params, 'monitor', 'val_accuracy')
+        self.mode = getattr(self.sweep_params, 'mode', 'max')
+        if self.mode not in ('min', 'max'):
+            raise ValueError(f"'mode' should either be 'min' or 'max', not {self.mode}")
+
+        self.cpu_budget = getattr(self.sweep_params, 'cpu_budget', None) or os.cpu_count()
+        self.trial_threads = min(getattr(self.sweep_params, 'trial_threads', 1), self.cpu_budget)
+        self.num_parallel = max(self.cpu_budget // self.trial_threads, 1)
+
+        # Preprocessing, tokenizer and uploads of the sweep itself
+        self.trainer = Trainer(config=config, output_dir=os.path.join(
+            config['train_params']['output_dir'], f"sweep_{datetime.now().strftime('%Y_%m_%d-%H:%M:%S')}"))
+        self.output_dir = self.trainer.output_dir
+
+    def trials(self) -> List[Dict[str, Dict]]:
+        """ Parameter overrides of every trial. A grid search covers every combination of values in the search space,
+            a random search 'num_trials' distinct combinations of them drawn with 'seed'
+        Returns:
+            A list of dictionaries holding 'model_params' and 'train_params' overrides of each trial
+        """
+        axes = [(section, key, values) for section, params in self.space.items() for key, values in params.items()]
+        sizes = [len(values) for _, _, values in axes]
+        num_combinations = 1
+        for size in sizes:
+            num_combinations *= size
+
+        if self.search == 'grid':
+            indices = range(num_combinations)
+        else:
+            num_trials = min(self.sweep_params.num_trials, num_combinations)
+            indices = random.Random(getattr(self.sweep_params, 'seed', 0)).sample(range(num_combinations), num_trials)
+
+        trials = []
+        for index in indices:
+            # Position along every axis of the grid, with the last axis varying fastest
+            positions = []
+            for size in reversed(sizes):
+                index, position = divmod(index, size)
+                positions.append(position)
+            overrides = {section: {} for section in Sweep.SECTIONS}
+            for (section, key, values), position in zip(axes, reversed(positions)):
+                overrides[section][key] = values[position]
+            trials.append(overrides)
+        return trials
+
+    def trial_config(self, overrides: Dict[str, Dict]) -> Dict:
+        """ Configuration of a trial. Trials train in a single process each, with generators running on the
+            trial's own threads, so that they keep within their share of cores. Trials are never resumed
+        """
+        config = copy.deepcopy(self.config)
+        config.pop('sweep_params')
+        for section, params in overrides.items():
+            config[section].update(params)
+        config['train_params'].update(num_replicas=1, workers=1, use_multiprocessing=False, resume=False)
+        return config
+
+    def leaderboard(self, trials: List[Dict[str, Dict]], results: Dict[str, Dict]) -> pd.DataFrame:
+        """ Ranks trials by their best value of 'monitor', failed trials last
+        Returns:
+            A dataframe with a row per trial, holding its parameters, status, validation metrics of its best epoch and
+            wall and CPU time it took
+        """
+        rows = []
+        for idx, overrides in enumerate(trials):
+            name = f"trial_{idx:03d}"
+            result = results[name]
+            row = {'trial': name}
+            row.update({key: value for params in overrides.values() for key, value in params.items()})
+            history = result['history']
+            values = history.get(self.monitor) or []
+            row.update(status=result['status'], epochs=len(values), best_epoch=None)
+            if values:
+                best = values.index(max(values) if self.mode == 'max' else min(values))
+                row['best_epoch'] = best + 1
+                row.update({key: metric_values[best] for key, metric_values in history.items()
+                            if key.startswith('val_') and len(metric_values) > best})
+            row.update(wall_seconds=result['wall_seconds'], cpu_seconds=result['cpu_seconds'],
+                       output_dir=os.path.join(self.output_dir, name), error=result['error'])
+            rows.append(row)
+
+        leaderboard = pd.DataFrame(rows)
+        if self.monitor not in leaderboard:
+            leaderboard[self.monitor] = None
+        leaderboard = leaderboard.sort_values(self.monitor, ascending=self.mode == 'min', na_position='last',
+                                              kind='stable')
+        leaderboard.insert(0, 'rank', range(1, len(leaderboard) + 1))
+        return leaderboard
+
+    def run(self) -> pd.DataFrame:
+        """ Preprocesses train data, runs all trials and writes the leaderboard
+        Returns:
+            The leaderboard, see leaderboard
+        """
+        trials = self.trials()
+        print(f"[Sweep::run] {self.search} search over {len(trials)} trials, {self.num_parallel} at once with "
+              f"{self.trial_threads} thread(s) each")
+
+        SystemOps.create_dir('parser_output')
+        X_train, y_train, X_val, y_val = self.trainer.load_or_preprocess()
+        tokenizer_path = os.path.abspath(Trainer.TOKENIZER_PATH)
+
+        stopping = None
+        if getattr(self.sweep_params, 'early_stopping', False):
+            progress_dir = os.path.abspath(Sweep.PROGRESS_DIR)
+            SystemOps.check_and_delete(progress_dir)
+            SystemOps.create_dir(progress_dir)
+            stopping = {'progress_dir': progress_dir, 'monitor': self.monitor, 'mode': self.mode,
+                        'grace_epochs': getattr(self.sweep_params, 'grace_epochs', 1),
+                        'min_trials': getattr(self.sweep_params, 'min_trials', 3)}
+
+        results = {}
+        arrays = {'X_train_values': X_train.values, 'X_train_offsets': X_train.offsets, 'y_train': y_train,
+                  'X_val_values': X_val.values, 'X_val_offsets': X_val.offsets, 'y_val': y_val}
+        with self.trainer.instrumentation.stage('sweep', items=len(trials), unit='trials'), \
+                SharedArrays.create(arrays) as shared, \
+                ProcessPoolExecutor(max_workers=self.num_parallel, mp_context=multiprocessing.get_context('spawn'),
+                                    initializer=_init_trial_worker,
+                                    initargs=(shared.specs, self.trial_threads)) as executor:
+            # Preprocessed data now lives in shared memory only
+            del X_train, y_train, X_val, y_val, arrays
+            futures = {}
+            for idx, overrides in enumerate(trials):
+                name = f"trial_{idx:03d}"
+                print(f"[Sweep::run] Submitting {name}: {overrides}")
+                futures[executor.submit(_run_trial, name, self.trial_config(overrides),
+                                        os.path.join(self.output_dir, name), tokenizer_path, stopping)] = name
+            for future in as_completed(futures):
+                result = future.result()
+                results[result['trial']] = result
+                values = result['history'].get(self.monitor)
+                last_value = f"{self.monitor} {values[-1]:.4f}, " if values else ''
+                print(f"[Sweep::run] {result['trial']} {result['status']} after {result['wall_seconds']:.1f}s, "
+                      f"{last_value}{len(results)}/{len(trials)} trials done")
+
+        leaderboard = self.leaderboard(trials, results)
+        with pd.option_context('display.max_columns', None, 'display.width', 200):
+            print(leaderboard.drop(columns=['output_dir', 'error']).to_string(index=False))
+        leaderboard.to_csv(Sweep.LEADERBOARD_NAME, index=False)
+
+        io_operator = self.trainer.create_io_operator()
+        print(f"[Sweep::run] Copying leaderboard to {self.output_dir}")
+        io_operator.write(Sweep.LEADERBOARD_NAME, self.output_dir, use_system_cmd=False)
+        io_operator.write('parser_output', self.output_dir, use_system_cmd=False)
+        self.trainer.save_instrumentation(io_operator)
+        SystemOps.check_and_delete(Sweep.LEADERBOARD_NAME)
+        SystemOps.check_and_delete(Sweep.PROGRESS_DIR)
+        return leaderboard
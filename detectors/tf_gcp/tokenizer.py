@@ -0,0 +1,351 @@
+import re
+from itertools import repeat
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+from tensorflow.keras.preprocessing.text import Tokenizer
+
+from detectors.tf_gcp.data_ops.sequences import RaggedSequences
+
+
+class FastTokenizer(object):
+    """ A drop-in replacement for text to sequence conversion of a fitted keras Tokenizer, which produces the exact
+        same sequences as keras. Only the words that can actually end up in a sequence, i.e. the ones below
+        'num_words', are kept in the vocabulary.
+
+        texts_to_sequences splits texts with a single compiled regex. texts_to_padded works on arrays instead: a block
+        of texts is encoded into one byte buffer, words are located and packed into integer keys with vectorized numpy
+        operations, looked up in an open addressing table built from the vocabulary and scattered straight into a
+        pre-padded matrix, without creating a python object per word. texts_to_ragged uses the same path but keeps
+        sequences unpadded. """
+
+    BLOCK_SIZE = 2048
+    BYTE_MASKS = np.array([(1 << (8 * n)) - 1 for n in range(9)], dtype=np.uint64)
+
+    def __init__(self, vocabulary: Dict[str, int], word_index_size: int, num_words: Optional[int] = None,
+                 filters: str = '!"#$%&()*+,-./:;<=>?@[\\]^_`{|}~\t\n', lower: bool = True, split: str = ' ',
+                 oov_token: Optional[str] = None):
+        """ Init method
+        Args:
+            vocabulary (Dict[str, int]): mapping from words to their indices, restricted to indices below 'num_words'
+            word_index_size (int): size of complete word index of the fitted tokenizer
+            num_words (Optional[int]): maximum number of words to keep, same as keras Tokenizer
+            filters (str): characters which are filtered out of texts, same as keras Tokenizer
+            lower (bool): whether to convert texts to lower case, same as keras Tokenizer
+            split (str): separator for word splitting, same as keras Tokenizer
+            oov_token (Optional[str]): out of vocabulary token, same as keras Tokenizer
+        """
+        self.vocabulary = vocabulary
+        self.word_index_size = word_index_size
+        self.num_words = num_words
+        self.filters = filters
+        self.lower = lower
+        self.split = split
+        self.oov_token = oov_token
+        self.oov_index = vocabulary.get(oov_token) if oov_token is not None else None
+
+        # Keras replaces every filter character by 'split' and splits on it, dropping empty words. For a single
+        # character separator, that is the same as finding all runs of characters which are neither.
+        self._pattern = None
+        if len(split) == 1:
+            self._pattern = re.compile(f"[^{re.escape(filters + split)}]+")
+        self._translate_map = str.maketrans({c: split for c in filters})
+
+        # UTF-8 never uses ascii bytes inside multi byte characters, so texts can be split on raw bytes as long as
+        # all the delimiters are ascii characters. Otherwise texts_to_padded falls back to texts_to_sequences.
+        self._delimiters = None
+        if len(split) == 1 and all(ord(c) < 128 for c in filters + split):
+            self._delimiters = np.zeros(256, dtype=bool)
+            self._delimiters[[ord(c) for c in filters + split]] = True
+        self._table = None
+
+    def __getstate__(self):
+        """ Leaves out the lookup table while pickling, it is cheaper to rebuild than to transfer
+        """
+        state = self.__dict__.copy()
+        state.update(_table=None)
+        return state
+
+    @classmethod
+    def from_keras(cls, tokenizer: Tokenizer) -> 'FastTokenizer':
+        """ Creates a fast tokenizer from a fitted keras tokenizer
+        Args:
+            tokenizer (Tokenizer): fitted keras tokenizer
+        Returns:
+            FastTokenizer object which produces the same sequences as input tokenizer
+        """
+        if tokenizer.char_level or tokenizer.analyzer is not None:
+            raise ValueError("Character level tokenizers and tokenizers with custom analyzers are not supported")
+
+        num_words = tokenizer.num_words
+        vocabulary = {word: index for word, index in tokenizer.word_index.items()
+                      if not num_words or index < num_words}
+        return cls(vocabulary=vocabulary, word_index_size=len(tokenizer.word_index), num_words=num_words,
+                   filters=tokenizer.filters, lower=tokenizer.lower, split=tokenizer.split,
+                   oov_token=tokenizer.oov_token)
+
+    def get_config(self) -> Dict:
+        """ Returns settings and vocabulary of the tokenizer as a json serializable dictionary. The vocabulary is stored
+            as a list of words ordered by their indices, which always run from 1 up to the vocabulary size.
+        """
+        return {'num_words': self.num_words, 'filters': self.filters, 'lower': self.lower, 'split': self.split,
+                'oov_token': self.oov_token, 'word_index_size': self.word_index_size,
+                'vocabulary': sorted(self.vocabulary, key=self.vocabulary.get)}
+
+    @classmethod
+    def from_config(cls, config: Dict) -> 'FastTokenizer':
+        """ Creates a tokenizer from the output of get_config
+        Args:
+            config (Dict): settings and vocabulary of the tokenizer
+        """
+        config = dict(config)
+        words = config.pop('vocabulary')
+        return cls(vocabulary=dict(zip(words, range(1, len(words) + 1))), **config)
+
+    def text_to_word_sequence(self, text: str) -> List[str]:
+        """ Splits a text into words
+        Args:
+            text (str): input text
+        Returns:
+            A list of words
+        """
+        if self.lower:
+            text = text.lower()
+        if self._pattern is not None:
+            return self._pattern.findall(text)
+        return [word for word in text.translate(self._translate_map).split(self.split) if word]
+
+    def normalize(self, text: str) -> str:
+        """ Reduces a text to the words it is converted from, joined by 'split'. Texts which normalize to the same
+            string are always converted to the same sequence
+        Args:
+            text (str): input text
+        Returns:
+            Normalized text
+        """
+        return self.split.join(self.text_to_word_sequence(text))
+
+    def text_to_sequence(self, text: str) -> List[int]:
+        """ Converts a text to a sequence of word indices
+        Args:
+            text (str): input text
+        Returns:
+            A list of integers
+        """
+        words = self.text_to_word_sequence(text)
+        if self.oov_index is None:
+            # indices start from 1, so filtering out falsy values drops only the missing words
+            return list(filter(None, map(self.vocabulary.get, words)))
+        return list(map(self.vocabulary.get, words, repeat(self.oov_index)))
+
+    def texts_to_sequences(self, texts: List[str]) -> List[List[int]]:
+        """ Converts texts to sequences of word indices
+        Args:
+            texts (List[str]): input texts
+        Returns:
+            A list of sequences
+        """
+        return [self.text_to_sequence(text) for text in texts]
+
+    @staticmethod
+    def _encode(texts: List[str], separator: str) -> Tuple[np.ndarray, np.ndarray]:
+        """ Encodes texts into a single utf-8 byte buffer
+        Args:
+            texts (List[str]): input texts
+            separator (str): delimiter character placed between consecutive texts
+        Returns:
+            A tuple containing the uint8 buffer and offsets at which each text starts, followed by the buffer size.
+            The buffer is followed by 16 zero bytes, which are not part of its size.
+        """
+        encoded = [text.encode('utf-8', 'surrogatepass') for text in texts]
+        sizes = np.fromiter(map(len, encoded), dtype=np.int64, count=len(encoded))
+        offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+        np.cumsum(sizes + 1, out=offsets[1:])
+        raw = separator.encode().join(encoded) + bytes(16)
+        return np.frombuffer(raw, dtype=np.uint8), offsets
+
+    def _locate_words(self, buffer: np.ndarray, size: int) -> Tuple[np.ndarray, np.ndarray]:
+        """ Finds words, i.e. runs of bytes which are not delimiters, in a byte buffer
+        Args:
+            buffer (np.ndarray): uint8 buffer created by _encode
+            size (int): number of bytes of the buffer to be searched
+        Returns:
+            A tuple containing start offsets and lengths of words
+        """
+        is_word = ~self._delimiters.take(buffer[:size])
+        edges = np.diff(is_word.view(np.int8), prepend=np.int8(0), append=np.int8(0))
+        starts = np.flatnonzero(edges == 1)
+        return starts, np.flatnonzero(edges == -1) - starts
+
+    @staticmethod
+    def _word_keys(buffer: np.ndarray, starts: np.ndarray, lengths: np.ndarray) -> Tuple[np.ndarray, np.ndarray,
+                                                                                           np.ndarray]:
+        """ Packs the first 16 bytes of every word into two integers, which together with the word length identify
+            words of up to 16 bytes exactly, and mixes them into a hash which spreads words over table slots
+        Args:
+            buffer (np.ndarray): uint8 buffer created by _encode
+            starts (np.ndarray): start offsets of words
+            lengths (np.ndarray): lengths of words
+        Returns:
+            A tuple containing first eight bytes, next eight bytes and hashes of words
+        """
+        # An overlapping view of the buffer, element i holds the eight bytes starting at offset i. Thanks to the zero
+        # bytes following the buffer, the view can be read at any word start.
+        packed = np.ndarray(shape=(len(buffer) - 7,), dtype='<u8', buffer=buffer, strides=(1,))
+        low = packed[starts] & FastTokenizer.BYTE_MASKS[np.minimum(lengths, 8)]
+        high = np.zeros(len(starts), dtype=np.uint64)
+        is_long = lengths > 8
+        high[is_long] = packed[starts[is_long] + 8] & FastTokenizer.BYTE_MASKS[np.minimum(lengths[is_long] - 8, 8)]
+
+        # Finalizer of MurmurHash3, applied to a combination of the keys
+        with np.errstate(over='ignore'):
+            hashes = low ^ (high * np.uint64(0x9E3779B97F4A7C15)) ^ (lengths.astype(np.uint64) << np.uint64(56))
+            hashes ^= hashes >> np.uint64(33)
+            hashes *= np.uint64(0xFF51AFD7ED558CCD)
+            hashes ^= hashes >> np.uint64(33)
+            hashes *= np.uint64(0xC4CEB9FE1A85EC53)
+            hashes ^= hashes >> np.uint64(33)
+        return low, high, hashes
+
+    def _build_table(self):
+        """ Builds an open addressing hash table from the vocabulary. Words longer than 16 bytes are kept in a separate
+            dictionary. Words containing delimiters, like the default oov token, can never come out of splitting and
+            are left out.
+        """
+        words = [word for word in self.vocabulary
+                 if not any(self._delimiters.take(np.frombuffer(word.encode('utf-8', 'surrogatepass'), np.uint8)))]
+        buffer, offsets = FastTokenizer._encode(words, separator=self.split)
+        starts, lengths = self._locate_words(buffer, int(offsets[-1]) - 1 if words else 0)
+        low, high, hashes = FastTokenizer._word_keys(buffer, starts, lengths)
+
+        bits = max(int(len(words) * 4).bit_length(), 4)
+        mask = (1 << bits) - 1
+        table = {'low': np.zeros(1 << bits, dtype=np.uint64), 'high': np.zeros(1 << bits, dtype=np.uint64),
+                 'length': np.zeros(1 << bits, dtype=np.int64), 'index': np.zeros(1 << bits, dtype=np.int32),
+                 'bits': bits, 'max_probe': 0, 'long_words': {}}
+        for word, word_low, word_high, word_length, word_hash in zip(words, low.tolist(), high.tolist(),
+                                                                     lengths.tolist(), hashes.tolist()):
+            if word_length > 16:
+                table['long_words'][word.encode('utf-8', 'surrogatepass')] = self.vocabulary[word]
+                continue
+            slot, probe = word_hash >> (64 - bits), 0
+            while table['index'][slot] != 0:
+                slot, probe = (slot + 1) & mask, probe + 1
+            table['low'][slot], table['high'][slot], table['length'][slot] = word_low, word_high, word_length
+            table['index'][slot] = self.vocabulary[word]
+            table['max_probe'] = max(table['max_probe'], probe)
+        self._table = table
+
+    def _lookup(self, buffer: np.ndarray, starts: np.ndarray, lengths: np.ndarray) -> np.ndarray:
+        """ Looks up words in the vocabulary table
+        Args:
+            buffer (np.ndarray): uint8 buffer created by _encode
+            starts (np.ndarray): start offsets of words
+            lengths (np.ndarray): lengths of words
+        Returns:
+            An int32 array of word indices, 0 for words which are not in the vocabulary
+        """
+        table = self._table
+        low, high, hashes = FastTokenizer._word_keys(buffer, starts, lengths)
+        result = np.zeros(len(starts), dtype=np.int32)
+
+        pending = np.flatnonzero(lengths <= 16)
+        slots = (hashes[pending] >> np.uint64(64 - table['bits'])).astype(np.int64)
+        for _ in range(table['max_probe'] + 1):
+            found = table['index'][slots]
+            hit = ((found != 0) & (table['low'][slots] == low[pending]) & (table['high'][slots] == high[pending])
+                   & (table['length'][slots] == lengths[pending]))
+            result[pending[hit]] = found[hit]
+            unresolved = (found != 0) & ~hit
+            pending, slots = pending[unresolved], (slots[unresolved] + 1) & ((1 << table['bits']) - 1)
+            if len(pending) == 0:
+                break
+
+        for idx in np.flatnonzero(lengths > 16).tolist():
+            word = buffer[starts[idx]: starts[idx] + lengths[idx]].tobytes()
+            result[idx] = table['long_words'].get(word, 0)
+        return result
+
+    def _sequence_block(self, texts: List[str], maxlen: int) -> Tuple[np.ndarray, np.ndarray]:
+        """ Converts a block of texts to sequences, keeping only the last 'maxlen' words of each text like keras
+            pad_sequences does
+        Args:
+            texts (List[str]): input texts
+            maxlen (int): maximum length of a sequence
+        Returns:
+            A tuple containing word indices of all sequences concatenated and the length of each sequence
+        """
+        if self.lower:
+            texts = [text.lower() for text in texts]
+        buffer, offsets = FastTokenizer._encode(texts, separator=self.split)
+        starts, lengths = self._locate_words(buffer, int(offsets[-1]) - 1)
+
+        word_indices = self._lookup(buffer, starts, lengths)
+        if self.oov_index is None:
+            keep = word_indices != 0
+            word_indices, starts = word_indices[keep], starts[keep]
+        else:
+            word_indices[word_indices == 0] = self.oov_index
+
+        # Texts are separated by a single delimiter in the buffer, so each text owns the words starting between its
+        # own offset and the next one
+        bounds = np.searchsorted(starts, offsets)
+        counts = np.diff(bounds)
+        from_end = np.repeat(bounds[1:], counts) - np.arange(len(word_indices))
+        return word_indices[from_end <= maxlen], np.minimum(counts, maxlen)
+
+    def texts_to_padded(self, texts: List[str], maxlen: int) -> np.ndarray:
+        """ Converts texts to sequences and writes them into a pre-padded matrix. The result is the same as calling
+            keras pad_sequences with default arguments on the output of texts_to_sequences.
+        Args:
+            texts (List[str]): input texts
+            maxlen (int): length of every sequence in output matrix
+        Returns:
+            An int32 matrix of shape (len(texts), maxlen)
+        """
+        padded = np.zeros((len(texts), maxlen), dtype=np.int32)
+        if self._delimiters is None:
+            for row, sequence in enumerate(self.texts_to_sequences(texts)):
+                sequence = sequence[-maxlen:]
+                if sequence:
+                    padded[row, maxlen - len(sequence):] = sequence
+            return padded
+
+        if self._table is None:
+            self._build_table()
+        for start in range(0, len(texts), FastTokenizer.BLOCK_SIZE):
+            block = texts[start: start + FastTokenizer.BLOCK_SIZE]
+            values, lengths = self._sequence_block(block, maxlen)
+            # Sequences are aligned to the right end of their rows
+            rows = np.repeat(np.arange(start, start + len(block)), lengths)
+            columns = maxlen - np.repeat(np.cumsum(lengths), lengths) + np.arange(len(values))
+            padded[rows, columns] = values
+        return padded
+
+    def texts_to_ragged(self, texts: List[str], maxlen: int, dtype: type = np.int32) -> RaggedSequences:
+        """ Converts texts to sequences stored back to back without padding. Each sequence holds the same words as the
+            corresponding row of texts_to_padded(texts, maxlen), minus the padding.
+        Args:
+            texts (List[str]): input texts
+            maxlen (int): maximum length of a sequence, longer sequences are truncated from the start
+            dtype (type): integer type of word indices in the output, it must be able to hold all vocabulary indices
+        Returns:
+            RaggedSequences object with one sequence per text
+        """
+        max_index = max(self.vocabulary.values(), default=0)
+        if max_index > np.iinfo(dtype).max:
+            raise ValueError(f"Word index {max_index} does not fit in {np.dtype(dtype).name}")
+
+        if self._delimiters is None:
+            sequences = [sequence[-maxlen:] for sequence in self.texts_to_sequences(texts)]
+            values = np.fromiter((index for sequence in sequences for index in sequence), dtype=dtype)
+            return RaggedSequences.from_lengths(values, np.array([len(sequence) for sequence in sequences]))
+
+        if self._table is None:
+            self._build_table()
+        values, lengths = [np.empty(0, dtype=dtype)], [np.empty(0, dtype=np.int64)]
+        for start in range(0, len(texts), FastTokenizer.BLOCK_SIZE):
+            block_values, block_lengths = self._sequence_block(texts[start: start + FastTokenizer.BLOCK_SIZE], maxlen)
+            values.append(block_values.astype(dtype, copy=False))
+            lengths.append(block_lengths)
+        return RaggedSequences.from_lengths(np.concatenate(values), np.concatenate(lengths))
@@ -1,23 +1,41 @@
+import hashlib
+import json
 import os
 import pickle
 import zipfile
 from argparse import Namespace
 from datetime import datetime
-from typing import Tuple
+from typing import Iterator, List, Optional, Tuple, Union
 
 import numpy as np
 import pandas as pd
-from tensorflow.keras.preprocessing import sequence
+import tensorflow as tf
 from tensorflow.keras.preprocessing.text import Tokenizer
 
 from detectors.tf_gcp.common import BucketOps, SystemOps
-from detectors.tf_gcp.callbacks import CallBacksCreator
-from detectors.tf_gcp.data_ops.data_generator import DataGenerator
+from detectors.tf_gcp.callbacks import CallBacksCreator, TrainingStateCallback
+from detectors.tf_gcp.data_ops.cache import PreprocessCache
+from detectors.tf_gcp.data_ops.data_generator import BucketedDataGenerator, DataGenerator
+from detectors.tf_gcp.data_ops.dataset import SequenceDataset
 from detectors.tf_gcp.data_ops.io_ops import CloudIO, LocalIO
+from detectors.tf_gcp.data_ops.preprocessor import ParallelPreprocessor
+from detectors.tf_gcp.data_ops.sequences import RaggedSequences
+from detectors.tf_gcp.data_ops.storage import Storage
+from detectors.tf_gcp.distributed import LocalCluster
+from detectors.tf_gcp.instrumentation import Instrumentation, path_size
+from detectors.tf_gcp.models.inference_model import InferenceModel
 from detectors.tf_gcp.models.models import CNNModel, LSTMModel, HybridModel
+from detectors.tf_gcp.tokenizer import FastTokenizer
+from detectors.tf_gcp.vocabulary import HeavyHittersVocabulary
 
 
 class TokenizerDetails(object):
+    """ Tokenizer along with the settings it was used with during training. It is saved as a small versioned json
+        artifact containing only the TOP_K vocabulary and tokenizer settings. Pickled TokenizerDetails objects
+        holding a whole keras Tokenizer, which older versions saved, can still be loaded. """
+
+    FORMAT = 'amazon-reviews-tokenizer'
+    VERSION = 1
 
     def __init__(self, **kwargs):
         """ Init method
@@ -26,17 +44,77 @@ class TokenizerDetails(object):
         self.top_k = kwargs.get('top_k', 20000)
         self.max_sequence_length = kwargs.get('max_sequence_length', 500)
 
+    @property
+    def num_features(self) -> int:
+        """ Number of rows of the embedding table of models trained with this tokenizer
+        """
+        return min(self.tokenizer.word_index_size + 1, self.top_k)
+
+    @property
+    def fingerprint(self) -> str:
+        """ Digest of vocabulary and settings. It is the same for a json artifact and the legacy pickle it was
+            converted from
+        """
+        content = json.dumps({'top_k': self.top_k, 'max_sequence_length': self.max_sequence_length,
+                              'tokenizer': self.tokenizer.get_config()}, sort_keys=True, ensure_ascii=False)
+        return hashlib.sha256(content.encode('utf-8')).hexdigest()
+
+    def save(self, path: str):
+        """ Saves tokenizer artifact as a json file
+        Args:
+            path (str): path of output file
+        """
+        artifact = {'format': TokenizerDetails.FORMAT, 'version': TokenizerDetails.VERSION, 'top_k': self.top_k,
+                    'max_sequence_length': self.max_sequence_length, 'tokenizer': self.tokenizer.get_config()}
+        with open(path, 'w') as fstream:
+            json.dump(artifact, fstream, ensure_ascii=False, separators=(',', ':'))
+
+    @staticmethod
+    def load(path: str, storage: Optional[Storage] = None) -> 'TokenizerDetails':
+        """ Loads tokenizer artifact from a json file, or from a legacy pickle file
+        Args:
+            path (str): path of artifact, local or in Google Cloud Storage
+            storage (Optional[Storage]): storage the artifact is read from
+        Returns:
+            TokenizerDetails object whose tokenizer is a FastTokenizer
+        """
+        content = (storage or Storage()).read_bytes(path)
+
+        # Pickles created with protocol 2 or above start with the PROTO opcode
+        if content[:1] == pickle.PROTO:
+            legacy = pickle.loads(content)
+            return TokenizerDetails(tokenizer=FastTokenizer.from_keras(legacy.tokenizer), top_k=legacy.top_k,
+                                    max_sequence_length=legacy.max_sequence_length)
+
+        artifact = json.loads(content.decode('utf-8'))
+        if artifact.get('format') != TokenizerDetails.FORMAT:
+            raise ValueError(f"{path} is not a tokenizer artifact")
+        if artifact.get('version', 0) > TokenizerDetails.VERSION:
+            raise ValueError(f"Tokenizer artifact {path} has version {artifact['version']}, only versions up to "
+                             f"{TokenizerDetails.VERSION} are supported. Please update the code")
+        return TokenizerDetails(tokenizer=FastTokenizer.from_config(artifact['tokenizer']), top_k=artifact['top_k'],
+                                max_sequence_length=artifact['max_sequence_length'])
+
 
 class Trainer(object):
     MODEL_NAME = 'Amazon_Reviews_Analysis.hdf5'
+    INFERENCE_MODEL_NAME = 'inference_model'
     TOP_K = 20000
     MAX_SEQUENCE_LENGTH = 500
+    VOCABULARIES = ('exact', 'heavy_hitters')
+    INPUT_PIPELINES = ('generator', 'tf_data')
+    TOKENIZER_PATH = os.path.join('parser_output', 'tokenizer.json')
+    INSTRUMENTATION_PATH = 'instrumentation.json'
+    REPLICA_DATA_DIR = 'replica_data'
 
-    def __init__(self, config: dict):
+    def __init__(self, config: dict, storage: Optional[Storage] = None, output_dir: Optional[str] = None):
         """ Init method
         Args:
             config (dict): Dictionary containing configurations
+            storage (Optional[Storage]): storage train data is read from
+            output_dir (Optional[str]): run directory to use instead of a new one, for workers of distributed training
         """
+        self.config = config
         self.run_type = config.get('train_type', 'unk').strip()
         self.train_params = Namespace(**config.get('train_params'))
         self.model_params = Namespace(**config.get('model_params'))
@@ -44,11 +122,9 @@ class Trainer(object):
         self.csv_path = None
         self.bucket = None
         self.tokenizer = Tokenizer(num_words=Trainer.TOP_K)
-
-        # Create a unique directory inside mentioned output directory for each training run. This makes sure that,
-        # models or checkpoints or anything else that gets dumped during training, doesn't get overwritten.
-        self.output_dir = os.path.join(self.train_params.output_dir,
-                                       f"{self.model_params.model}_{datetime.now().strftime('%Y_%m_%d-%H:%M:%S')}")
+        self.tokenizer_details = None
+        self.storage = storage or Storage()
+        self.resume = getattr(self.train_params, 'resume', False)
 
         bucket_name = 'unk'
 
@@ -60,133 +136,709 @@ class Trainer(object):
         if bucket_name != 'unk':
             self.bucket = BucketOps.get_bucket(bucket_name)
 
+        # With 'resume', a run which was interrupted before its model was saved carries on in its own directory
+        self.resumed = False
+        if output_dir is None and self.resume:
+            output_dir = self.find_unfinished_run()
+            self.resumed = output_dir is not None
+
+        # Create a unique directory inside mentioned output directory for each training run. This makes sure that,
+        # models or checkpoints or anything else that gets dumped during training, doesn't get overwritten.
+        self.output_dir = output_dir or os.path.join(
+            self.train_params.output_dir, f"{self.model_params.model}_{datetime.now().strftime('%Y_%m_%d-%H:%M:%S')}")
+        self.instrumentation = Instrumentation(run_name=os.path.basename(self.output_dir))
+
     @staticmethod
     def clean_up():
         """ Deletes temporary directories created while training
         """
         print(f"[Trainer::cleanup] Cleaning up...")
-        SystemOps.run_command('rm *.csv.gz')
         SystemOps.check_and_delete('checkpoints')
         SystemOps.check_and_delete('trained_model')
         SystemOps.check_and_delete('parser_output')
         SystemOps.check_and_delete('train_logs.csv')
         SystemOps.check_and_delete('config.yaml')
+        SystemOps.check_and_delete('sync_manifest.json')
+        SystemOps.check_and_delete(Trainer.REPLICA_DATA_DIR)
+
+    def find_unfinished_run(self) -> Optional[str]:
+        """ Finds the latest run directory of the model in 'output_dir', if it has no trained model yet because the run
+            was interrupted
+        Returns:
+            Path of the run directory, None if the latest run finished or if there is none
+        """
+        prefix = f"{self.model_params.model}_"
+        runs = {}
+        for path in self.create_io_operator().list_files(self.train_params.output_dir):
+            run, _, rest = path.partition('/')
+            if run.startswith(prefix) and rest:
+                runs.setdefault(run, set()).add(rest.split('/')[0])
+        if not runs:
+            return None
+        # Run directories are named after the time they were created at, which sorts chronologically
+        latest = max(runs)
+        if 'trained_model' in runs[latest]:
+            print(f"[Trainer::find_unfinished_run] Latest run {latest} finished, starting a new run")
+            return None
+        print(f"[Trainer::find_unfinished_run] Resuming run {latest}, which has "
+              f"{'a' if TrainingStateCallback.STATE_DIR in runs[latest] else 'no'} training state backup")
+        return os.path.join(self.train_params.output_dir, latest)
+
+    def load_resumed_run(self):
+        """ Loads the tokenizer of the run being resumed, so that texts are converted to the same sequences without
+            fitting it again, and the train logs it copied so far, which CSVLogger then appends to
+        """
+        tokenizer_path = os.path.join(self.output_dir, Trainer.TOKENIZER_PATH)
+        if self.storage.exists(tokenizer_path):
+            print(f"[Trainer::load_resumed_run] Loading tokenizer from {tokenizer_path}")
+            self.tokenizer_details = TokenizerDetails.load(tokenizer_path, storage=self.storage)
 
-    def load_data(self):
-        """ Loads data from train_val.zip file
+        csv_logger = self.train_params.callbacks.get('CSVLogger')
+        if csv_logger is None:
+            return
+        filename = os.path.basename(csv_logger['filename'])
+        logs_path = os.path.join(self.output_dir, filename)
+        if self.storage.exists(logs_path):
+            print(f"[Trainer::load_resumed_run] Appending to train logs of {logs_path}")
+            with open(filename, 'wb') as fstream:
+                fstream.write(self.storage.read_bytes(logs_path))
+            csv_logger['append'] = True
+
+    def initial_epoch(self) -> int:
+        """ Number of epochs the training state backup of the run holds, which model.fit carries on after. It is 0
+            unless 'resume' is set and the run was interrupted after an epoch was backed up
+        """
+        if not self.resume:
+            return 0
+        epochs_path = os.path.join(self.output_dir, TrainingStateCallback.STATE_DIR, TrainingStateCallback.EPOCHS_FILE)
+        if not self.storage.exists(epochs_path):
+            return 0
+        epochs = json.loads(self.storage.read_bytes(epochs_path))['epochs']
+        print(f"[Trainer::initial_epoch] Carrying on after epoch {epochs} of {self.train_params.num_epochs}")
+        return epochs
+
+    def input_files(self) -> List[str]:
+        """ Returns paths of files train data is read from. It is train_val.zip in 'data_dir' if it exists, otherwise
+            train_text.csv.gz and val_text.csv.gz in 'data_dir'
+        """
+        zip_path = os.path.join(self.train_params.data_dir, 'train_val.zip')
+        if self.storage.exists(zip_path):
+            return [zip_path]
+        return [os.path.join(self.train_params.data_dir, name) for name in ['train_text.csv.gz', 'val_text.csv.gz']]
+
+    def load_data(self) -> Tuple[pd.DataFrame, pd.DataFrame]:
+        """ Streams train and validation data from 'data_dir'. Members of train_val.zip are decompressed and parsed
+            as the archive is read, without copying or extracting it to disk first
+        Returns:
+            A tuple containing train and validation dataframes
+        """
+        input_files = self.input_files()
+        print(f"[Trainer::load_data] Streaming data from {input_files}...")
+        with self.instrumentation.stage('csv_parse', unit='reviews') as record:
+            if len(input_files) == 1:
+                with self.storage.open(input_files[0]) as stream, zipfile.ZipFile(stream) as archive:
+                    train_df, val_df = [pd.read_csv(archive.open(name), compression='gzip')
+                                        for name in ['train_text.csv.gz', 'val_text.csv.gz']]
+            else:
+                train_df, val_df = [self.storage.read_csv(path) for path in input_files]
+            record['items'] = len(train_df) + len(val_df)
+        return train_df, val_df
+
+    def iter_data(self, name: str, chunk_size: int) -> Iterator[pd.DataFrame]:
+        """ Streams a gzipped csv file of train data in chunks, from train_val.zip in 'data_dir' if it exists
+        Args:
+            name (str): either 'train_text.csv.gz' or 'val_text.csv.gz'
+            chunk_size (int): number of rows of every chunk
         """
-        print(f"[Trainer::load_data] Copying data from {self.train_params.data_dir} to here...")
-        SystemOps.run_command(f"gsutil -m cp -r "
-                              f"{os.path.join(self.train_params.data_dir, 'train_val.zip')} ./")
-        with zipfile.ZipFile('train_val.zip', 'r') as zip_ref:
-            zip_ref.extractall('./')
-        SystemOps.check_and_delete('train_val.zip')
+        input_files = self.input_files()
+        if len(input_files) > 1:
+            yield from self.storage.iter_csv(os.path.join(self.train_params.data_dir, name), chunk_size=chunk_size)
+            return
+        with self.storage.open(input_files[0]) as stream, zipfile.ZipFile(stream) as archive, \
+                archive.open(name) as member, pd.read_csv(member, compression='gzip', chunksize=chunk_size) as reader:
+            yield from reader
+
+    def stream_preprocess(self, chunk_size: int) -> Tuple:
+        """ Same as preprocess, but reads train data twice in chunks of 'chunk_size' rows instead of loading it
+            whole. The first pass fits the tokenizer chunk by chunk and the second one writes word indices of every
+            chunk straight into arrays allocated for the whole dataset, so that memory used beyond those arrays is
+            bounded by the chunk size. The word index is the same as the one preprocess creates
+        """
+        names = ['train_text.csv.gz', 'val_text.csv.gz']
+        labels = {name: [] for name in names}
+
+        def texts(name: str, keep_labels: bool = False) -> Iterator[List[str]]:
+            for chunk in self.iter_data(name, chunk_size):
+                if keep_labels:
+                    labels[name].append(np.array(chunk['labels'], dtype=np.uint8))
+                yield list(chunk['input'])
+
+        preprocessor = ParallelPreprocessor(workers=getattr(self.train_params, 'preprocess_workers', 1))
+        print(f"[Trainer::stream_preprocess] Fitting tokenizer on chunks of {chunk_size} texts using "
+              f"{preprocessor.workers} worker(s)...")
+        vocabulary = self.create_vocabulary()
+        sizes = {}
+        with self.instrumentation.stage('tokenizer_fit', unit='reviews') as record:
+            for name in names:
+                if vocabulary is None:
+                    sizes[name] = preprocessor.fit_on_chunks(self.tokenizer, texts(name, keep_labels=True),
+                                                             maxlen=Trainer.MAX_SEQUENCE_LENGTH)
+                else:
+                    sizes[name] = preprocessor.sketch_chunks(vocabulary, texts(name, keep_labels=True),
+                                                             maxlen=Trainer.MAX_SEQUENCE_LENGTH)
+            if vocabulary is not None:
+                vocabulary.start_recount()
+                print(f"[Trainer::stream_preprocess] Recounting {len(vocabulary.candidates)} candidate words...")
+                for name in names:
+                    preprocessor.recount_chunks(vocabulary, texts(name))
+            record['items'] = sum(num_texts for num_texts, _ in sizes.values())
+        fast_tokenizer = self.fitted_tokenizer(vocabulary)
+
+        print("[Trainer::stream_preprocess] Converting texts to sequences...")
+        self.tokenizer_details = TokenizerDetails(tokenizer=fast_tokenizer, top_k=Trainer.TOP_K,
+                                                  max_sequence_length=Trainer.MAX_SEQUENCE_LENGTH)
+        sequences = {}
+        with self.instrumentation.stage('sequence_conversion', items=record['items'], unit='reviews'):
+            for name in names:
+                num_texts, num_words = sizes[name]
+                # Words missing from the vocabulary are dropped, so sequences hold at most as many values as counted
+                values = np.empty(num_words, dtype=np.uint16)
+                offsets = np.zeros(num_texts + 1, dtype=np.int64)
+                row = 0
+                for part in preprocessor.iter_ragged(fast_tokenizer, texts(name), maxlen=Trainer.MAX_SEQUENCE_LENGTH,
+                                                     dtype=np.uint16):
+                    start = offsets[row]
+                    values[start: start + len(part.values)] = part.values
+                    offsets[row + 1: row + 1 + len(part)] = start + part.offsets[1:]
+                    row += len(part)
+                if row != num_texts:
+                    raise RuntimeError(f"{name} changed between the two passes over it, it had {num_texts} rows in the "
+                                       f"first one and {row} in the second one")
+                sequences[name] = RaggedSequences(values=values[:offsets[-1]], offsets=offsets)
+        X_train, X_val = sequences['train_text.csv.gz'], sequences['val_text.csv.gz']
+        print(f"[Trainer::stream_preprocess] Sequences take "
+              f"{(X_train.values.nbytes + X_val.values.nbytes) / 1024 ** 2:.0f}MB")
+
+        y_train, y_val = [np.concatenate(labels[name]) if labels[name] else np.empty(0, dtype=np.uint8)
+                          for name in names]
+        return X_train, y_train, X_val, y_val
+
+    def stream_convert(self, chunk_size: int) -> Tuple:
+        """ Same as stream_preprocess, but with the tokenizer in tokenizer_details, so train data is read once, in
+            chunks of 'chunk_size' rows, only to convert texts to sequences
+        """
+        preprocessor = ParallelPreprocessor(workers=getattr(self.train_params, 'preprocess_workers', 1))
+        print(f"[Trainer::stream_convert] Converting chunks of {chunk_size} texts to sequences with the tokenizer of "
+              f"the resumed run, using {preprocessor.workers} worker(s)...")
+        sequences, labels = [], []
+        with self.instrumentation.stage('sequence_conversion', unit='reviews') as record:
+            for name in ['train_text.csv.gz', 'val_text.csv.gz']:
+                name_labels = []
+
+                def texts() -> Iterator[List[str]]:
+                    for chunk in self.iter_data(name, chunk_size):
+                        name_labels.append(np.array(chunk['labels'], dtype=np.uint8))
+                        yield list(chunk['input'])
+
+                # Sizes aren't counted beforehand, so sequences of every chunk are joined at the end
+                parts = list(preprocessor.iter_ragged(self.tokenizer_details.tokenizer, texts(),
+                                                      maxlen=Trainer.MAX_SEQUENCE_LENGTH, dtype=np.uint16))
+                empty = RaggedSequences.from_lengths(np.empty(0, dtype=np.uint16), np.empty(0, dtype=np.int64))
+                sequences.append(RaggedSequences.concatenate(parts) if parts else empty)
+                labels.append(np.concatenate(name_labels) if name_labels else np.empty(0, dtype=np.uint8))
+            record['items'] = sum(len(part) for part in sequences)
+        X_train, X_val = sequences
+        print(f"[Trainer::stream_convert] Sequences take "
+              f"{(X_train.values.nbytes + X_val.values.nbytes) / 1024 ** 2:.0f}MB")
+        return X_train, labels[0], X_val, labels[1]
+
+    def create_vocabulary(self) -> Optional[HeavyHittersVocabulary]:
+        """ Creates a heavy hitters vocabulary if 'vocabulary' in train parameters is 'heavy_hitters', keeping
+            'vocabulary_capacity' candidate words. Returns None for 'exact', the default, in which case the keras
+            tokenizer is fitted instead
+        """
+        vocabulary = getattr(self.train_params, 'vocabulary', 'exact')
+        if vocabulary not in Trainer.VOCABULARIES:
+            raise ValueError(f"'vocabulary' should be one of {Trainer.VOCABULARIES}, not {vocabulary}")
+        if vocabulary == 'exact':
+            return None
+        capacity = getattr(self.train_params, 'vocabulary_capacity', 10 * Trainer.TOP_K)
+        return HeavyHittersVocabulary.from_keras(self.tokenizer, capacity=capacity)
+
+    def fitted_tokenizer(self, vocabulary: Optional[HeavyHittersVocabulary]) -> FastTokenizer:
+        """ Creates the tokenizer sequences are converted with, from the heavy hitters vocabulary if there is one and
+            from the fitted keras tokenizer otherwise
+        """
+        if vocabulary is None:
+            print(f"[Trainer::fitted_tokenizer] Size of word index: {len(self.tokenizer.word_index)}")
+            return FastTokenizer.from_keras(self.tokenizer)
+        print(f"[Trainer::fitted_tokenizer] Counted {len(vocabulary.counts)} candidates out of at least "
+              f"{vocabulary.word_index_size} distinct words, summary was pruned {vocabulary.num_pruned} times")
+        return vocabulary.to_tokenizer()
 
     def preprocess(self) -> Tuple:
-        """ Converts strings to a sequence of integers using keras tokenizer.
+        """ Converts strings to a sequence of integers using keras tokenizer. With 'ingest_chunk_size' in train
+            parameters, train data is streamed in chunks by stream_preprocess instead. The tokenizer is only fitted if
+            there isn't one already, like the one of a resumed run
         """
-        train_df = pd.read_csv('train_text.csv.gz')
-        val_df = pd.read_csv('val_text.csv.gz')
+        chunk_size = getattr(self.train_params, 'ingest_chunk_size', None)
+        if chunk_size and self.tokenizer_details is not None:
+            return self.stream_convert(chunk_size)
+        if chunk_size:
+            return self.stream_preprocess(chunk_size)
+
+        train_df, val_df = self.load_data()
         lines = list(train_df['input']) + list(val_df['input'])
 
-        print("[Trainer::preprocess] Fitting tokenizer on texts...")
-        self.tokenizer.fit_on_texts(lines)
-        print(f"[Trainer::preprocess] Size of word index: {len(self.tokenizer.word_index)}")
+        preprocessor = ParallelPreprocessor(workers=getattr(self.train_params, 'preprocess_workers', 1))
+        if self.tokenizer_details is None:
+            print(f"[Trainer::preprocess] Fitting tokenizer on texts using {preprocessor.workers} worker(s)...")
+            vocabulary = self.create_vocabulary()
+            with self.instrumentation.stage('tokenizer_fit', items=len(lines), unit='reviews'):
+                if vocabulary is None:
+                    preprocessor.fit_on_texts(self.tokenizer, lines)
+                else:
+                    def chunks() -> Iterator[List[str]]:
+                        for start in range(0, len(lines), HeavyHittersVocabulary.CHUNK_SIZE):
+                            yield lines[start: start + HeavyHittersVocabulary.CHUNK_SIZE]
+
+                    preprocessor.sketch_chunks(vocabulary, chunks())
+                    vocabulary.start_recount()
+                    print(f"[Trainer::preprocess] Recounting {len(vocabulary.candidates)} candidate words...")
+                    preprocessor.recount_chunks(vocabulary, chunks())
+            self.tokenizer_details = TokenizerDetails(tokenizer=self.fitted_tokenizer(vocabulary), top_k=Trainer.TOP_K,
+                                                      max_sequence_length=Trainer.MAX_SEQUENCE_LENGTH)
+        else:
+            print("[Trainer::preprocess] Using the tokenizer of the resumed run")
+        fast_tokenizer = self.tokenizer_details.tokenizer
 
         print("[Trainer::preprocess] Converting texts to sequences...")
-        X_train = self.tokenizer.texts_to_sequences(list(train_df['input']))
-        X_val = self.tokenizer.texts_to_sequences(list(val_df['input']))
+        # Sequences are stored unpadded, and TOP_K word indices fit in 16 bits
+        with self.instrumentation.stage('sequence_conversion', items=len(lines), unit='reviews'):
+            X_train = preprocessor.texts_to_ragged(fast_tokenizer, list(train_df['input']),
+                                                   maxlen=Trainer.MAX_SEQUENCE_LENGTH, dtype=np.uint16)
+            X_val = preprocessor.texts_to_ragged(fast_tokenizer, list(val_df['input']),
+                                                 maxlen=Trainer.MAX_SEQUENCE_LENGTH, dtype=np.uint16)
+        print(f"[Trainer::preprocess] Sequences take {(X_train.values.nbytes + X_val.values.nbytes) / 1024 ** 2:.0f}MB")
 
-        print("[Trainer::preprocess] Padding sequences so that they have the same length...")
-        X_train = sequence.pad_sequences(X_train, maxlen=Trainer.MAX_SEQUENCE_LENGTH)
-        X_val = sequence.pad_sequences(X_val, maxlen=Trainer.MAX_SEQUENCE_LENGTH)
+        y_train = np.array(train_df['labels'], dtype=np.uint8)
+        y_val = np.array(val_df['labels'], dtype=np.uint8)
 
-        y_train = np.array(train_df['labels'])
-        y_val = np.array(val_df['labels'])
+        return X_train, y_train, X_val, y_val
 
-        with open(os.path.join('parser_output', 'word_index.txt'), 'w') as fstream:
-            for word, index in self.tokenizer.word_index.items():
-                if index < Trainer.TOP_K:  # only save mappings for TOP_K words
-                    fstream.write("{}:{}\n".format(word, index))
-        print("[Trainer::preprocess] Dumped word index to word_index.txt")
+    def load_or_preprocess(self) -> Tuple:
+        """ Returns preprocessed data from the preprocessing cache if 'cache_dir' is specified in train parameters and
+            the cache contains an entry for the same input files and settings. Otherwise runs preprocessing and adds
+            the result to the cache. In both cases tokenizer and word index are dumped to 'parser_output'.
+        """
+        cache_dir = getattr(self.train_params, 'cache_dir', None)
+        if cache_dir is None:
+            X_train, y_train, X_val, y_val = self.preprocess()
+            self.save_tokenizer()
+            self.save_word_index()
+            return X_train, y_train, X_val, y_val
 
-        return X_train, y_train, X_val, y_val
+        cache = PreprocessCache(cache_dir=cache_dir, max_size_gb=getattr(self.train_params, 'cache_max_size_gb', 50))
+        key = PreprocessCache.make_key(self.input_files(), storage=self.storage, top_k=Trainer.TOP_K,
+                                       max_sequence_length=Trainer.MAX_SEQUENCE_LENGTH,
+                                       tokenizer_version=TokenizerDetails.VERSION, sequence_format='ragged_uint16',
+                                       vocabulary=getattr(self.train_params, 'vocabulary', 'exact'),
+                                       vocabulary_capacity=getattr(self.train_params, 'vocabulary_capacity', None),
+                                       tokenizer={k: v for k, v in self.tokenizer.get_config().items()
+                                                  if k in ['num_words', 'filters', 'lower', 'split', 'char_level',
+                                                           'oov_token']})
+        with self.instrumentation.stage('cache_load'):
+            entry = cache.load(key)
+        if entry is not None:
+            print(f"[Trainer::load_or_preprocess] Loading preprocessed data from cache entry {key}")
+            arrays, tokenizer_path = entry
+            self.tokenizer_details = TokenizerDetails.load(tokenizer_path)
+            self.save_tokenizer()
+        else:
+            X_train, y_train, X_val, y_val = self.preprocess()
+            self.save_tokenizer()
+            print(f"[Trainer::load_or_preprocess] Adding preprocessed data to cache as entry {key}")
+            arrays, _ = cache.store(key, {'X_train_values': X_train.values, 'X_train_offsets': X_train.offsets,
+                                          'y_train': y_train, 'X_val_values': X_val.values,
+                                          'X_val_offsets': X_val.offsets, 'y_val': y_val},
+                                    tokenizer_path=Trainer.TOKENIZER_PATH)
+
+        self.save_word_index()
+        return (RaggedSequences(values=arrays['X_train_values'], offsets=arrays['X_train_offsets']), arrays['y_train'],
+                RaggedSequences(values=arrays['X_val_values'], offsets=arrays['X_val_offsets']), arrays['y_val'])
+
+    def save_word_index(self):
+        """ Dumps mappings of TOP_K words to word_index.txt
+        """
+        with open(os.path.join('parser_output', 'word_index.txt'), 'w') as fstream:
+            # vocabulary of the tokenizer only contains mappings for TOP_K words
+            for word, index in self.tokenizer_details.tokenizer.vocabulary.items():
+                fstream.write("{}:{}\n".format(word, index))
+        print("[Trainer::save_word_index] Dumped word index to word_index.txt")
 
     def save_tokenizer(self):
-        """ Saves tokenizer object as a pickle file.
+        """ Saves tokenizer artifact as a json file.
         """
-        tokenizer_pickle = TokenizerDetails(tokenizer=self.tokenizer, top_k=Trainer.TOP_K,
-                                            max_sequence_length=Trainer.MAX_SEQUENCE_LENGTH)
-        with open('parser_output/tokenizer.pickle', 'wb') as handle:
-            pickle.dump(tokenizer_pickle, handle, protocol=pickle.HIGHEST_PROTOCOL)
+        self.tokenizer_details.save(Trainer.TOKENIZER_PATH)
 
-    def train(self):
-        """ Creates dataset, preprocesses it, builds model, trains is and saves it to the specified destination directory
+    def create_io_operator(self) -> Union[CloudIO, LocalIO]:
+        """ Creates the operator which copies artifacts to 'output_dir'
         """
         if self.bucket is not None:
-            io_operator = CloudIO(bucket=self.bucket)
-            self.load_data()
-        else:
-            io_operator = LocalIO()
+            return CloudIO(bucket=self.bucket)
+        return LocalIO()
+
+    def build_model(self, max_sequence_length: Optional[int]):
+        """ Builds and compiles the model selected in model parameters
+        Args:
+            max_sequence_length (Optional[int]): length of input sequences, None for sequences of any length
+        Returns:
+            Compiled keras model
+        """
+        num_features = self.tokenizer_details.num_features
+        # Predictor pads to a fixed length, so models trained on batches of varying lengths have to ignore padding
+        if max_sequence_length is None and not getattr(self.model_params, 'mask_padding', True):
+            raise ValueError("'bucketing' needs 'mask_padding' of 'model_params' to be True")
+        with self.instrumentation.stage('model_build'):
+            if self.model_params.model == 'CNN':
+                Model = CNNModel(num_features=num_features,
+                                 max_sequence_length=max_sequence_length).build(self.model_params)
+            elif self.model_params.model == 'LSTM':
+                Model = LSTMModel(num_features=num_features,
+                                  max_sequence_length=max_sequence_length).build(self.model_params)
+            elif self.model_params.model == 'Hybrid':
+                Model = HybridModel(num_features=num_features,
+                                    max_sequence_length=max_sequence_length).build(self.model_params)
+            else:
+                raise NotImplementedError(f"{self.model_params.model} model is currently not supported. "
+                                          f"Please choose between CNN, LSTM and Hybrid")
+        Model.summary()
+        print(f"[Trainer::build_model] Built {self.model_params.model} model")
+        return Model
+
+    def save_model(self, Model, io_operator: Union[CloudIO, LocalIO]):
+        """ Saves weights of the trained model and exports it as an inference model, then copies both of them and train
+            logs to 'output_dir'
+        """
+        self.write_model(Model)
+
+        print(f"[Trainer::save_model] Copying trained model to {self.output_dir}")
+        with self.instrumentation.stage('upload_model', items=path_size('trained_model'), unit='bytes'):
+            io_operator.write('trained_model', self.output_dir)
+
+        print(f"[Trainer::save_model] Copying train logs to {self.output_dir}")
+        with self.instrumentation.stage('upload_logs'):
+            io_operator.write('train_logs.csv', self.output_dir, use_system_cmd=False)
+
+    def write_model(self, Model):
+        """ Saves weights of the trained model and exports it as an inference model to 'trained_model' in the working
+            directory
+        """
+        # save model as hdf5 file
+        SystemOps.create_dir('trained_model')
+        SystemOps.create_dir(os.path.join('trained_model', datetime.now().strftime("%Y_%m_%d-%H:%M:%S")))
+        model_path = os.path.join('trained_model', f"{self.model_params.model}_{Trainer.MODEL_NAME}")
+        with self.instrumentation.stage('model_save'):
+            Model.save_weights(model_path)
+
+            # Self-contained artifact which Predictor loads without rebuilding and compiling the model
+            export_path = os.path.join('trained_model',
+                                       f"{self.model_params.model}_{Trainer.INFERENCE_MODEL_NAME}")
+            print(f"[Trainer::write_model] Exporting inference model to {export_path}")
+            InferenceModel.export(Model, export_path, model_type=self.model_params.model,
+                                  max_sequence_length=Trainer.MAX_SEQUENCE_LENGTH,
+                                  tokenizer_fingerprint=self.tokenizer_details.fingerprint)
+
+    def save_instrumentation(self, io_operator: Union[CloudIO, LocalIO]):
+        """ Dumps timings of stages and copies them to 'output_dir'
+        """
+        print(f"[Trainer::save_instrumentation] Copying timings of stages to {self.output_dir}")
+        self.instrumentation.save(Trainer.INSTRUMENTATION_PATH)
+        io_operator.write(Trainer.INSTRUMENTATION_PATH, self.output_dir, use_system_cmd=False)
+
+    def train(self):
+        """ Creates dataset, preprocesses it, builds model, trains is and saves it to the specified destination
+            directory. With 'num_replicas' above 1 in train parameters, training is spread over local worker processes
+            by train_distributed instead. A resumed run reuses its tokenizer and carries on from its last backed up
+            epoch
+        """
+        if self.resumed:
+            self.load_resumed_run()
+        num_replicas = getattr(self.train_params, 'num_replicas', 1)
+        if num_replicas > 1:
+            self.train_distributed(num_replicas)
+            return
+
+        SystemOps.create_dir('parser_output')
+        X_train, y_train, X_val, y_val = self.load_or_preprocess()
+        self.train_on(X_train, y_train, X_val, y_val)
+
+    def train_on(self, X_train: RaggedSequences, y_train: np.ndarray, X_val: RaggedSequences, y_val: np.ndarray,
+                 callbacks: Optional[List] = None):
+        """ Builds model, trains it on preprocessed data and saves it to the specified destination directory, along
+            with the tokenizer dumped to 'parser_output'
+        Args:
+            X_train (RaggedSequences): train sequences
+            y_train (np.ndarray): train labels
+            X_val (RaggedSequences): validation sequences
+            y_val (np.ndarray): validation labels
+            callbacks (Optional[List]): callbacks to be run after the ones configured in train parameters
+        Returns:
+            History of training
+        """
+        io_operator = self.create_io_operator()
         callbacks = CallBacksCreator.get_callbacks(callbacks_config=self.train_params.callbacks,
                                                    model_type=self.model_params.model,
                                                    io_operator=io_operator,
-                                                   out_dir=self.output_dir)
+                                                   out_dir=self.output_dir,
+                                                   instrumentation=self.instrumentation,
+                                                   resume=self.resume) + (callbacks or [])
+
+        print(f"Dumping tokenizer artifact to {self.output_dir}")
+        with self.instrumentation.stage('upload_tokenizer', items=path_size('parser_output'), unit='bytes'):
+            io_operator.write('parser_output', self.output_dir, use_system_cmd=False)
+
+        # With bucketing, batches are padded to different lengths, so models accept sequences of any length
+        bucketing = getattr(self.train_params, 'bucketing', False)
+        max_sequence_length = None if bucketing else Trainer.MAX_SEQUENCE_LENGTH
+        Model = self.build_model(max_sequence_length)
+
+        SystemOps.check_and_delete('checkpoints')
+        SystemOps.create_dir('checkpoints')
+
+        input_pipeline = getattr(self.train_params, 'input_pipeline', 'generator')
+        if input_pipeline not in Trainer.INPUT_PIPELINES:
+            raise ValueError(f"'input_pipeline' should be one of {Trainer.INPUT_PIPELINES}, not {input_pipeline}")
+        # Workers only apply to keras Sequence generators, tf.data runs on its own threads
+        fit_kwargs = {}
+        if input_pipeline == 'tf_data':
+            shuffle_buffer = getattr(self.train_params, 'shuffle_buffer', 100000)
+            print(f"[Trainer::train_on] Creating tf.data train and validation pipelines, shuffling with a buffer of "
+                  f"{shuffle_buffer} reviews...")
+            if bucketing:
+                print("[Trainer::train_on] tf.data pipelines pad every batch to its longest sequence, without grouping "
+                      "sequences of similar lengths")
+            # With 'steps_per_epoch', epochs don't line up with passes over the data, so the pipeline has to repeat
+            train_generator = SequenceDataset(sequences=X_train,
+                                              labels=y_train,
+                                              batch_size=self.train_params.batch_size,
+                                              max_sequence_length=max_sequence_length,
+                                              shuffle_buffer=shuffle_buffer).build(
+                repeat=self.train_params.steps_per_epoch is not None)
+            validation_generator = SequenceDataset(sequences=X_val,
+                                                   labels=y_val,
+                                                   batch_size=self.train_params.batch_size,
+                                                   max_sequence_length=max_sequence_length).build()
+        elif bucketing:
+            num_buckets = getattr(self.train_params, 'num_buckets', 10)
+            print(f"[Trainer::train_on] Batching sequences of similar lengths using {num_buckets} buckets")
+            train_generator = BucketedDataGenerator(sequences=X_train,
+                                                    labels=y_train,
+                                                    batch_size=self.train_params.batch_size,
+                                                    num_buckets=num_buckets)
+            validation_generator = BucketedDataGenerator(sequences=X_val,
+                                                         labels=y_val,
+                                                         batch_size=self.train_params.batch_size,
+                                                         num_buckets=num_buckets,
+                                                         shuffle=False)
+        else:
+            print("[Trainer::train_on] Creating train and validation generators...")
+            train_generator = DataGenerator(sequences=X_train,
+                                            labels=y_train,
+                                            batch_size=self.train_params.batch_size,
+                                            max_sequence_length=Trainer.MAX_SEQUENCE_LENGTH)
+            validation_generator = DataGenerator(sequences=X_val,
+                                                 labels=y_val,
+                                                 batch_size=self.train_params.batch_size,
+                                                 max_sequence_length=Trainer.MAX_SEQUENCE_LENGTH)
+        if input_pipeline == 'generator':
+            fit_kwargs = {'workers': self.train_params.workers,
+                          'use_multiprocessing': self.train_params.use_multiprocessing}
+
+        print("[Trainer::train_on] Started training")
+        with self.instrumentation.stage('training', items=self.train_params.num_epochs, unit='epochs'):
+            history = Model.fit(
+                train_generator,
+                validation_data=validation_generator,
+                epochs=self.train_params.num_epochs,
+                initial_epoch=self.initial_epoch(),
+                callbacks=callbacks,
+                steps_per_epoch=self.train_params.steps_per_epoch,
+                **fit_kwargs
+            )
 
-        print("[Trainer::train] Loaded data")
+        self.save_model(Model, io_operator)
+        self.save_instrumentation(io_operator)
+        return history
+
+    def train_distributed(self, num_replicas: int):
+        """ Preprocesses train data once, then trains the model data parallel in 'num_replicas' local worker
+            processes, which keep replicas of the model in sync through collective ops over localhost. Every worker
+            trains on its own shard of the data, so a step processes 'num_replicas' batches of 'batch_size' reviews.
+            Only the chief, worker 0, writes checkpoints, train logs, the tokenizer and the trained model to
+            'output_dir'. Other workers save checkpoints and the trained model too, since saving a distributed model
+            takes all of them, but in temporary directories which are deleted. See run_replica
+        Args:
+            num_replicas (int): number of worker processes
+        """
         SystemOps.create_dir('parser_output')
-        X_train, y_train, X_val, y_val = self.preprocess()
-
-        self.save_tokenizer()
-        print(f"Dumping tokenizer pickle file to {self.output_dir}")
-        io_operator.write('parser_output', self.output_dir, use_system_cmd=False)
-
-        num_features = min(len(self.tokenizer.word_index) + 1, Trainer.TOP_K)
-        if self.model_params.model == 'CNN':
-            Model = CNNModel(num_features=num_features,
-                             max_sequence_length=Trainer.MAX_SEQUENCE_LENGTH).build(self.model_params)
-        elif self.model_params.model == 'LSTM':
-            Model = LSTMModel(num_features=num_features,
-                              max_sequence_length=Trainer.MAX_SEQUENCE_LENGTH).build(self.model_params)
-        elif self.model_params.model == 'Hybrid':
-            Model = HybridModel(num_features=num_features,
-                                max_sequence_length=Trainer.MAX_SEQUENCE_LENGTH).build(self.model_params)
+        X_train, y_train, X_val, y_val = self.load_or_preprocess()
+
+        # Workers memory map the same files, so the page cache holds a single copy of the data for all of them
+        data_dir = os.path.abspath(Trainer.REPLICA_DATA_DIR)
+        SystemOps.check_and_delete(data_dir)
+        SystemOps.create_dir(data_dir)
+        arrays = {'X_train_values': X_train.values, 'X_train_offsets': X_train.offsets, 'y_train': y_train,
+                  'X_val_values': X_val.values, 'X_val_offsets': X_val.offsets, 'y_val': y_val}
+        # Arrays of the preprocessing cache are read from their cache entry, instead of being copied
+        array_dir = PreprocessCache.entry_of(arrays)
+        if array_dir is None:
+            array_dir = data_dir
+            for name, array in arrays.items():
+                np.save(os.path.join(data_dir, f"{name}.npy"), array)
         else:
-            raise NotImplementedError(f"{self.model_params.model} model is currently not supported. "
-                                      f"Please choose between CNN, LSTM and Hybrid")
-        Model.summary()
-        print(f"[Trainer::train] Built {self.model_params.model} model")
+            print(f"[Trainer::train_distributed] Workers read preprocessed data from cache entry {array_dir}")
+        self.tokenizer_details.save(os.path.join(data_dir, 'tokenizer.json'))
+
+        cluster = LocalCluster(num_workers=num_replicas, base_port=getattr(self.train_params, 'replica_port', None),
+                               threads=getattr(self.train_params, 'replica_threads', None))
+        print(f"[Trainer::train_distributed] Training on {num_replicas} local workers, with a global batch size of "
+              f"{num_replicas * self.train_params.batch_size}")
+        with self.instrumentation.stage('distributed_training'):
+            cluster.run(Trainer.run_replica, self.config, self.output_dir, data_dir, array_dir)
+            # Stages the chief recorded, like epochs and model upload
+            with open(os.path.join(data_dir, Trainer.INSTRUMENTATION_PATH)) as fstream:
+                self.instrumentation.stages.extend(json.load(fstream)['stages'])
+
+        SystemOps.check_and_delete(data_dir)
+        self.save_instrumentation(self.create_io_operator())
+
+    @staticmethod
+    def run_replica(config: dict, output_dir: str, data_dir: str, array_dir: str):
+        """ Entry point of worker processes of distributed training, which LocalCluster has already told about the
+            cluster
+        Args:
+            config (dict): Dictionary containing configurations
+            output_dir (str): run directory of the training run, shared by all workers
+            data_dir (str): local directory the tokenizer was dumped to by train_distributed
+            array_dir (str): local directory holding preprocessed data as .npy files, data_dir or a cache entry
+        """
+        strategy = tf.distribute.MultiWorkerMirroredStrategy()
+        Trainer(config=config, output_dir=output_dir).train_replica(strategy, data_dir, array_dir)
+
+    def train_replica(self, strategy: tf.distribute.MultiWorkerMirroredStrategy, data_dir: str, array_dir: str):
+        """ Trains a replica of the model on the shard of this worker
+        Args:
+            strategy (tf.distribute.MultiWorkerMirroredStrategy): strategy of the cluster
+            data_dir (str): local directory the tokenizer was dumped to by train_distributed
+            array_dir (str): local directory holding preprocessed data as .npy files, data_dir or a cache entry
+        """
+        task_id = strategy.cluster_resolver.task_id
+        # Workers train on CPU, with a single replica each
+        num_workers = strategy.num_replicas_in_sync
+        chief = task_id == 0
+        io_operator = self.create_io_operator()
+        callbacks = CallBacksCreator.get_callbacks(callbacks_config=self.train_params.callbacks,
+                                                   model_type=self.model_params.model,
+                                                   io_operator=io_operator,
+                                                   out_dir=self.output_dir,
+                                                   instrumentation=self.instrumentation,
+                                                   chief=chief,
+                                                   resume=self.resume)
 
+        self.tokenizer_details = TokenizerDetails.load(os.path.join(data_dir, 'tokenizer.json'))
+        if chief:
+            # The chief runs in the directory train_distributed dumped the tokenizer to
+            print(f"Dumping tokenizer artifact to {self.output_dir}")
+            with self.instrumentation.stage('upload_tokenizer', items=path_size('parser_output'), unit='bytes'):
+                io_operator.write('parser_output', self.output_dir, use_system_cmd=False)
+
+            input_pipeline = getattr(self.train_params, 'input_pipeline', 'generator')
+            if input_pipeline != 'tf_data':
+                print(f"[Trainer::train_replica] Workers read their shards through tf.data pipelines, "
+                      f"'input_pipeline: {input_pipeline}' only applies to training in a single process")
+        # Other workers run in a temporary directory of their own, see LocalCluster
         SystemOps.check_and_delete('checkpoints')
         SystemOps.create_dir('checkpoints')
 
-        print("[Trainer::train] Creating train and validation generators...")
-        train_generator = DataGenerator(input_text=X_train,
-                                        labels=y_train,
-                                        batch_size=self.train_params.batch_size)
-        validation_generator = DataGenerator(input_text=X_val,
-                                             labels=y_val,
-                                             batch_size=self.train_params.batch_size)
-
-        print("[Trainer::train] Started training")
-        _ = Model.fit(
-            train_generator,
-            validation_data=validation_generator,
-            epochs=self.train_params.num_epochs,
-            callbacks=callbacks,
-            steps_per_epoch=self.train_params.steps_per_epoch,
-            workers=self.train_params.workers,
-            use_multiprocessing=self.train_params.use_multiprocessing
-        )
+        def shard(name: str) -> Tuple[RaggedSequences, np.ndarray, int]:
+            """ Contiguous shard of this worker, whose size differs from the ones of other shards by at most one
+                review. Returns sequences, labels and total number of reviews of all shards
+            """
+            labels = np.load(os.path.join(array_dir, f"y_{name}.npy"), mmap_mode='r')
+            sequences = RaggedSequences(values=np.load(os.path.join(array_dir, f"X_{name}_values.npy"), mmap_mode='r'),
+                                        offsets=np.load(os.path.join(array_dir, f"X_{name}_offsets.npy"),
+                                                        mmap_mode='r'))
+            start, stop = len(labels) * task_id // num_workers, len(labels) * (task_id + 1) // num_workers
+            return sequences.slice(start, stop), labels[start: stop], len(labels)
 
-        # save model as hdf5 file
-        SystemOps.create_dir('trained_model')
-        SystemOps.create_dir(os.path.join('trained_model', datetime.now().strftime("%Y_%m_%d-%H:%M:%S")))
-        model_path = os.path.join('trained_model', f"{self.model_params.model}_{Trainer.MODEL_NAME}")
-        Model.save_weights(model_path)
+        # Shards are read in place, nothing is sharded again by the strategy
+        options = tf.data.Options()
+        options.experimental_distribute.auto_shard_policy = tf.data.experimental.AutoShardPolicy.OFF
+        bucketing = getattr(self.train_params, 'bucketing', False)
+        max_sequence_length = None if bucketing else Trainer.MAX_SEQUENCE_LENGTH
+        batch_size = self.train_params.batch_size
+        # Looked up at use time, tensorflow.keras.utils.experimental can't be imported as a module with every version
+        DatasetCreator = tf.keras.utils.experimental.DatasetCreator
+
+        def train_dataset() -> Tuple[DatasetCreator, int]:
+            """ Creates the training input of model.fit for the shard, along with the number of steps of a pass over
+                the smallest shard. Every worker has to take the same number of steps, so datasets repeat and epochs
+                are counted in steps
+            """
+            sequences, labels, total = shard('train')
+            shuffle_buffer = getattr(self.train_params, 'shuffle_buffer', 100000)
 
-        print(f"[Trainer::train] Copying trained model to {self.output_dir}")
-        io_operator.write('trained_model', self.output_dir)
+            def dataset_fn(_) -> tf.data.Dataset:
+                return SequenceDataset(sequences=sequences, labels=labels, batch_size=batch_size,
+                                       max_sequence_length=max_sequence_length,
+                                       shuffle_buffer=shuffle_buffer).build(repeat=True).with_options(options)
 
-        print(f"[Trainer::train] Copying train logs to {self.output_dir}")
-        io_operator.write('train_logs.csv', self.output_dir, use_system_cmd=False)
+            return DatasetCreator(dataset_fn), max(-(-(total // num_workers) // batch_size), 1)
+
+        def validation_dataset() -> Tuple[DatasetCreator, int]:
+            """ Creates the validation input of model.fit for the shard, along with its number of steps. Every review
+                is evaluated exactly once: shards are padded to the size of the largest one with zero weight reviews,
+                so all workers take the same number of steps without repeating any review
+            """
+            sequences, labels, total = shard('val')
+            size = -(-total // num_workers)
+            # Keras divides the loss of a batch by its size, padding reviews included. Weighing reviews by the share
+            # of padding in all shards makes val_loss, like weighted metrics, an average over actual reviews only
+            weight = num_workers * size / max(total, 1)
+
+            def dataset_fn(_) -> tf.data.Dataset:
+                return SequenceDataset(sequences=sequences, labels=labels, batch_size=batch_size,
+                                       max_sequence_length=max_sequence_length, size=size,
+                                       weight=weight).build().with_options(options)
+
+            return DatasetCreator(dataset_fn), max(-(-size // batch_size), 1)
+
+        train_data, train_steps = train_dataset()
+        validation_data, validation_steps = validation_dataset()
+        steps_per_epoch = self.train_params.steps_per_epoch or train_steps
+
+        with strategy.scope():
+            Model = self.build_model(max_sequence_length)
+
+        print(f"[Trainer::train_replica] Worker {task_id} of {num_workers} started training, {steps_per_epoch} steps "
+              f"per epoch")
+        with self.instrumentation.stage('training', items=self.train_params.num_epochs, unit='epochs'):
+            _ = Model.fit(
+                train_data,
+                validation_data=validation_data,
+                epochs=self.train_params.num_epochs,
+                initial_epoch=self.initial_epoch(),
+                callbacks=callbacks,
+                steps_per_epoch=steps_per_epoch,
+                validation_steps=validation_steps,
+                verbose='auto' if chief else 0
+            )
+
+        if chief:
+            self.save_model(Model, io_operator)
+            # train_distributed adds them to its own timings
+            self.instrumentation.save(os.path.join(data_dir, Trainer.INSTRUMENTATION_PATH))
+        else:
+            # Saving takes every worker, the model of other workers is left in their temporary directory
+            self.write_model(Model)
@@ -0,0 +1,132 @@
+from collections import Counter
+from typing import Dict, List, Optional
+
+import numpy as np
+from tensorflow.keras.preprocessing.text import Tokenizer, text_to_word_sequence
+
+from detectors.tf_gcp.tokenizer import FastTokenizer
+
+
+class HeavyHittersVocabulary(object):
+    """ Finds the 'num_words' most frequent words of a corpus in bounded memory, as an alternative to fitting a keras
+        Tokenizer, whose counts of every distinct word grow with typos, urls and product codes of the corpus while only
+        the most frequent words end up in the vocabulary.
+
+        The first pass keeps a Misra-Gries summary of at most 'capacity' words: counts of every chunk of texts are
+        added to it, and whenever it grows beyond twice its capacity, the count of its 'capacity' + 1 th most frequent
+        word is subtracted from all counts and words left without a positive count are dropped. Counts are then
+        underestimated by at most (number of words in corpus) / (capacity + 1), so every word more frequent than that
+        survives. The second pass counts the surviving candidates exactly, in order of their first appearance, so the
+        vocabulary comes out the same as the one of a keras Tokenizer whenever its top words are all candidates. """
+
+    # Number of texts counted at once when texts are not already split into chunks
+    CHUNK_SIZE = 100000
+
+    def __init__(self, num_words: int, capacity: int, filters: str = '!"#$%&()*+,-./:;<=>?@[\\]^_`{|}~\t\n',
+                 lower: bool = True, split: str = ' ', oov_token: Optional[str] = None):
+        """ Init method
+        Args:
+            num_words (int): maximum number of words to keep, same as keras Tokenizer
+            capacity (int): number of candidate words kept by the summary, at least 'num_words'
+            filters (str): characters which are filtered out of texts, same as keras Tokenizer
+            lower (bool): whether to convert texts to lower case, same as keras Tokenizer
+            split (str): separator for word splitting, same as keras Tokenizer
+            oov_token (Optional[str]): out of vocabulary token, same as keras Tokenizer
+        """
+        if capacity < num_words:
+            raise ValueError(f"'capacity' should be at least 'num_words' ({num_words}), not {capacity}")
+        self.num_words = num_words
+        self.capacity = capacity
+        self.filters = filters
+        self.lower = lower
+        self.split = split
+        self.oov_token = oov_token
+        self.summary: Optional[Dict[str, int]] = {}
+        self.num_pruned = 0
+        # Largest number of distinct words seen at once, which is exact if the summary was never pruned
+        self.word_index_size = 0
+        self.candidates = None
+        self.counts: Optional[Dict[str, int]] = None
+
+    @classmethod
+    def from_keras(cls, tokenizer: Tokenizer, capacity: int) -> 'HeavyHittersVocabulary':
+        """ Creates a vocabulary builder with the settings of a keras tokenizer
+        Args:
+            tokenizer (Tokenizer): unfitted keras tokenizer
+            capacity (int): number of candidate words kept by the summary
+        """
+        if tokenizer.char_level or tokenizer.analyzer is not None:
+            raise ValueError("Character level tokenizers and tokenizers with custom analyzers are not supported")
+        return cls(num_words=tokenizer.num_words, capacity=capacity, filters=tokenizer.filters, lower=tokenizer.lower,
+                   split=tokenizer.split, oov_token=tokenizer.oov_token)
+
+    def __getstate__(self):
+        """ Leaves out the summary while pickling, worker processes only need candidates to recount them
+        """
+        state = self.__dict__.copy()
+        state.update(summary=None, counts=None)
+        return state
+
+    def update(self, word_counts: Dict[str, int]):
+        """ Adds word counts of a chunk of texts to the summary, pruning it if it grew beyond twice its capacity
+        Args:
+            word_counts (Dict[str, int]): counts of words of the chunk
+        """
+        summary = self.summary
+        for word, count in word_counts.items():
+            summary[word] = summary.get(word, 0) + count
+        self.word_index_size = max(self.word_index_size, len(summary))
+        if len(summary) > 2 * self.capacity:
+            self.prune()
+
+    def prune(self):
+        """ Shrinks the summary to at most 'capacity' words by subtracting the count of its 'capacity' + 1 th most
+            frequent word from all counts
+        """
+        if len(self.summary) <= self.capacity:
+            return
+        counts = np.fromiter(self.summary.values(), dtype=np.int64, count=len(self.summary))
+        threshold = int(np.partition(counts, -(self.capacity + 1))[-(self.capacity + 1)])
+        self.summary = {word: count - threshold for word, count in zip(self.summary, counts.tolist())
+                        if count > threshold}
+        self.num_pruned += 1
+
+    def start_recount(self):
+        """ Ends the first pass, making words left in the summary the candidates which the second pass counts exactly
+        """
+        self.prune()
+        self.candidates = frozenset(self.summary)
+        self.summary = None
+        self.counts = {}
+
+    def count_candidates(self, texts: List[str]) -> Counter:
+        """ Counts occurrences of candidates in texts
+        Args:
+            texts (List[str]): input texts
+        Returns:
+            Counts of candidates found in texts, in order of their first appearance
+        """
+        counts = Counter()
+        for text in texts:
+            counts.update(word for word in text_to_word_sequence(text, filters=self.filters, lower=self.lower,
+                                                                 split=self.split) if word in self.candidates)
+        return counts
+
+    def add_counts(self, counts: Dict[str, int]):
+        """ Adds exact counts of candidates in a chunk of texts. Chunks have to be added in order, so that candidates
+            are kept in order of their first appearance in the corpus
+        """
+        for word, count in counts.items():
+            self.counts[word] = self.counts.get(word, 0) + count
+
+    def to_tokenizer(self) -> FastTokenizer:
+        """ Creates a tokenizer from exact counts of candidates. Words are indexed the way keras Tokenizer indexes
+            them, by decreasing count with ties broken by first appearance
+        """
+        ranked = sorted(self.counts.items(), key=lambda item: item[1], reverse=True)
+        words = [] if self.oov_token is None else [self.oov_token]
+        words.extend(word for word, _ in ranked)
+        vocabulary = {word: index for index, word in enumerate(words[:self.num_words - 1], start=1)}
+        return FastTokenizer(vocabulary=vocabulary, word_index_size=max(self.word_index_size, len(words)),
+                             num_words=self.num_words, filters=self.filters, lower=self.lower, split=self.split,
+                             oov_token=self.oov_token)
@@ -0,0 +1,55 @@
+import argparse
+import os
+
+import tensorflow as tf
+
+from detectors.detector import Predictor
+from detectors.tf_gcp.common import YamlConfig
+from detectors.tf_gcp.models.tflite_model import TFLiteModel
+
+
+def export(config: dict, output_dir: str, quantizations: list, batch_size: int = 64) -> dict:
+    """ Converts the trained checkpoint given by 'model_path' of 'predict_params' into post training quantized TFLite
+        models, one per quantization, exported to '<output_dir>/<model>_tflite_<quantization>'
+    Args:
+        config (dict): configuration in the same format as config/config.yaml
+        output_dir (str): local directory the models are exported to
+        quantizations (list): quantizations among 'none', 'dynamic_range' and 'float16'
+        batch_size (int): number of rows per interpreter call of models with recurrent layers
+    Returns:
+        A dictionary from quantization to path of the exported model
+    """
+    predictor = Predictor(config=config, load_test_data=False)
+    if not isinstance(predictor.model, tf.keras.Model):
+        raise ValueError(f"'model_path' should point to hdf5 weights saved by the trainer or a checkpoint, "
+                         f"{predictor.model_path} is an exported model")
+
+    paths = {}
+    for quantization in quantizations:
+        path = os.path.join(output_dir, f"{predictor.model_params.model}_tflite_{quantization}")
+        TFLiteModel.export(predictor.model, path, model_type=predictor.model_params.model,
+                           max_sequence_length=predictor.tokenizer_details.max_sequence_length,
+                           tokenizer_fingerprint=predictor.tokenizer_details.fingerprint,
+                           quantization=quantization, batch_size=batch_size)
+        paths[quantization] = path
+    return paths
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--config', type=str, required=True,
+                        help="Yaml configuration file path. Checkpoint and tokenizer are taken from 'predict_params'")
+    parser.add_argument('--output-dir', type=str, default='trained_model',
+                        help='Directory the TFLite models are exported to')
+    parser.add_argument('--quantization', type=str, nargs='+', default=['dynamic_range', 'float16'],
+                        choices=TFLiteModel.QUANTIZATIONS, help='Quantizations to export a model for')
+    parser.add_argument('--batch-size', type=int, default=64,
+                        help='Number of rows per interpreter call of LSTM and Hybrid models')
+    args = parser.parse_args()
+
+    config = YamlConfig.load(filepath=args.config)
+    export(config, output_dir=args.output_dir, quantizations=args.quantization, batch_size=args.batch_size)
+
+
+if __name__ == '__main__':
+    main()
@@ -3,6 +3,7 @@ import os
 
 from detectors.tf_gcp.common import YamlConfig
 from detectors.tf_gcp.data_ops.io_ops import CloudIO
+from detectors.tf_gcp.sweep import Sweep
 from detectors.tf_gcp.trainer import Trainer
 
 
@@ -10,12 +11,19 @@ def main():
     parser = argparse.ArgumentParser()
     parser.add_argument('--train-config', type=str, help='config file containing train configurations',
                         required=False)
+    parser.add_argument('--sweep', action='store_true', required=False,
+                        help='A boolean switch to run a hyperparameter sweep over sweep_params instead of training '
+                             'once')
     args = parser.parse_args()
 
     # Copy config file from google cloud storage to current directory and load it.
     CloudIO.copy_from_gcs(args.train_config, './')
     config = YamlConfig.load(filepath=os.path.abspath('config.yaml'))
 
+    if args.sweep:
+        Sweep(config=config).run()
+        return
+
     # Create trainer and start training
     trainer = Trainer(config=config)
     trainer.train()
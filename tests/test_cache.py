@@ -0,0 +1,17 @@
+import numpy as np
+
+from detectors.tf_gcp.data_ops.cache import PreprocessCache
+
+
+def test_entry_of(tmp_path):
+    tokenizer_path = tmp_path / 'tokenizer.json'
+    tokenizer_path.write_text('{}')
+    cache = PreprocessCache(cache_dir=str(tmp_path / 'cache'))
+    arrays, _ = cache.store('key', {'values': np.arange(10, dtype=np.uint16), 'labels': np.ones(4, dtype=np.uint8)},
+                            tokenizer_path=str(tokenizer_path))
+
+    assert PreprocessCache.entry_of(arrays) == str(tmp_path / 'cache' / 'key')
+    # Arrays in memory, renamed or sliced can't be read from the entry
+    assert PreprocessCache.entry_of({**arrays, 'labels': np.ones(4, dtype=np.uint8)}) is None
+    assert PreprocessCache.entry_of({'other': arrays['values'], 'labels': arrays['labels']}) is None
+    assert PreprocessCache.entry_of({**arrays, 'values': arrays['values'][:5]}) is None
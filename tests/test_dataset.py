@@ -0,0 +1,47 @@
+import numpy as np
+import pytest
+
+from detectors.tf_gcp.data_ops.dataset import SequenceDataset
+from detectors.tf_gcp.data_ops.sequences import RaggedSequences
+from detectors.tf_gcp.models.models import CNNModel
+from tests.test_models import NUM_FEATURES, model_params
+
+
+@pytest.fixture(scope='module')
+def data():
+    rng = np.random.default_rng(0)
+    lengths = rng.integers(0, 20, size=10)
+    sequences = RaggedSequences.from_lengths(rng.integers(1, NUM_FEATURES, size=lengths.sum()), lengths)
+    return sequences, rng.integers(0, 2, size=10).astype(np.uint8)
+
+
+def test_padded_dataset(data):
+    sequences, labels = data
+    batches = list(SequenceDataset(sequences=sequences, labels=labels, batch_size=4, max_sequence_length=20,
+                                   size=13, weight=2.0).build().as_numpy_iterator())
+    assert [len(batch_x) for batch_x, _, _ in batches] == [4, 4, 4, 1]
+    batch_x, batch_y, weights = (np.concatenate(arrays) for arrays in zip(*batches))
+    np.testing.assert_array_equal(weights, [2.0] * 10 + [0.0] * 3)
+    np.testing.assert_array_equal(batch_y[:10, 0], labels)
+    assert not batch_x[10:].any()
+
+
+@pytest.mark.parametrize('num_workers', [2, 3, 4])
+def test_padded_shards_evaluate_as_whole(data, num_workers):
+    # Same padding and weights as Trainer.train_replica, with the shards of all workers evaluated one after the other
+    sequences, labels = data
+    model = CNNModel(num_features=NUM_FEATURES, max_sequence_length=None).build(model_params())
+    expected = model.evaluate(SequenceDataset(sequences=sequences, labels=labels, batch_size=3).build(),
+                              verbose=0, return_dict=True)
+
+    size = -(-len(labels) // num_workers)
+    shards = None
+    for task_id in range(num_workers):
+        start, stop = len(labels) * task_id // num_workers, len(labels) * (task_id + 1) // num_workers
+        shard = SequenceDataset(sequences=sequences.slice(start, stop), labels=labels[start: stop], batch_size=3,
+                                size=size, weight=num_workers * size / len(labels)).build()
+        shards = shard if shards is None else shards.concatenate(shard)
+    evaluated = model.evaluate(shards, verbose=0, return_dict=True)
+    assert evaluated.keys() == expected.keys()
+    for name in expected:
+        assert evaluated[name] == pytest.approx(expected[name], rel=1e-5)
@@ -0,0 +1,31 @@
+import numpy as np
+import pytest
+from tensorflow.keras.preprocessing.text import Tokenizer
+
+from detectors.detector import Predictor
+from detectors.tf_gcp.tokenizer import FastTokenizer
+from detectors.tf_gcp.trainer import TokenizerDetails
+from tests.test_models import MODELS, model_params
+
+TEXTS = ['great product works as described', 'broke after a day, waste of money', 'not bad']
+
+
+@pytest.mark.parametrize('mask_padding', [True, False])
+@pytest.mark.parametrize('model_type', MODELS)
+def test_load_model_masks_padding_like_weights(model_type, mask_padding, tmp_path):
+    # Weights trained before padding was masked are loaded into a model which doesn't mask it, whatever the config says
+    tokenizer = Tokenizer(num_words=100, oov_token='<OOV>')
+    tokenizer.fit_on_texts(TEXTS)
+    details = TokenizerDetails(tokenizer=FastTokenizer.from_keras(tokenizer), top_k=100, max_sequence_length=50)
+    details.save(str(tmp_path / 'tokenizer.json'))
+    trained = MODELS[model_type](num_features=details.num_features, max_sequence_length=50).build(
+        model_params(mask_padding=mask_padding))
+    trained.save_weights(str(tmp_path / 'model.hdf5'))
+
+    predictor = Predictor({'predict_params': {'tokenizer_path': str(tmp_path / 'tokenizer.json'),
+                                              'model_path': str(tmp_path / 'model.hdf5')},
+                           'model_params': vars(model_params(mask_padding=not mask_padding))}, load_test_data=False)
+    assert predictor.model_params.mask_padding == mask_padding
+    padded = predictor.tokenizer.texts_to_padded(TEXTS, maxlen=50)
+    np.testing.assert_allclose(predictor.predict_batch(padded)[0], trained(padded, training=False).numpy()[:, 0],
+                               atol=1e-6)
@@ -0,0 +1,40 @@
+import numpy as np
+import pytest
+
+from detectors.tf_gcp.metrics import RunningConfusionMatrix, ThresholdEvaluation
+
+
+@pytest.fixture(scope='module')
+def scores():
+    rng = np.random.default_rng(0)
+    labels = rng.random(2000) < 0.4
+    # Rounded like probabilities of a result csv file, so that many reviews share a probability, 0.5 among them
+    probabilities = np.clip(rng.normal(0.35 + 0.3 * labels, 0.2), 0, 1).round(2).astype(np.float32)
+    return labels, probabilities
+
+
+def test_curve_matches_confusion_matrix(scores):
+    labels, probabilities = scores
+    evaluation = ThresholdEvaluation()
+    for start in range(0, len(labels), 300):
+        evaluation.update(labels[start: start + 300], probabilities[start: start + 300])
+    curve = evaluation.curve()
+    assert 0.5 in curve['threshold']
+    for row, threshold in enumerate(curve['threshold']):
+        confusion_matrix = RunningConfusionMatrix()
+        confusion_matrix.update(y_true=labels, y_pred=probabilities > threshold)
+        assert (curve['tp'][row], curve['fp'][row], curve['tn'][row], curve['fn'][row]) == \
+            (confusion_matrix.tp, confusion_matrix.fp, confusion_matrix.tn, confusion_matrix.fn)
+    # From nothing to everything predicted positive
+    assert curve['tp'][0] + curve['fp'][0] == 0 and curve['tn'][-1] + curve['fn'][-1] == 0
+
+
+def test_aucs(scores):
+    metrics = pytest.importorskip('sklearn.metrics')
+    labels, probabilities = scores
+    evaluation = ThresholdEvaluation()
+    evaluation.update(labels, probabilities)
+    report, _ = evaluation.evaluate()
+    assert report['roc_auc'] == pytest.approx(metrics.roc_auc_score(labels, probabilities))
+    assert report['pr_auc'] == pytest.approx(metrics.average_precision_score(labels, probabilities))
+    assert report['at_threshold']['accuracy'] == pytest.approx(np.mean(labels == (probabilities > 0.5)))
@@ -0,0 +1,65 @@
+from argparse import Namespace
+
+import numpy as np
+import pytest
+from tensorflow.keras.preprocessing.sequence import pad_sequences
+
+from detectors.detector import Predictor
+from detectors.tf_gcp.models.models import CNNModel, HybridModel, LSTMModel
+
+MODELS = {'CNN': CNNModel, 'LSTM': LSTMModel, 'Hybrid': HybridModel}
+NUM_FEATURES = 50
+# Trainer pads bucketed batches to at least 8, Predictor pads to 500
+LENGTHS = [8, 9, 37, 500]
+
+
+def model_params(**kwargs) -> Namespace:
+    return Namespace(**{'optimizer': 'adam', 'loss': 'binary_crossentropy', 'metrics': ['accuracy'],
+                        'embedding_dim': 16, **kwargs})
+
+
+def reviews() -> list:
+    rng = np.random.default_rng(0)
+    return [list(rng.integers(1, NUM_FEATURES, size=length)) for length in (1, 2, 3, 6, 7, 8)]
+
+
+@pytest.mark.parametrize('model_type', MODELS)
+def test_scores_do_not_depend_on_padded_length(model_type):
+    model = MODELS[model_type](num_features=NUM_FEATURES, max_sequence_length=None).build(model_params())
+    scores = [model(pad_sequences(reviews(), maxlen=length), training=False).numpy() for length in LENGTHS]
+    for length, length_scores in zip(LENGTHS[1:], scores[1:]):
+        np.testing.assert_allclose(length_scores, scores[0], atol=1e-6, err_msg=f"padded to {length}")
+
+
+@pytest.mark.parametrize('model_type', MODELS)
+def test_weights_load_in_fixed_length_model(model_type):
+    # Trainer builds models of variable length with bucketing, Predictor rebuilds them with a fixed length
+    bucketed = MODELS[model_type](num_features=NUM_FEATURES, max_sequence_length=None).build(model_params())
+    fixed = MODELS[model_type](num_features=NUM_FEATURES, max_sequence_length=500).build(model_params())
+    fixed.set_weights(bucketed.get_weights())
+    np.testing.assert_allclose(fixed(pad_sequences(reviews(), maxlen=500), training=False).numpy(),
+                               bucketed(pad_sequences(reviews(), maxlen=8), training=False).numpy(), atol=1e-6)
+
+
+@pytest.mark.parametrize('model_type', MODELS)
+def test_empty_review(model_type):
+    model = MODELS[model_type](num_features=NUM_FEATURES, max_sequence_length=500).build(model_params())
+    assert np.all(np.isfinite(model(np.zeros((2, 500)), training=False).numpy()))
+
+
+@pytest.mark.parametrize('model_type', MODELS)
+def test_unmasked_model_shares_weights(model_type):
+    # Models trained before padding was masked are rebuilt with 'mask_padding' set to False
+    masked = MODELS[model_type](num_features=NUM_FEATURES, max_sequence_length=500).build(model_params())
+    unmasked = MODELS[model_type](num_features=NUM_FEATURES, max_sequence_length=500).build(
+        model_params(mask_padding=False))
+    assert [w.shape for w in masked.get_weights()] == [w.shape for w in unmasked.get_weights()]
+
+
+@pytest.mark.parametrize('mask_padding', [True, False])
+@pytest.mark.parametrize('model_type', MODELS)
+def test_model_type_inferred_from_weights(model_type, mask_padding, tmp_path):
+    model = MODELS[model_type](num_features=NUM_FEATURES, max_sequence_length=500).build(
+        model_params(mask_padding=mask_padding))
+    model.save_weights(str(tmp_path / 'model.hdf5'))
+    assert Predictor.infer_model_type(str(tmp_path / 'model.hdf5')) == (model_type, mask_padding)
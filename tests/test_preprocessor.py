@@ -0,0 +1,76 @@
+import os
+
+import numpy as np
+import pandas as pd
+import pytest
+from tensorflow.keras.preprocessing.sequence import pad_sequences
+from tensorflow.keras.preprocessing.text import Tokenizer
+
+from detectors.tf_gcp.data_ops.preprocessor import ParallelPreprocessor
+from detectors.tf_gcp.tokenizer import FastTokenizer
+
+SAMPLE_DATA_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'sample_data')
+MAXLEN = 50
+
+
+@pytest.fixture(scope='module')
+def texts():
+    # An odd number of texts, so that shards and chunks are of unequal sizes, with words of equal counts whose order
+    # depends on where they first appear
+    texts = list(pd.read_csv(os.path.join(SAMPLE_DATA_DIR, 'train_text.csv'))['input'][:997])
+    return texts + ['', 'tie_b tie_a', 'tie_a tie_b', 'TIE_C, tie_c!']
+
+
+@pytest.fixture(scope='module')
+def serial(texts):
+    tokenizer = Tokenizer(num_words=2000, oov_token='<OOV>')
+    tokenizer.fit_on_texts(texts)
+    return tokenizer, pad_sequences(tokenizer.texts_to_sequences(texts), maxlen=MAXLEN)
+
+
+def assert_same_tokenizer(tokenizer: Tokenizer, expected: Tokenizer):
+    assert list(tokenizer.word_index.items()) == list(expected.word_index.items())
+    assert list(tokenizer.word_counts.items()) == list(expected.word_counts.items())
+    assert dict(tokenizer.word_docs) == dict(expected.word_docs)
+    assert dict(tokenizer.index_docs) == dict(expected.index_docs)
+    assert tokenizer.document_count == expected.document_count
+
+
+@pytest.mark.parametrize('workers', [1, 2, 3])
+@pytest.mark.parametrize('shards_per_worker', [1, 3, 7])
+def test_fit_on_texts_and_texts_to_padded(texts, serial, workers, shards_per_worker):
+    expected_tokenizer, expected_padded = serial
+    preprocessor = ParallelPreprocessor(workers=workers, shards_per_worker=shards_per_worker)
+    tokenizer = Tokenizer(num_words=2000, oov_token='<OOV>')
+    preprocessor.fit_on_texts(tokenizer, texts)
+    assert_same_tokenizer(tokenizer, expected_tokenizer)
+
+    fast_tokenizer = FastTokenizer.from_keras(tokenizer)
+    padded = preprocessor.texts_to_padded(fast_tokenizer, texts, maxlen=MAXLEN)
+    np.testing.assert_array_equal(padded, expected_padded)
+
+    ragged = preprocessor.texts_to_ragged(fast_tokenizer, texts, maxlen=MAXLEN)
+    np.testing.assert_array_equal(ragged.pad(np.arange(len(texts)), length=MAXLEN), expected_padded)
+
+
+@pytest.mark.parametrize('workers', [1, 2, 3])
+@pytest.mark.parametrize('chunk_size', [1, 7, 333])
+def test_fit_on_chunks_and_iter_ragged(texts, serial, workers, chunk_size):
+    expected_tokenizer, expected_padded = serial
+    preprocessor = ParallelPreprocessor(workers=workers)
+
+    def chunks():
+        for start in range(0, len(texts), chunk_size):
+            yield texts[start: start + chunk_size]
+
+    tokenizer = Tokenizer(num_words=2000, oov_token='<OOV>')
+    num_texts, num_words = preprocessor.fit_on_chunks(tokenizer, chunks(), maxlen=MAXLEN)
+    assert_same_tokenizer(tokenizer, expected_tokenizer)
+    assert num_texts == len(texts)
+
+    parts = list(preprocessor.iter_ragged(FastTokenizer.from_keras(tokenizer), chunks(), maxlen=MAXLEN))
+    assert [len(part) for part in parts] == [len(chunk) for chunk in chunks()]
+    padded = np.concatenate([part.pad(np.arange(len(part)), length=MAXLEN) for part in parts])
+    np.testing.assert_array_equal(padded, expected_padded)
+    # With an oov token, every word counted ends up in a sequence
+    assert sum(len(part.values) for part in parts) == num_words
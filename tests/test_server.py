@@ -0,0 +1,46 @@
+import numpy as np
+import pytest
+from tensorflow.keras.preprocessing.text import Tokenizer
+
+from detectors.detector import Predictor
+from detectors.server import MicroBatcher
+from detectors.tf_gcp.tokenizer import FastTokenizer
+from detectors.tf_gcp.trainer import TokenizerDetails
+from tests.test_models import MODELS, model_params
+
+TEXTS = ['great product works as described', 'broke after a day, waste of money', 'not bad', '']
+
+
+@pytest.fixture(scope='module')
+def artifacts(tmp_path_factory):
+    tmp_path = tmp_path_factory.mktemp('artifacts')
+    tokenizer = Tokenizer(num_words=100, oov_token='<OOV>')
+    tokenizer.fit_on_texts(TEXTS)
+    details = TokenizerDetails(tokenizer=FastTokenizer.from_keras(tokenizer), top_k=100, max_sequence_length=50)
+    details.save(str(tmp_path / 'tokenizer.json'))
+    models = []
+    for model_type in ('CNN', 'LSTM'):
+        model = MODELS[model_type](num_features=details.num_features, max_sequence_length=50).build(model_params())
+        model.save_weights(str(tmp_path / f"{model_type}.hdf5"))
+        models.append({'model_path': str(tmp_path / f"{model_type}.hdf5")})
+    return str(tmp_path / 'tokenizer.json'), models
+
+
+@pytest.mark.parametrize('ensemble', Predictor.ENSEMBLES)
+def test_micro_batcher_scores_every_model(artifacts, ensemble):
+    tokenizer_path, models = artifacts
+    predictor = Predictor({'predict_params': {'tokenizer_path': tokenizer_path, 'models': models, 'ensemble': ensemble,
+                                              'cache_size': 0},
+                           'model_params': vars(model_params())}, load_test_data=False)
+    batcher = MicroBatcher(predictor=predictor, max_batch_size=3)
+    try:
+        sequences = [[1, 2, 3], []]
+        probabilities, labels = batcher.submit(TEXTS + sequences).result(timeout=60)
+    finally:
+        batcher.stop()
+
+    padded = np.concatenate([predictor.tokenizer.texts_to_padded(TEXTS, maxlen=50), np.zeros((2, 50), dtype=np.int32)])
+    padded[len(TEXTS), -3:] = sequences[0]
+    expected_probabilities, expected_labels = predictor.predict_batch(padded)
+    np.testing.assert_allclose(probabilities, expected_probabilities, atol=1e-6)
+    np.testing.assert_array_equal(labels, expected_labels)
@@ -0,0 +1,94 @@
+import numpy as np
+import pytest
+from tensorflow.keras.preprocessing.sequence import pad_sequences
+from tensorflow.keras.preprocessing.text import Tokenizer
+
+from detectors.tf_gcp.tokenizer import FastTokenizer
+
+TEXTS = [
+    "Great product, works as DESCRIBED!!! Would buy again.",
+    "great... GREAT... great; but the box was damaged :(",
+    "",
+    "   ",
+    "Terrible. Broke after 2 days -- returned it (refund took 3 weeks).",
+    "café crème brûlée naïve façade, ünïcödé wörds and emoji 👍👍",
+    "tabs\tand\nnewlines\rcarriage returns",
+    "a-very-long-hyphenated-word-that-keras-splits-on-every-hyphen and "
+    "averyveryveryveryveryverylongwordwithoutanyseparatorsatall",
+    "MiXeD CaSe WoRdS mixed case words",
+    "repeat " * 40,
+]
+# Words the tokenizer is not fitted on, so that they are out of vocabulary
+UNSEEN = [
+    "Completely unseen vocabulary xylophone zeppelin, great product though",
+    "quokka quokka QUOKKA product!",
+]
+
+
+def fitted(texts, **kwargs):
+    tokenizer = Tokenizer(**kwargs)
+    tokenizer.fit_on_texts(texts)
+    return tokenizer, FastTokenizer.from_keras(tokenizer)
+
+
+@pytest.mark.parametrize('kwargs', [
+    {},
+    {'oov_token': '<OOV>'},
+    {'num_words': 12},
+    {'num_words': 12, 'oov_token': '<OOV>'},
+    {'lower': False},
+    {'lower': False, 'oov_token': '<OOV>'},
+    {'filters': '.,'},
+    {'filters': ''},
+    {'filters': '!"#$%&()*+,-./:;<=>?@[\\]^_`{|}~\t\n', 'split': '-'},
+])
+@pytest.mark.parametrize('maxlen', [1, 5, 500])
+def test_same_sequences_as_keras(kwargs, maxlen):
+    keras_tokenizer, fast_tokenizer = fitted(TEXTS, **kwargs)
+    texts = TEXTS + UNSEEN
+
+    expected = keras_tokenizer.texts_to_sequences(texts)
+    assert fast_tokenizer.texts_to_sequences(texts) == expected
+
+    padded = fast_tokenizer.texts_to_padded(texts, maxlen=maxlen)
+    np.testing.assert_array_equal(padded, pad_sequences(expected, maxlen=maxlen))
+
+    ragged = fast_tokenizer.texts_to_ragged(texts, maxlen=maxlen)
+    assert [list(ragged.values[start: stop]) for start, stop in zip(ragged.offsets[:-1], ragged.offsets[1:])] == \
+        [sequence[-maxlen:] for sequence in expected]
+
+
+def test_out_of_vocabulary_words():
+    keras_tokenizer, fast_tokenizer = fitted(TEXTS, oov_token='<OOV>')
+    oov_index = keras_tokenizer.word_index['<OOV>']
+    sequences = fast_tokenizer.texts_to_sequences(UNSEEN)
+    assert sequences == keras_tokenizer.texts_to_sequences(UNSEEN)
+    assert sequences[1][:3] == [oov_index] * 3
+
+    # Without an oov token, unseen words are dropped
+    keras_tokenizer, fast_tokenizer = fitted(TEXTS)
+    assert fast_tokenizer.texts_to_sequences(UNSEEN) == keras_tokenizer.texts_to_sequences(UNSEEN)
+    assert fast_tokenizer.texts_to_sequences(['quokka xylophone']) == [[]]
+
+
+def test_lowercasing():
+    _, fast_tokenizer = fitted(TEXTS)
+    assert fast_tokenizer.texts_to_sequences(['GREAT Product']) == fast_tokenizer.texts_to_sequences(['great product'])
+
+    keras_tokenizer, fast_tokenizer = fitted(TEXTS, lower=False)
+    assert fast_tokenizer.texts_to_sequences(['MiXeD mixed']) == keras_tokenizer.texts_to_sequences(['MiXeD mixed'])
+    assert 'MiXeD' in fast_tokenizer.vocabulary and 'mixed' in fast_tokenizer.vocabulary
+
+
+def test_filters():
+    keras_tokenizer, fast_tokenizer = fitted(TEXTS, filters='.,')
+    texts = ['works as described!!! (refund) great.', 'great,,,product...']
+    assert fast_tokenizer.texts_to_sequences(texts) == keras_tokenizer.texts_to_sequences(texts)
+    assert 'described!!!' in fast_tokenizer.vocabulary
+
+
+def test_config_round_trip():
+    keras_tokenizer, fast_tokenizer = fitted(TEXTS, num_words=12, oov_token='<OOV>')
+    restored = FastTokenizer.from_config(fast_tokenizer.get_config())
+    np.testing.assert_array_equal(restored.texts_to_padded(TEXTS + UNSEEN, maxlen=20),
+                                  pad_sequences(keras_tokenizer.texts_to_sequences(TEXTS + UNSEEN), maxlen=20))
@@ -0,0 +1,102 @@
+import copy
+import os
+
+import numpy as np
+import pandas as pd
+import pytest
+import tensorflow as tf
+from tensorflow.keras.preprocessing.text import Tokenizer
+
+from detectors.tf_gcp.callbacks import CallBacksCreator, GCSCallback, TrainingStateCallback
+from detectors.tf_gcp.data_ops.sequences import RaggedSequences
+from detectors.tf_gcp.tokenizer import FastTokenizer
+from detectors.tf_gcp.trainer import TokenizerDetails, Trainer
+from tests.test_models import NUM_FEATURES
+
+NUM_EPOCHS = 4
+INTERRUPTED_AFTER = 2
+
+
+class Preempted(Exception):
+    pass
+
+
+class PreemptCallback(tf.keras.callbacks.Callback):
+    """ Interrupts training like a preemption would, once every other callback is done with an epoch """
+
+    def on_epoch_end(self, epoch, logs=None):
+        if epoch + 1 == INTERRUPTED_AFTER:
+            raise Preempted()
+
+
+def config(output_dir: str) -> dict:
+    return {'train_params': {'batch_size': 8, 'num_epochs': NUM_EPOCHS, 'steps_per_epoch': 2, 'data_dir': output_dir,
+                             'output_dir': output_dir, 'use_multiprocessing': False, 'workers': 1, 'resume': True,
+                             'callbacks': {'ModelCheckpoint': {'filepath': 'model.{epoch:02d}.hdf5',
+                                                               'monitor': 'val_accuracy', 'save_weights_only': True},
+                                           'CSVLogger': {'filename': 'train_logs.csv'},
+                                           'GCSCallback': {'keep_best': 2, 'monitor': 'val_accuracy',
+                                                           'mode': 'max'}}},
+            'model_params': {'model': 'CNN', 'optimizer': 'adam', 'loss': 'binary_crossentropy',
+                             'metrics': ['accuracy'], 'embedding_dim': 16}}
+
+
+def data(size: int):
+    rng = np.random.default_rng(size)
+    lengths = rng.integers(1, 20, size=size)
+    sequences = RaggedSequences.from_lengths(rng.integers(1, NUM_FEATURES, size=lengths.sum()).astype(np.uint16),
+                                             lengths)
+    return sequences, rng.integers(0, 2, size=size).astype(np.uint8)
+
+
+def train(trainer: Trainer, callbacks: list):
+    tokenizer = Tokenizer(num_words=NUM_FEATURES, oov_token='<OOV>')
+    tokenizer.fit_on_texts([' '.join(f"word{index}" for index in range(NUM_FEATURES))])
+    trainer.tokenizer_details = TokenizerDetails(tokenizer=FastTokenizer.from_keras(tokenizer), top_k=NUM_FEATURES,
+                                                 max_sequence_length=Trainer.MAX_SEQUENCE_LENGTH)
+    os.makedirs('parser_output', exist_ok=True)
+    trainer.tokenizer_details.save(Trainer.TOKENIZER_PATH)
+    return trainer.train_on(*data(64), *data(16), callbacks=callbacks)
+
+
+@pytest.mark.parametrize('manifest', [True, False])
+def test_resume_after_preemption(tmp_path, monkeypatch, manifest):
+    monkeypatch.chdir(tmp_path)
+    output_dir = str(tmp_path / 'output')
+    gcs_callbacks = []
+
+    def get_callbacks(**kwargs):
+        callbacks = get_callbacks.original(**kwargs)
+        gcs_callbacks.extend(callback for callback in callbacks if isinstance(callback, GCSCallback))
+        return callbacks
+
+    get_callbacks.original = CallBacksCreator.get_callbacks
+    monkeypatch.setattr(CallBacksCreator, 'get_callbacks', get_callbacks)
+
+    interrupted = Trainer(copy.deepcopy(config(output_dir)))
+    with pytest.raises(Preempted):
+        train(interrupted, callbacks=[PreemptCallback()])
+    # Uploads queued before the preemption are done, the process would have been killed after them
+    gcs_callbacks[0].uploads.put(None)
+    gcs_callbacks[0].worker.join()
+    cp_path = os.path.join(interrupted.output_dir, 'checkpoints')
+    if not manifest:
+        # Interrupted before the manifest listing the latest checkpoints was uploaded
+        os.remove(os.path.join(cp_path, GCSCallback.MANIFEST_FILE))
+
+    resumed = Trainer(copy.deepcopy(config(output_dir)))
+    assert resumed.resumed and resumed.output_dir == interrupted.output_dir
+    assert resumed.initial_epoch() == INTERRUPTED_AFTER
+    resumed.load_resumed_run()
+    history = train(resumed, callbacks=[])
+
+    assert history.epoch == list(range(INTERRUPTED_AFTER, NUM_EPOCHS))
+    logs = pd.read_csv(os.path.join(output_dir, os.path.basename(resumed.output_dir), 'train_logs.csv'))
+    assert logs['epoch'].tolist() == list(range(NUM_EPOCHS))
+    checkpoints = sorted(name for name in os.listdir(cp_path) if name != GCSCallback.MANIFEST_FILE)
+    assert len(checkpoints) == 2
+    if not manifest:
+        # Checkpoints of the interrupted run have no score, so they are deleted first
+        assert checkpoints == [f"CNN_model.{epoch:02d}.hdf5" for epoch in range(INTERRUPTED_AFTER + 1, NUM_EPOCHS + 1)]
+    assert gcs_callbacks[-1].synced
+    assert not os.path.exists(os.path.join(resumed.output_dir, TrainingStateCallback.STATE_DIR))